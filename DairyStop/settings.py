@@ -43,14 +43,27 @@ INSTALLED_APPS = [
 
 REST_FRAMEWORK = {
     'DEFAULT_AUTHENTICATION_CLASSES': (
-        'rest_framework.authentication.TokenAuthentication',
+        'MrMilk.authentication.CachedTokenAuthentication',
     ),
     'DEFAULT_PERMISSION_CLASSES': {
         'rest_framework.permission.IsAuthenticated',
-    }
+    },
+    # login and sign up attempts, see MrMilk.throttling
+    'DEFAULT_THROTTLE_RATES': {
+        'login_ip': '30/min',
+        'login_phone': '5/min',
+        'signup_ip': '10/hour',
+        'signup_phone': '3/hour',
+    },
+    # no proxy in front: throttles key on REMOTE_ADDR and ignore the X-Forwarded-For a client can make up.
+    # Behind a reverse proxy, set this to the number of proxies so the address the proxy saw is used.
+    'NUM_PROXIES': int(os.environ.get('NUM_PROXIES', 0)),
 }
 
 MIDDLEWARE = [
+    'MrMilk.metrics.MetricsMiddleware',
+    'MrMilk.instrumentation.SQLInstrumentationMiddleware',
+    'MrMilk.routers.ReplicaStickinessMiddleware',
     'django.middleware.security.SecurityMiddleware',
     'django.contrib.sessions.middleware.SessionMiddleware',
     'django.middleware.common.CommonMiddleware',
@@ -83,12 +96,86 @@ WSGI_APPLICATION = 'DairyStop.wsgi.application'
 # Database
 # https://docs.djangoproject.com/en/3.0/ref/settings/#databases
 
+# MrMilk.sqlite tunes every connection for concurrent writers: WAL lets readers go on while an order is
+# written, synchronous NORMAL only syncs at checkpoints in WAL mode, cache_size is in KiB when negative.
+# Transactions wait up to timeout seconds for the write lock, MrMilk.sqlite.retry.retry_on_lock retries
+# order placement and subscription chunks SQLITE_LOCK_RETRIES times after that.
+# Connections are kept for CONN_MAX_AGE seconds instead of being opened on every request.
 DATABASES = {
     'default': {
-        'ENGINE': 'django.db.backends.sqlite3',
+        'ENGINE': 'MrMilk.sqlite',
         'NAME': os.path.join(BASE_DIR, 'db.sqlite3'),
+        'CONN_MAX_AGE': 60,
+        'OPTIONS': {
+            'timeout': 5,
+            'pragmas': {
+                'journal_mode': 'WAL',
+                'synchronous': 'NORMAL',
+                'cache_size': -64000,
+                'mmap_size': 256 * 1024 * 1024,
+                'temp_store': 'MEMORY',
+            },
+        },
+        # a file, not SQLite's default in-memory test database, so tests can place orders from several threads
+        'TEST': {'NAME': os.path.join(BASE_DIR, 'test-db.sqlite3')},
     }
 }
+# Catalog and order history reads go to the replica (MrMilk.routers), a copy of db.sqlite3 that the
+# replicate_database command refreshes every REPLICA_SYNC_INTERVAL seconds. It is only ever read from,
+# and not at all once its last copy is more than REPLICA_MAX_LAG seconds old.
+DATABASES['replica'] = {
+    'ENGINE': 'MrMilk.sqlite',
+    'NAME': os.path.join(BASE_DIR, 'db-replica.sqlite3'),
+    'CONN_MAX_AGE': 60,
+    'OPTIONS': {
+        'timeout': 5,
+        # BEGIN IMMEDIATE is a write to SQLite, query_only refuses it
+        'transaction_mode': 'DEFERRED',
+        'pragmas': {
+            'query_only': 'ON',
+            'cache_size': -64000,
+            'mmap_size': 256 * 1024 * 1024,
+        },
+    },
+    'TEST': {'MIRROR': 'default'},
+}
+DATABASE_ROUTERS = ['MrMilk.routers.PrimaryReplicaRouter']
+REPLICA_SYNC_INTERVAL = 5
+REPLICA_MAX_LAG = 2 * REPLICA_SYNC_INTERVAL
+
+SQLITE_LOCK_RETRIES = 5
+SQLITE_LOCK_BACKOFF = 0.05
+
+# Cache
+# https://docs.djangoproject.com/en/3.0/topics/cache/
+# catalog responses are cached for CATALOG_CACHE_TIMEOUT seconds, MrMilk.signals moves the catalog version on
+# every change. The backends have to be shared by all gunicorn workers, the signal only fires in the worker
+# that saved the change. 'state' holds the catalog version, the token revocation generation and the counters,
+# a few keys that must never be culled, so its MAX_ENTRIES is far above what it holds.
+
+CACHES = {
+    'default': {
+        'BACKEND': 'django.core.cache.backends.filebased.FileBasedCache',
+        'LOCATION': os.path.join(BASE_DIR, 'cache'),
+        'OPTIONS': {
+            'MAX_ENTRIES': 5000,
+        },
+    },
+    'state': {
+        'BACKEND': 'django.core.cache.backends.filebased.FileBasedCache',
+        'LOCATION': os.path.join(BASE_DIR, 'cache', 'state'),
+        # incr() sets its key again with this timeout, a counter must not start over every five minutes
+        'TIMEOUT': None,
+        'OPTIONS': {
+            'MAX_ENTRIES': 1000000,
+        },
+    },
+}
+CATALOG_CACHE_TIMEOUT = 24 * 60 * 60
+
+# token -> user cache of MrMilk.authentication.CachedTokenAuthentication, per worker process
+TOKEN_CACHE_SIZE = 1024
+TOKEN_CACHE_TTL = 60
 
 # Password validation
 # https://docs.djangoproject.com/en/3.0/ref/settings/#auth-password-validators
@@ -133,3 +220,39 @@ AUTH_USER_MODEL = 'MrMilk.Profile'
 
 MEDIA_URL = '/media/'
 MEDIA_ROOT = os.path.join(BASE_DIR, "media")
+
+# How MrMilk.media hands media files out: None sends them from the worker with sendfile(),
+# 'x-accel-redirect' lets nginx send them from an internal location mapped on MEDIA_ACCEL_REDIRECT_PREFIX,
+# 'x-sendfile' lets apache or lighttpd send them.
+MEDIA_SENDFILE = None
+MEDIA_ACCEL_REDIRECT_PREFIX = '/protected-media/'
+# browser cache lifetime of originals, content-hashed variants are cached for a year
+MEDIA_CACHE_MAX_AGE = 24 * 60 * 60
+
+# Cursor pagination for the catalog and profile listings, clients may ask for up to CATALOG_MAX_PAGE_SIZE rows
+CATALOG_PAGE_SIZE = 20
+CATALOG_MAX_PAGE_SIZE = 100
+ORDER_HISTORY_PAGE_SIZE = 10
+
+# Per request SQL numbers of MrMilk.instrumentation: response headers while developing, log lines of the
+# MrMilk.sql logger in production, which warn when one statement runs SQL_REPEAT_THRESHOLD times in a request
+SQL_INSTRUMENTATION_HEADERS = DEBUG
+SQL_REPEAT_THRESHOLD = 5
+
+# Prometheus metrics of MrMilk.metrics, every worker process writes its numbers to a file of its own in
+# METRICS_DIR at most every METRICS_FLUSH_INTERVAL seconds and /metrics adds them up
+METRICS_DIR = os.environ.get('METRICS_DIR', os.path.join(BASE_DIR, 'metrics'))
+METRICS_FLUSH_INTERVAL = 1.0
+# addresses /metrics answers, the Prometheus server's, comma separated in the environment
+METRICS_ALLOWED_IPS = os.environ.get('METRICS_ALLOWED_IPS', '127.0.0.1,::1').split(',')
+
+LOGGING = {
+    'version': 1,
+    'disable_existing_loggers': False,
+    'handlers': {
+        'console': {'class': 'logging.StreamHandler'},
+    },
+    'loggers': {
+        'MrMilk.sql': {'handlers': ['console'], 'level': 'INFO', 'propagate': False},
+    },
+}
@@ -13,14 +13,20 @@ Including another URLconf
     1. Import the include() function: from django.urls import include, path
     2. Add a URL to urlpatterns:  path('blog/', include('blog.urls'))
 """
+import re
+
 from django.contrib import admin
-from django.urls import path, include
+from django.urls import path, include, re_path
 from django.conf import settings
-from django.conf.urls.static import static
-from rest_framework.authtoken.views import obtain_auth_token
+
+from MrMilk.media import serve_media
+from MrMilk.metrics import metrics_view
+from MrMilk.views import ThrottledObtainAuthToken
 
 urlpatterns = [
-                  path('admin/', admin.site.urls),
-                  path('mr_milk/', include('MrMilk.urls'), name='mr_milk'),
-                  path('auth/', obtain_auth_token)
-              ] + static(settings.MEDIA_URL, document_root=settings.MEDIA_ROOT)
+    path('admin/', admin.site.urls),
+    path('mr_milk/', include('MrMilk.urls'), name='mr_milk'),
+    path('auth/', ThrottledObtainAuthToken.as_view()),
+    path('metrics', metrics_view, name='metrics'),
+    re_path(r'^{}(?P<path>.*)$'.format(re.escape(settings.MEDIA_URL.lstrip('/'))), serve_media, name='media'),
+]
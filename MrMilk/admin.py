@@ -1,5 +1,5 @@
 from django.contrib import admin
-from .models import Product, SubCategory, Category, Brand, Subscription, Order, Profile, OrderDetail
+from .models import Product, SubCategory, Category, Brand, Subscription, Order, Profile, OrderDetail, DailySales
 
 # Register your models here.
 
@@ -11,3 +11,4 @@ admin.site.register(Subscription)
 admin.site.register(Order)
 admin.site.register(Profile)
 admin.site.register(OrderDetail)
+admin.site.register(DailySales)
@@ -3,3 +3,6 @@ from django.apps import AppConfig
 
 class MrmilkConfig(AppConfig):
     name = 'MrMilk'
+
+    def ready(self):
+        from . import signals  # noqa: F401
@@ -0,0 +1,64 @@
+"""
+Async read path for the catalog under ASGI.
+The ORM can not be awaited yet, so each view hands the query and serialization to a worker thread with
+sync_to_async(thread_sensitive=False) and the event loop keeps accepting connections meanwhile, instead of
+one blocked worker per request. Responses share the catalog cache and ETags with the DRF endpoints.
+"""
+
+from asgiref.sync import sync_to_async
+from django.http import JsonResponse, HttpResponseNotAllowed, HttpResponseNotModified
+from rest_framework import status
+from rest_framework.request import Request
+
+from .cache import cached_catalog_data
+from .conditional import catalog_etag, etag_matches
+from .models import Product, Category, Brand
+from .pagination import CatalogCursorPagination
+from .serializers import ProductSerializer, CategorySerializer, BrandSerializer
+
+
+def catalog_data(request, build):
+    """(etag, data) of a catalog read, data is None when the client already has this version"""
+    # the same ETag and cache entries as the DRF views get from conditional_response and cached_catalog_response
+    etag = catalog_etag(None, request)
+    if etag_matches(request, etag):
+        return etag, None
+    data, _ = cached_catalog_data(request.build_absolute_uri(), lambda: (build(request), status.HTTP_200_OK))
+    return etag, data
+
+
+def paginated(queryset, serializer_class):
+    def build(request):
+        drf_request = Request(request)
+        paginator = CatalogCursorPagination()
+        page = paginator.paginate_queryset(queryset, drf_request)
+        data = serializer_class(page, many=True, context={'request': drf_request}).data
+        return {'next': paginator.get_next_link(), 'previous': paginator.get_previous_link(), 'results': data}
+
+    return build
+
+
+async def catalog_response(request, build):
+    # django.views.decorators.http wraps views in sync functions, the method is checked here instead
+    if request.method not in ('GET', 'HEAD'):
+        return HttpResponseNotAllowed(['GET', 'HEAD'])
+    etag, data = await sync_to_async(catalog_data, thread_sensitive=False)(request, build)
+    if data is None:
+        response = HttpResponseNotModified()
+    else:
+        response = JsonResponse(data, safe=False)
+    response['ETag'] = etag
+    return response
+
+
+async def product_list(request):
+    return await catalog_response(request, paginated(Product.objects.all(), ProductSerializer))
+
+
+async def category_list(request):
+    return await catalog_response(request, paginated(Category.objects.all(), CategorySerializer))
+
+
+async def brand_list(request):
+    # products are fetched for the whole page in one extra query, as in BrandViewSet
+    return await catalog_response(request, paginated(Brand.objects.prefetch_related('products'), BrandSerializer))
@@ -0,0 +1,87 @@
+"""
+Token authentication with an in-process cache of token -> user.
+A cached token skips the authtoken_token/Profile join that TokenAuthentication runs on every request.
+Entries live for TOKEN_CACHE_TTL seconds and at most TOKEN_CACHE_SIZE tokens are kept, least recently
+used first out. Deleting a token or changing a Profile bumps the revocation generation in the shared state
+cache once it commits (see MrMilk.signals). Entries remember the generation they were cached under and a hit
+under an older one authenticates again, so every worker refuses a deleted token or a deactivated user on its
+next request. A hit costs one state cache read, still cheaper than the join.
+"""
+
+import threading
+import time
+from collections import OrderedDict
+
+from django.conf import settings
+from rest_framework.authentication import TokenAuthentication
+
+from .cache import incr_counter, state_cache
+
+TOKEN_GENERATION_KEY = 'mr_milk:auth:generation'
+
+
+def token_generation():
+    return state_cache.get(TOKEN_GENERATION_KEY, 0)
+
+
+def revoke_cached_tokens():
+    """make every worker authenticate its cached tokens again"""
+    incr_counter(TOKEN_GENERATION_KEY)
+
+
+class TokenCache:
+
+    def __init__(self, size, ttl):
+        self.size = size
+        self.ttl = ttl
+        self.entries = OrderedDict()
+        self.lock = threading.Lock()
+
+    def get(self, key, generation=0):
+        with self.lock:
+            entry = self.entries.get(key)
+            if entry is None:
+                return None
+            expires, credentials, cached_generation = entry
+            if expires < time.monotonic() or cached_generation != generation:
+                del self.entries[key]
+                return None
+            self.entries.move_to_end(key)
+            return credentials
+
+    def put(self, key, credentials, generation=0):
+        with self.lock:
+            self.entries[key] = (time.monotonic() + self.ttl, credentials, generation)
+            self.entries.move_to_end(key)
+            while len(self.entries) > self.size:
+                self.entries.popitem(last=False)
+
+    def evict(self, key):
+        with self.lock:
+            self.entries.pop(key, None)
+
+    def evict_user(self, user_id):
+        with self.lock:
+            for key in [key for key, (_, (user, _), _) in self.entries.items() if user.pk == user_id]:
+                del self.entries[key]
+
+    def clear(self):
+        with self.lock:
+            self.entries.clear()
+
+
+token_cache = TokenCache(size=getattr(settings, 'TOKEN_CACHE_SIZE', 1024),
+                         ttl=getattr(settings, 'TOKEN_CACHE_TTL', 60))
+
+
+class CachedTokenAuthentication(TokenAuthentication):
+
+    def authenticate_credentials(self, key):
+        # read before the rows: a revocation committed after them moves the generation past this one
+        generation = token_generation()
+        credentials = token_cache.get(key, generation)
+        if credentials is None:
+            # unknown and inactive tokens raise here and are never cached
+            credentials = super().authenticate_credentials(key)
+            token_cache.put(key, credentials, generation)
+        return credentials
@@ -0,0 +1,90 @@
+"""
+Response cache for the catalog endpoints.
+Entries are keyed on a catalog version counter that is bumped whenever staff change a product,
+category, sub category or brand (see MrMilk.signals) and whenever orders or subscriptions move stock
+(see MrMilk.inventory), so a stale entry is simply never read again,
+and expire after CATALOG_CACHE_TIMEOUT so the entries of old versions do not pile up.
+The version and the counters live in the 'state' cache, which holds a handful of keys and never culls:
+a version culled from the response cache would start over and serve entries of an old catalog.
+A version that is missing anyway starts at the current time in milliseconds, above any version before it.
+"""
+
+import time
+from functools import wraps
+
+from django.conf import settings
+from django.core.cache import cache, caches
+from rest_framework import status
+from rest_framework.response import Response
+
+state_cache = caches['state']
+CATALOG_CACHE_TIMEOUT = getattr(settings, 'CATALOG_CACHE_TIMEOUT', 24 * 60 * 60)
+
+CATALOG_VERSION_KEY = 'mr_milk:catalog:version'
+CATALOG_HITS_KEY = 'mr_milk:catalog:hits'
+CATALOG_MISSES_KEY = 'mr_milk:catalog:misses'
+
+
+def incr_counter(key, initial=0):
+    try:
+        return state_cache.incr(key)
+    except ValueError:
+        # the counter is not in the cache yet, add() keeps another worker's value if it won the race
+        state_cache.add(key, initial, timeout=None)
+        return state_cache.incr(key)
+
+
+def catalog_version():
+    version = state_cache.get(CATALOG_VERSION_KEY)
+    if version is None:
+        state_cache.add(CATALOG_VERSION_KEY, int(time.time() * 1000), timeout=None)
+        version = state_cache.get(CATALOG_VERSION_KEY)
+    return version
+
+
+def bump_catalog_version():
+    return incr_counter(CATALOG_VERSION_KEY, initial=int(time.time() * 1000))
+
+
+def catalog_cache_stats():
+    hits = state_cache.get(CATALOG_HITS_KEY, 0)
+    misses = state_cache.get(CATALOG_MISSES_KEY, 0)
+    lookups = hits + misses
+    return {'version': catalog_version(), 'hits': hits, 'misses': misses,
+            'hit_ratio': round(hits / lookups, 4) if lookups else 0.0}
+
+
+def cached_catalog_data(url, build):
+    """
+    (data, status) of the catalog read of url: the data cached for the current catalog version, or what
+    build() returns as (data, status) on a miss, only 200 data is cached.
+    Shared by the DRF views and MrMilk.async_views so both read and fill the cache the same way.
+    """
+    key = 'mr_milk:catalog:{}:{}'.format(catalog_version(), url)
+    data = cache.get(key)
+    if data is not None:
+        incr_counter(CATALOG_HITS_KEY)
+        return data, status.HTTP_200_OK
+    incr_counter(CATALOG_MISSES_KEY)
+    data, status_code = build()
+    if status_code == status.HTTP_200_OK:
+        cache.set(key, data, timeout=CATALOG_CACHE_TIMEOUT)
+    return data, status_code
+
+
+def cached_catalog_response(view_method):
+    """cache the data of successful GET responses of a catalog view method for the current catalog version"""
+
+    @wraps(view_method)
+    def wrapper(view, request, *args, **kwargs):
+        if request.method != 'GET':
+            return view_method(view, request, *args, **kwargs)
+
+        def build():
+            response = view_method(view, request, *args, **kwargs)
+            return response.data, response.status_code
+
+        data, status_code = cached_catalog_data(request.build_absolute_uri(), build)
+        return Response(data, status=status_code)
+
+    return wrapper
@@ -0,0 +1,87 @@
+"""Read helpers for the catalog that keep the number of queries constant however big the catalog gets"""
+
+from collections import Counter
+from decimal import Decimal
+
+from django.conf import settings
+from django.core.cache import cache
+from django.db.models import Case, CharField, Count, Q, Value, When
+
+from .cache import catalog_version, CATALOG_CACHE_TIMEOUT
+from .models import Brand, Product
+from .serializers import ProductSerializer
+
+# upper bounds of the price facet buckets, the last bucket is open ended
+PRICE_BUCKETS = getattr(settings, 'CATALOG_PRICE_BUCKETS', (25, 50, 100, 250, 500))
+FACETS = ('category', 'sub_category', 'brand', 'price')
+
+
+def brand_catalog_snapshot():
+    """
+    brand_name -> list of serialized products for the whole catalog.
+    Built from one query on brands and one on products, brands without products map to an empty list.
+    """
+    snapshot = {brand_name: [] for brand_name in Brand.objects.order_by('pk').values_list('pk', flat=True)}
+    products = Product.objects.order_by('brand_id', 'pk')
+    for product in ProductSerializer(products, many=True).data:
+        snapshot[product['brand']].append(product)
+    return snapshot
+
+
+def price_buckets():
+    """label -> (lower bound, upper bound or None) of every price bucket"""
+    bounds = [0] + list(PRICE_BUCKETS)
+    buckets = {'{}-{}'.format(low, high): (Decimal(low), Decimal(high)) for low, high in zip(bounds, bounds[1:])}
+    buckets['{}+'.format(bounds[-1])] = (Decimal(bounds[-1]), None)
+    return buckets
+
+
+def price_bucket_filter(labels):
+    condition = Q()
+    for label in labels:
+        low, high = price_buckets()[label]
+        condition |= Q(price__gte=low, price__lt=high) if high is not None else Q(price__gte=low)
+    return condition
+
+
+def facet_rows():
+    """
+    (category, sub_category, brand, price bucket, count) for every combination in the catalog.
+    One aggregate query per catalog version, every facet count is summed up from these rows.
+    """
+    key = 'mr_milk:catalog:{}:facet-rows'.format(catalog_version())
+    rows = cache.get(key)
+    if rows is None:
+        bucket = Case(*[When(price_bucket_filter([label]), then=Value(label)) for label in price_buckets()],
+                      output_field=CharField())
+        rows = list(Product.objects.annotate(price_bucket=bucket)
+                    .values_list('category_id', 'sub_category_id', 'brand_id', 'price_bucket')
+                    .annotate(count=Count('pk'))
+                    .order_by())
+        cache.set(key, rows, timeout=CATALOG_CACHE_TIMEOUT)
+    return rows
+
+
+def facet_counts(filters):
+    """
+    value -> number of products for every facet, filters maps a facet to the set of values picked for it.
+    Each facet is counted with the filters of the other facets only, so picking a brand still shows the
+    counts of the other brands.
+    """
+    counts = {facet: Counter() for facet in FACETS}
+    for *values, count in facet_rows():
+        row = dict(zip(FACETS, values))
+        for facet in FACETS:
+            if all(row[other] in picked for other, picked in filters.items() if other != facet):
+                counts[facet][row[facet]] += count
+    return {facet: dict(sorted(counter.items())) for facet, counter in counts.items()}
+
+
+def filter_products(products, filters):
+    """narrow a Product queryset down to the picked facet values"""
+    for facet in ('category', 'sub_category', 'brand'):
+        if facet in filters:
+            products = products.filter(**{'{}__in'.format(facet): filters[facet]})
+    if 'price' in filters:
+        products = products.filter(price_bucket_filter(filters['price']))
+    return products
@@ -0,0 +1,97 @@
+"""
+Delivery manifests: the orders to deliver on a date grouped by area (Order.delivery_area), with the
+quantity of every product to load per area and for the whole truck, and the stops of every area.
+Orders are picked by the (delivery_date, order_status, delivery_area) index and the loads are summed by
+the database, a manifest is a few queries whatever the number of orders.
+"""
+
+import datetime
+from collections import defaultdict
+from decimal import Decimal
+
+from django.db.models import Count, Q, Sum
+
+from .models import Order, OrderDetail, default_delivery_date
+
+OPEN_STATUSES = ('PL', 'SH')
+CENT = Decimal('0.01')
+
+
+def manifest_date(value=None):
+    """the delivery date of a YYYY-MM-DD string, tomorrow when it is left out"""
+    return datetime.date.fromisoformat(value) if value else default_delivery_date()
+
+
+def manifest_statuses(value=None):
+    """order statuses of a comma separated string, placed and shipped when it is left out"""
+    if not value:
+        return OPEN_STATUSES
+    statuses = tuple(status.strip().upper() for status in value.split(',') if status.strip())
+    known = {status for status, _ in Order.order_status_choices}
+    unknown = [status for status in statuses if status not in known]
+    if unknown or not statuses:
+        raise ValueError('unknown order status {}, use {}'.format(', '.join(unknown), ', '.join(sorted(known))))
+    return statuses
+
+
+def delivery_manifest(delivery_date, statuses=OPEN_STATUSES, area=None, stops=True):
+    """
+    {'areas': [...], 'load': [...]} for the orders of delivery_date in statuses, only those of area when given.
+    Every area has its order count, the quantity per product to load and, with stops, its orders with their lines.
+    """
+    orders = Order.objects.filter(delivery_date=delivery_date, order_status__in=statuses)
+    lines = OrderDetail.objects.filter(order__delivery_date=delivery_date, order__order_status__in=statuses)
+    if area is not None:
+        orders = orders.filter(delivery_area=area)
+        lines = lines.filter(order__delivery_area=area)
+
+    # the queries are not one snapshot, an order that came in between them still gets an area to go in
+    areas = defaultdict(lambda: {'orders': 0, 'cod_orders': 0, 'total': '0.00', 'load': []})
+    for row in orders.values('delivery_area') \
+            .annotate(orders=Count('pk'), cod_orders=Count('pk', filter=Q(cod='1')), total=Sum('total')) \
+            .order_by('delivery_area'):
+        areas[row['delivery_area']].update(orders=row['orders'], cod_orders=row['cod_orders'],
+                                           total=str(row['total'].quantize(CENT)))
+
+    truck = {}
+    for row in lines.values('order__delivery_area', 'product_id', 'product__product_name') \
+            .annotate(quantity=Sum('quantity'), orders=Count('order_id')) \
+            .order_by('order__delivery_area', 'product__product_name'):
+        areas[row['order__delivery_area']]['load'].append(
+            {'product': row['product_id'], 'product_name': row['product__product_name'],
+             'quantity': row['quantity'], 'orders': row['orders']})
+        load = truck.setdefault(row['product_id'], {'product': row['product_id'],
+                                                    'product_name': row['product__product_name'],
+                                                    'quantity': 0, 'orders': 0})
+        load['quantity'] += row['quantity']
+        load['orders'] += row['orders']
+
+    if stops:
+        for area in areas.values():
+            area['stops'] = []
+        for stop in manifest_stops(orders, lines):
+            areas[stop.pop('delivery_area')].setdefault('stops', []).append(stop)
+
+    return {
+        'date': delivery_date,
+        'statuses': list(statuses),
+        'orders': sum(row['orders'] for row in areas.values()),
+        'areas': [dict(area=name, **area) for name, area in areas.items()],
+        'load': sorted(truck.values(), key=lambda load: (-load['quantity'], load['product_name'])),
+    }
+
+
+def manifest_stops(orders, lines):
+    """the orders with their customer and lines, in area and order id order"""
+    order_lines = defaultdict(list)
+    for order_id, product_id, product_name, quantity in lines.order_by('order_id', 'product_id') \
+            .values_list('order_id', 'product_id', 'product__product_name', 'quantity'):
+        order_lines[order_id].append({'product': product_id, 'product_name': product_name, 'quantity': quantity})
+    for stop in orders.order_by('delivery_area', 'order_id') \
+            .values('order_id', 'delivery_area', 'order_status', 'order_address', 'customer_id__name',
+                    'customer_id__phone', 'cod', 'total'):
+        stop['customer_name'] = stop.pop('customer_id__name')
+        stop['customer_phone'] = stop.pop('customer_id__phone')
+        stop['total'] = str(stop['total'])
+        stop['lines'] = order_lines[stop['order_id']]
+        yield stop
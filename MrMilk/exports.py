@@ -0,0 +1,89 @@
+"""
+Order export for offline reporting, one row per order line with its order and product.
+Rows come from a single joined query read through a chunked iterator and go out as they are read,
+as NDJSON or CSV, so memory stays flat and the first bytes leave before the last row is fetched.
+"""
+
+import csv
+import datetime
+
+from django.core.serializers.json import DjangoJSONEncoder
+from django.utils import timezone
+
+from .models import OrderDetail
+
+EXPORT_COLUMNS = (
+    ('order_id', 'order_id'),
+    ('order_date', 'order__order_date'),
+    ('delivery_date', 'order__delivery_date'),
+    ('order_status', 'order__order_status'),
+    ('customer_id', 'order__customer_id'),
+    ('order_address', 'order__order_address'),
+    ('order_total', 'order__total'),
+    ('cod', 'order__cod'),
+    ('transaction_id', 'order__transaction_id'),
+    ('product_id', 'product_id'),
+    ('product_name', 'product__product_name'),
+    ('brand', 'product__brand_id'),
+    ('category', 'product__category_id'),
+    ('product_price', 'product__price'),
+    ('quantity', 'quantity'),
+)
+EXPORT_FORMATS = {'ndjson': 'application/x-ndjson', 'csv': 'text/csv'}
+
+
+def export_range(start=None, end=None, days=30):
+    """(start, end) dates of YYYY-MM-DD strings, the last days days up to today when they are left out"""
+    end = datetime.date.fromisoformat(end) if end else timezone.localdate()
+    start = datetime.date.fromisoformat(start) if start else end - datetime.timedelta(days - 1)
+    if start > end:
+        raise ValueError('start is after end')
+    return start, end
+
+
+def day_bounds(start, end):
+    """aware datetimes from the start of the start day to the end of the end day, in local time"""
+    return (timezone.make_aware(datetime.datetime.combine(start, datetime.time.min)),
+            timezone.make_aware(datetime.datetime.combine(end + datetime.timedelta(1), datetime.time.min)))
+
+
+def order_lines(start, end, chunk_size=2000):
+    """tuples of EXPORT_COLUMNS for the lines of orders placed from start to end (dates), oldest first"""
+    since, until = day_bounds(start, end)
+    return OrderDetail.objects.filter(order__order_date__gte=since, order__order_date__lt=until) \
+        .order_by('order__order_date', 'order_id', 'pk') \
+        .values_list(*[lookup for _, lookup in EXPORT_COLUMNS]) \
+        .iterator(chunk_size=chunk_size)
+
+
+class Echo:
+    """file-like object handing back what csv.writer writes to it"""
+
+    def write(self, value):
+        return value
+
+
+def batched(lines, size):
+    # one string per few hundred rows keeps the number of writes to the socket down
+    batch = []
+    for line in lines:
+        batch.append(line)
+        if len(batch) >= size:
+            yield ''.join(batch)
+            batch = []
+    if batch:
+        yield ''.join(batch)
+
+
+def export_orders(start, end, export_format='ndjson', chunk_size=2000):
+    """generator of NDJSON or CSV text for the order lines of start to end"""
+    names = [name for name, _ in EXPORT_COLUMNS]
+    rows = order_lines(start, end, chunk_size)
+    if export_format == 'csv':
+        writer = csv.writer(Echo())
+        yield writer.writerow(names)
+        lines = (writer.writerow(row) for row in rows)
+    else:
+        encoder = DjangoJSONEncoder(separators=(',', ':'))
+        lines = (encoder.encode(dict(zip(names, row))) + '\n' for row in rows)
+    yield from batched(lines, 500)
@@ -0,0 +1,85 @@
+"""
+Resized WebP and JPEG variants of product and category images.
+Variants are written once per image content next to the uploads, under MEDIA_ROOT/variants, and are
+named after the sha1 of the original file so a replaced image never serves an old thumbnail.
+"""
+
+import hashlib
+from io import BytesIO
+
+from PIL import Image, ImageOps, features
+from django.conf import settings
+from django.core.files.base import ContentFile
+from django.core.files.storage import default_storage
+
+# variant name -> longest edge in pixels
+IMAGE_VARIANTS = getattr(settings, 'IMAGE_VARIANTS', {'thumb': 96, 'small': 240, 'medium': 480})
+IMAGE_FORMATS = (('webp', 'WEBP', {'quality': 80, 'method': 4}),
+                 ('jpg', 'JPEG', {'quality': 82, 'optimize': True, 'progressive': True}))
+
+
+def content_hash(field_file):
+    digest = hashlib.sha1()
+    with field_file.open('rb') as image:
+        for chunk in image.chunks():
+            digest.update(chunk)
+    return digest.hexdigest()
+
+
+def variant_name(image_hash, variant, extension):
+    return 'variants/{}/{}-{}.{}'.format(image_hash[:2], image_hash, variant, extension)
+
+
+def available_formats():
+    return [image_format for image_format in IMAGE_FORMATS
+            if image_format[0] != 'webp' or features.check('webp')]
+
+
+def variant_urls(image_hash):
+    """variant name -> {extension: url}, empty until the variants of the image were built"""
+    if not image_hash:
+        return {}
+    return {variant: {extension: default_storage.url(variant_name(image_hash, variant, extension))
+                      for extension, _, _ in available_formats()}
+            for variant in IMAGE_VARIANTS}
+
+
+def build_variants(field_file, image_hash):
+    """write every missing variant of the image, the original is decoded at most once"""
+    missing = [(variant, size, extension, image_format, options)
+               for variant, size in IMAGE_VARIANTS.items()
+               for extension, image_format, options in available_formats()
+               if not default_storage.exists(variant_name(image_hash, variant, extension))]
+    if not missing:
+        return
+    with field_file.open('rb') as original:
+        image = ImageOps.exif_transpose(Image.open(original))
+        image.load()
+    if image.mode in ('RGBA', 'LA', 'P'):
+        # JPEG has no alpha, flatten transparent packshots onto white
+        image = image.convert('RGBA')
+        background = Image.new('RGB', image.size, (255, 255, 255))
+        background.paste(image, mask=image.getchannel('A'))
+        image = background
+    elif image.mode != 'RGB':
+        image = image.convert('RGB')
+    for variant, size, extension, image_format, options in missing:
+        resized = image.copy()
+        resized.thumbnail((size, size), Image.LANCZOS)
+        buffer = BytesIO()
+        resized.save(buffer, image_format, **options)
+        default_storage.save(variant_name(image_hash, variant, extension), ContentFile(buffer.getvalue()))
+
+
+def refresh_variants(instance):
+    """hash the image of a Product or Category, build its variants and store the hash, returns the hash"""
+    if not instance.image:
+        image_hash = ''
+    else:
+        image_hash = content_hash(instance.image)
+        build_variants(instance.image, image_hash)
+    if image_hash != instance.image_hash:
+        # a queryset update so that saving the hash does not send post_save again
+        type(instance).objects.filter(pk=instance.pk).update(image_hash=image_hash)
+        instance.image_hash = image_hash
+    return image_hash
@@ -0,0 +1,174 @@
+"""
+Per request SQL instrumentation.
+SQLInstrumentationMiddleware counts the queries of every request, adds up their time and groups them by
+fingerprint, the statement with its literals and parameters blanked out. The same fingerprint running
+again and again in one request is how an N+1 looks like: a per item lookup in a serializer or one INSERT
+per order line. With SQL_INSTRUMENTATION_HEADERS (DEBUG by default) the numbers go out as X-SQL-* and
+Server-Timing response headers, otherwise as one JSON log line per request on the MrMilk.sql logger,
+at WARNING when a fingerprint repeats SQL_REPEAT_THRESHOLD times or more.
+The recorder stays on request.sql_recorder for the middleware above, MrMilk.metrics reports it per route.
+query_budget() fails a test that runs more queries than it is allowed to.
+Recorders are found through a context variable, not installed on one thread's connections: the queries of
+async views, run by sync_to_async on other threads that inherit the request's context, are recorded too.
+"""
+
+import asyncio
+import contextvars
+import hashlib
+import json
+import logging
+import re
+import time
+from collections import Counter
+from contextlib import contextmanager
+
+from django.conf import settings
+from django.db import connections
+from django.db.backends.signals import connection_created
+from django.dispatch import receiver
+
+logger = logging.getLogger('MrMilk.sql')
+
+LITERAL_RE = re.compile(r"'(?:[^']|'')*'|\b\d+(?:\.\d+)?\b|%s")
+IN_LIST_RE = re.compile(r'\(\s*\?(?:\s*,\s*\?)*\s*\)')
+SPACE_RE = re.compile(r'\s+')
+
+
+def fingerprint(sql):
+    """the statement with literals and parameters blanked out, IN lists of any length look the same"""
+    sql = LITERAL_RE.sub('?', SPACE_RE.sub(' ', sql.strip()))
+    return IN_LIST_RE.sub('(...)', sql)
+
+
+class QueryRecorder:
+    """(sql, seconds) of every query run on the connections using (all of them when None) while it is active"""
+
+    def __init__(self, using=None):
+        self.using = using
+        self.queries = []
+
+    def record(self, alias, sql, seconds):
+        if self.using is None or alias in self.using:
+            self.queries.append((sql, seconds))
+
+    @property
+    def count(self):
+        return len(self.queries)
+
+    @property
+    def seconds(self):
+        return sum(seconds for _, seconds in self.queries)
+
+    def repeated(self, threshold=2):
+        """[(count, fingerprint)] of statements run at least threshold times, most repeated first"""
+        counts = Counter(fingerprint(sql) for sql, _ in self.queries)
+        return [(count, statement) for statement, count in counts.most_common() if count >= threshold]
+
+
+active_recorders = contextvars.ContextVar('mr_milk_sql_recorders', default=())
+
+
+def recording_execute(execute, sql, params, many, context):
+    """execute wrapper of every connection, hands the query to the recorders of the current context"""
+    recorders = active_recorders.get()
+    if not recorders:
+        return execute(sql, params, many, context)
+    started = time.perf_counter()
+    try:
+        return execute(sql, params, many, context)
+    finally:
+        seconds = time.perf_counter() - started
+        for recorder in recorders:
+            recorder.record(context['connection'].alias, sql, seconds)
+
+
+def install_recorder(connection):
+    # first in the list: execute_wrapper() blocks pop the last wrapper when they end, not this one
+    if recording_execute not in connection.execute_wrappers:
+        connection.execute_wrappers.insert(0, recording_execute)
+
+
+@receiver(connection_created)
+def install_on_connect(sender, connection, **kwargs):
+    install_recorder(connection)
+
+
+@contextmanager
+def record_queries(using=None):
+    """QueryRecorder of every query run on the connections using (all of them by default) in this context"""
+    recorder = QueryRecorder(using)
+    # connections of this thread that were opened before this module was imported
+    for alias in connections:
+        install_recorder(connections[alias])
+    token = active_recorders.set(active_recorders.get() + (recorder,))
+    try:
+        yield recorder
+    finally:
+        active_recorders.reset(token)
+
+
+def short_hash(statement):
+    return hashlib.md5(statement.encode()).hexdigest()[:8]
+
+
+class SQLInstrumentationMiddleware:
+    sync_capable = True
+    async_capable = True
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+        self.headers = getattr(settings, 'SQL_INSTRUMENTATION_HEADERS', settings.DEBUG)
+        self.threshold = getattr(settings, 'SQL_REPEAT_THRESHOLD', 5)
+        self.is_async = asyncio.iscoroutinefunction(get_response)
+        if self.is_async:
+            # how Django's MiddlewareMixin tells the handler to await this middleware
+            self._is_coroutine = asyncio.coroutines._is_coroutine
+
+    def __call__(self, request):
+        if self.is_async:
+            return self.__acall__(request)
+        with record_queries() as recorder:
+            request.sql_recorder = recorder
+            response = self.get_response(request)
+        return self.report(request, response, recorder)
+
+    async def __acall__(self, request):
+        with record_queries() as recorder:
+            request.sql_recorder = recorder
+            response = await self.get_response(request)
+        return self.report(request, response, recorder)
+
+    def report(self, request, response, recorder):
+        repeated = recorder.repeated()
+        if self.headers:
+            response['X-SQL-Queries'] = recorder.count
+            response['X-SQL-Time'] = '{:.2f}'.format(recorder.seconds * 1000)
+            if repeated:
+                response['X-SQL-Repeated'] = ', '.join(
+                    '{}x{}'.format(count, short_hash(statement)) for count, statement in repeated[:5])
+            response['Server-Timing'] = 'sql;dur={:.2f};desc="{} queries"'.format(
+                recorder.seconds * 1000, recorder.count)
+        else:
+            suspicious = bool(repeated) and repeated[0][0] >= self.threshold
+            logger.log(logging.WARNING if suspicious else logging.INFO, json.dumps({
+                'method': request.method, 'path': request.path, 'status': response.status_code,
+                'queries': recorder.count, 'sql_ms': round(recorder.seconds * 1000, 2),
+                'repeated': [{'count': count, 'fingerprint': short_hash(statement), 'sql': statement[:300]}
+                             for count, statement in repeated[:5]],
+            }))
+        return response
+
+
+@contextmanager
+def query_budget(max_queries, using=None):
+    """
+    fail with AssertionError when the block runs more than max_queries queries, e.g.
+        with query_budget(3):
+            client.get('/mr_milk/brands/')
+    """
+    with record_queries(using) as recorder:
+        yield recorder
+    if recorder.count > max_queries:
+        lines = ['{} queries, the budget is {}'.format(recorder.count, max_queries)]
+        lines += ['  {} x {}'.format(count, statement) for count, statement in recorder.repeated()]
+        raise AssertionError('\n'.join(lines))
@@ -0,0 +1,71 @@
+"""
+Stock reservation for order placement.
+Every product of a cart is taken out of Product.quantity with one conditional UPDATE, the database
+checks and decrements in the same statement so concurrent orders can never push the stock below zero
+and no row is held locked between a read and a write.
+update() sends no signal, so stock that moves bumps the catalog version itself once it commits: the
+catalog responses and their ETags carry Product.quantity.
+"""
+
+from collections import Counter
+
+from django.db import transaction
+from django.db.models import F
+
+from .cache import bump_catalog_version
+from .models import Product
+
+
+class OutOfStock(Exception):
+
+    def __init__(self, product_id):
+        super().__init__('not enough stock for product {}'.format(product_id))
+        self.product_id = product_id
+
+
+def cart_quantities(lines):
+    """product id -> total quantity for (product id, quantity) pairs, sorted so every cart locks rows in the same order"""
+    quantities = Counter()
+    for product_id, quantity in lines:
+        quantities[product_id] += quantity
+    return dict(sorted(quantities.items()))
+
+
+def reserve_stock(lines):
+    """
+    take the quantities of a cart out of stock, raises OutOfStock for the first product that runs short.
+    Has to run inside transaction.atomic() so that the products reserved before the failing one are given back.
+    """
+    for product_id, quantity in cart_quantities(lines).items():
+        reserved = Product.objects.filter(pk=product_id, quantity__gte=quantity) \
+            .update(quantity=F('quantity') - quantity)
+        if not reserved:
+            raise OutOfStock(product_id)
+    transaction.on_commit(bump_catalog_version)
+
+
+def reserve_available_stock(lines):
+    """
+    take as much of each product of lines out of stock as there is, returns product id -> quantity taken.
+    For batches where a short product should go as far as it can, e.g. subscriptions.
+    """
+    taken = {}
+    for product_id, quantity in cart_quantities(lines).items():
+        while True:
+            available = Product.objects.filter(pk=product_id).values_list('quantity', flat=True).first() or 0
+            take = min(max(available, 0), quantity)
+            # a concurrent order took some of it between the read and the write, read it again
+            if not take or Product.objects.filter(pk=product_id, quantity__gte=take) \
+                    .update(quantity=F('quantity') - take):
+                break
+        taken[product_id] = take
+    if any(taken.values()):
+        transaction.on_commit(bump_catalog_version)
+    return taken
+
+
+def release_stock(lines):
+    """put the quantities of a cart back into stock, e.g. when an order that already committed is cancelled"""
+    for product_id, quantity in cart_quantities(lines).items():
+        Product.objects.filter(pk=product_id).update(quantity=F('quantity') + quantity)
+    transaction.on_commit(bump_catalog_version)
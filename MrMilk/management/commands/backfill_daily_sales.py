@@ -0,0 +1,33 @@
+import time
+
+from django.core.management.base import BaseCommand, CommandError
+from django.db import transaction
+
+from MrMilk.exports import export_range, day_bounds
+from MrMilk.sales import backfill_daily_sales
+from MrMilk.sqlite.retry import retry_on_lock
+
+
+class Command(BaseCommand):
+    help = 'Rebuild the daily sales rollup of a date range from the order lines'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--start', help='first order date as YYYY-MM-DD, 30 days before --end by default')
+        parser.add_argument('--end', help='last order date as YYYY-MM-DD, defaults to today')
+        parser.add_argument('--days', type=int, default=30, help='days up to --end when --start is left out')
+
+    def handle(self, *args, **options):
+        try:
+            start, end = export_range(options['start'], options['end'], options['days'])
+        except ValueError as error:
+            raise CommandError('start and end have to be YYYY-MM-DD dates: {}'.format(error))
+        started = time.perf_counter()
+        written = self.backfill(*day_bounds(start, end))
+        self.stdout.write(self.style.SUCCESS('{} rows for {} to {} in {:.2f}s'.format(
+            written, start, end, time.perf_counter() - started)))
+
+    @retry_on_lock
+    def backfill(self, since, until):
+        # the days are deleted and written again in one transaction, readers never see them half done
+        with transaction.atomic():
+            return backfill_daily_sales(since, until)
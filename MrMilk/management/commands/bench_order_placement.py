@@ -0,0 +1,78 @@
+import time
+from decimal import Decimal
+
+from django.core.management.base import BaseCommand
+from django.db import connection, transaction
+from django.test.utils import CaptureQueriesContext
+
+from MrMilk.models import Profile, Category, SubCategory, Brand, Product
+from MrMilk.serializers import OrderSerializer, OrderDetailSerializer, OrderPlacementSerializer
+
+
+class Command(BaseCommand):
+    help = 'Compare per-line and bulk order placement latency for growing cart sizes, nothing is kept in the database'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--sizes', default='1,5,15,30,60', help='comma separated cart sizes')
+        parser.add_argument('--repeat', type=int, default=20, help='orders placed per cart size and path')
+
+    def handle(self, *args, **options):
+        sizes = [int(size) for size in options['sizes'].split(',')]
+        with transaction.atomic():
+            customer, products = self.make_fixtures(max(sizes))
+            self.stdout.write('{:>6} {:>14} {:>10} {:>14} {:>10}'.format(
+                'cart', 'per-line ms', 'queries', 'bulk ms', 'queries'))
+            for size in sizes:
+                payload = self.make_payload(customer, products[:size])
+                per_line = self.measure(self.place_per_line, payload, options['repeat'])
+                bulk = self.measure(self.place_bulk, payload, options['repeat'])
+                self.stdout.write('{:>6} {:>14.2f} {:>10} {:>14.2f} {:>10}'.format(size, *per_line, *bulk))
+            transaction.set_rollback(True)
+
+    @staticmethod
+    def make_fixtures(count):
+        customer = Profile.objects.create_user(phone='9000000000', name='bench', email='bench@example.com',
+                                               password='bench-password', address='bench address')
+        category = Category.objects.create(category_name='bench-category')
+        sub_category = SubCategory.objects.create(sub_category_name='bench-sub-category')
+        brand = Brand.objects.create(brand_name='bench-brand')
+        products = [Product.objects.create(product_name='bench-{}'.format(index), category=category,
+                                           sub_category=sub_category, brand=brand, price=Decimal('25'),
+                                           quantity=1000000)
+                    for index in range(count)]
+        return customer, products
+
+    @staticmethod
+    def make_payload(customer, products):
+        return {
+            'order': {'customer_id': customer.pk, 'order_address': 'bench address', 'total': '100.00'},
+            'order_detail': [{'product': product.pk, 'quantity': 1} for product in products],
+        }
+
+    @staticmethod
+    def place_per_line(payload):
+        # the previous OrderDetailViewSet.create: one serializer, validation and INSERT per line
+        serializer_order = OrderSerializer(data=payload['order'])
+        serializer_order.is_valid(raise_exception=True)
+        serializer_order.save()
+        for data_item in payload['order_detail']:
+            d = dict(data_item)
+            d['order'] = serializer_order.data['order_id']
+            serializer_order_detail = OrderDetailSerializer(data=d)
+            serializer_order_detail.is_valid(raise_exception=True)
+            serializer_order_detail.save()
+
+    @staticmethod
+    def place_bulk(payload):
+        serializer = OrderPlacementSerializer(data=payload)
+        serializer.is_valid(raise_exception=True)
+        serializer.save()
+
+    @staticmethod
+    def measure(place, payload, repeat):
+        with CaptureQueriesContext(connection) as queries:
+            started = time.perf_counter()
+            for _ in range(repeat):
+                place(payload)
+            elapsed = time.perf_counter() - started
+        return elapsed * 1000 / repeat, len(queries) // repeat
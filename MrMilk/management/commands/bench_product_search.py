@@ -0,0 +1,68 @@
+import random
+import time
+from decimal import Decimal
+
+from django.core.management.base import BaseCommand
+from django.db import transaction
+
+from MrMilk.models import Category, SubCategory, Brand, Product
+from MrMilk.search import search_products
+
+BRANDS = ('amul', 'mother dairy', 'nestle', 'britannia', 'govardhan', 'nandini', 'aavin', 'heritage')
+CATEGORIES = ('milk', 'curd', 'paneer', 'butter', 'cheese', 'ghee', 'lassi', 'ice cream')
+SUB_CATEGORIES = ('toned', 'full cream', 'double toned', 'skimmed', 'organic', 'flavoured')
+WORDS = ('fresh', 'gold', 'taaza', 'slim', 'pro', 'classic', 'kesar', 'mango', 'masti', 'malai', 'lite', 'premium')
+QUERIES = ('am', 'amul', 'amul go', 'paneer', 'mother dairy ta', 'kesar lassi', 'organic ghee', 'zzz')
+
+
+class Command(BaseCommand):
+    help = 'Compare FTS5 product search with an icontains scan on a synthetic catalog, nothing is kept in the database'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--products', type=int, default=50000)
+        parser.add_argument('--repeat', type=int, default=20)
+
+    def handle(self, *args, **options):
+        with transaction.atomic():
+            started = time.perf_counter()
+            self.make_catalog(options['products'])
+            self.stdout.write('{} products created and indexed in {:.2f}s'.format(
+                options['products'], time.perf_counter() - started))
+            self.stdout.write('{:<18} {:>8} {:>12} {:>14}'.format('query', 'matches', 'fts5 ms', 'icontains ms'))
+            for query in QUERIES:
+                fts = self.measure(lambda: search_products(query, limit=20), options['repeat'])
+                scan = self.measure(lambda: list(self.scan(query)[:20]), options['repeat'])
+                self.stdout.write('{:<18} {:>8} {:>12.2f} {:>14.2f}'.format(
+                    query, len(search_products(query, limit=20)), fts, scan))
+            transaction.set_rollback(True)
+
+    @staticmethod
+    def make_catalog(count):
+        categories = [Category.objects.create(category_name='bench ' + name) for name in CATEGORIES]
+        sub_categories = [SubCategory.objects.create(sub_category_name='bench ' + name) for name in SUB_CATEGORIES]
+        brands = [Brand.objects.create(brand_name='bench ' + name) for name in BRANDS]
+        generator = random.Random(42)
+        products = []
+        for _ in range(count):
+            brand, category = generator.choice(brands), generator.choice(categories)
+            name = '{} {} {}'.format(brand.brand_name[6:], generator.choice(WORDS), category.category_name[6:])
+            products.append(Product(product_name=name[:50], category=category, brand=brand,
+                                    sub_category=generator.choice(sub_categories),
+                                    price=Decimal(generator.randint(20, 500)), quantity=100))
+        Product.objects.bulk_create(products, batch_size=2000)
+
+    @staticmethod
+    def scan(query):
+        # what a search without the index would do: every word anywhere in the name, ordered results
+        # so that every row is looked at like a ranked search has to
+        products = Product.objects.order_by('product_name')
+        for word in query.split():
+            products = products.filter(product_name__icontains=word)
+        return products
+
+    @staticmethod
+    def measure(run, repeat):
+        started = time.perf_counter()
+        for _ in range(repeat):
+            run()
+        return (time.perf_counter() - started) * 1000 / repeat
@@ -0,0 +1,113 @@
+import os
+import random
+import shutil
+import sqlite3
+import tempfile
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+from django.conf import settings
+from django.core.management.base import BaseCommand, CommandError
+from django.db import OperationalError, connections, transaction
+from django.db.models import F
+
+from MrMilk.models import Order, OrderDetail, Product, Profile
+from MrMilk.sqlite.retry import is_lock_error, retry_on_lock
+
+
+class Command(BaseCommand):
+    help = 'Compare concurrent order write throughput of the stock SQLite setup and the production profile'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--threads', default='1,4,16', help='comma separated numbers of concurrent writers')
+        parser.add_argument('--seconds', type=float, default=3.0, help='duration of every run')
+        parser.add_argument('--lines', type=int, default=3, help='order lines per order')
+
+    def handle(self, *args, **options):
+        if connections['default'].vendor != 'sqlite':
+            raise CommandError('the default database is not SQLite')
+        customers = list(Profile.objects.values_list('pk', flat=True)[:100])
+        products = list(Product.objects.filter(quantity__gte=1000).values_list('pk', flat=True)[:200])
+        if not customers or len(products) < options['lines']:
+            raise CommandError('needs profiles and products with stock, run generate_dairy_data first')
+        directory = tempfile.mkdtemp()
+        profiles = {
+            # what settings.py had before: rollback journal, full syncs, a new connection per request, no retries
+            'stock': ({'ENGINE': 'django.db.backends.sqlite3', 'CONN_MAX_AGE': 0, 'OPTIONS': {}}, 'DELETE', False),
+            'production': (dict(settings.DATABASES['default']), 'WAL', True),
+        }
+        try:
+            self.stdout.write('{:<11} {:>8} {:>10} {:>8} {:>8}'.format('profile', 'threads', 'orders/s', 'p95 ms',
+                                                                      'locked'))
+            for threads in [int(threads) for threads in options['threads'].split(',')]:
+                for name, (database, journal_mode, retry) in profiles.items():
+                    alias = 'bench_{}'.format(name)
+                    path = os.path.join(directory, '{}-{}.sqlite3'.format(name, threads))
+                    self.copy_database(path, journal_mode)
+                    connections.databases[alias] = dict(database, NAME=path)
+                    try:
+                        rate, p95, locked = self.run(alias, retry, threads, options['seconds'], customers, products,
+                                                     options['lines'])
+                    finally:
+                        connections[alias].close()
+                        del connections.databases[alias]
+                    self.stdout.write('{:<11} {:>8} {:>10.1f} {:>8.1f} {:>8}'.format(name, threads, rate, p95, locked))
+        finally:
+            shutil.rmtree(directory)
+
+    @staticmethod
+    def copy_database(path, journal_mode):
+        """a private copy of the default database, the runs must not write to the real one"""
+        source = sqlite3.connect(settings.DATABASES['default']['NAME'])
+        target = sqlite3.connect(path)
+        source.backup(target)
+        target.execute('PRAGMA journal_mode = {}'.format(journal_mode))
+        target.close()
+        source.close()
+
+    @staticmethod
+    def place_order(alias, customer, products):
+        with transaction.atomic(using=alias):
+            for product in products:
+                Product.objects.using(alias).filter(pk=product, quantity__gte=1).update(quantity=F('quantity') - 1)
+            order = Order.objects.using(alias).create(customer_id_id=customer, order_address='bench', total=100)
+            OrderDetail.objects.using(alias).bulk_create(
+                [OrderDetail(order=order, product_id=product, quantity=1) for product in products])
+
+    def run(self, alias, retry, threads, seconds, customers, products, lines):
+        place = retry_on_lock(self.place_order, using=alias) if retry else self.place_order
+        persistent = connections.databases[alias]['CONN_MAX_AGE'] != 0
+        latencies = []
+        locked = [0]
+        lock = threading.Lock()
+        deadline = time.perf_counter() + seconds
+
+        def writer(seed):
+            rnd = random.Random(seed)
+            try:
+                while time.perf_counter() < deadline:
+                    started = time.perf_counter()
+                    try:
+                        place(alias, rnd.choice(customers), rnd.sample(products, lines))
+                    except OperationalError as error:
+                        if not is_lock_error(error):
+                            raise
+                        with lock:
+                            locked[0] += 1
+                        continue
+                    finally:
+                        if not persistent:
+                            connections[alias].close()
+                    with lock:
+                        latencies.append(time.perf_counter() - started)
+            finally:
+                connections[alias].close()
+
+        started = time.perf_counter()
+        with ThreadPoolExecutor(max_workers=threads) as pool:
+            list(pool.map(writer, range(threads)))
+        elapsed = time.perf_counter() - started
+        latencies.sort()
+        p95 = latencies[int(len(latencies) * 0.95)] * 1000 if latencies else 0.0
+        return len(latencies) / elapsed, p95, locked[0]
@@ -0,0 +1,37 @@
+import time
+
+from django.core.management.base import BaseCommand
+from django.db import connection, transaction
+from django.test.utils import CaptureQueriesContext
+from rest_framework.authentication import TokenAuthentication
+from rest_framework.authtoken.models import Token
+from rest_framework.request import Request
+from rest_framework.test import APIRequestFactory
+
+from MrMilk.authentication import CachedTokenAuthentication, token_cache
+from MrMilk.models import Profile
+
+
+class Command(BaseCommand):
+    help = 'Measure the authentication overhead per request with and without the token cache'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--requests', type=int, default=5000)
+
+    def handle(self, *args, **options):
+        with transaction.atomic():
+            user = Profile.objects.create_user(phone='9000000002', name='bench', email='bench@example.com',
+                                               password='bench-password', address='bench address')
+            token = Token.objects.create(user=user)
+            request = APIRequestFactory().get('/mr_milk/products/', HTTP_AUTHORIZATION='Token ' + token.key)
+            token_cache.clear()
+            for authentication in (TokenAuthentication(), CachedTokenAuthentication()):
+                with CaptureQueriesContext(connection) as queries:
+                    started = time.perf_counter()
+                    for _ in range(options['requests']):
+                        authentication.authenticate(Request(request))
+                    elapsed = time.perf_counter() - started
+                self.stdout.write('{:<28} {:>8.1f} us/request {:>8} queries'.format(
+                    type(authentication).__name__, elapsed * 1e6 / options['requests'], len(queries)))
+            token_cache.clear()
+            transaction.set_rollback(True)
@@ -0,0 +1,98 @@
+import asyncio
+import time
+from concurrent.futures import ThreadPoolExecutor
+from decimal import Decimal
+
+from django.core.asgi import get_asgi_application
+from django.core.management.base import BaseCommand, CommandError
+from django.core.wsgi import get_wsgi_application
+from django.db import connections
+from django.test import RequestFactory
+
+from MrMilk.models import Category, SubCategory, Brand, Product
+
+ENDPOINTS = (('products', '/mr_milk/products/', '/mr_milk/async/products/'),
+             ('categories', '/mr_milk/categories/', '/mr_milk/async/categories/'),
+             ('brands', '/mr_milk/brands/', '/mr_milk/async/brands/'))
+
+
+class Command(BaseCommand):
+    help = 'Compare catalog read throughput of the WSGI (sync DRF) and ASGI (async) paths under concurrent clients'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--workers', type=int, default=4, help='sync workers serving the WSGI app')
+        parser.add_argument('--clients', default='1,16,64', help='comma separated numbers of concurrent clients')
+        parser.add_argument('--requests', type=int, default=400, help='requests per endpoint and run')
+        parser.add_argument('--products', type=int, default=200)
+
+    def handle(self, *args, **options):
+        self.make_catalog(options['products'])
+        try:
+            wsgi, asgi = get_wsgi_application(), get_asgi_application()
+            self.stdout.write('{:<11} {:>8} {:>14} {:>14}'.format('endpoint', 'clients', 'wsgi req/s', 'asgi req/s'))
+            for name, sync_path, async_path in ENDPOINTS:
+                for clients in [int(clients) for clients in options['clients'].split(',')]:
+                    # the sync workers serve at most --workers clients at a time whatever the number of clients
+                    wsgi_rate = self.run_wsgi(wsgi, sync_path, min(clients, options['workers']), options['requests'])
+                    asgi_rate = asyncio.run(self.run_asgi(asgi, async_path, clients, options['requests']))
+                    self.stdout.write('{:<11} {:>8} {:>14.1f} {:>14.1f}'.format(name, clients, wsgi_rate, asgi_rate))
+        finally:
+            Category.objects.filter(pk='bench-async').delete()
+            SubCategory.objects.filter(pk='bench-async').delete()
+            Brand.objects.filter(pk='bench-async').delete()
+
+    @staticmethod
+    def make_catalog(count):
+        category = Category.objects.create(category_name='bench-async')
+        sub_category = SubCategory.objects.create(sub_category_name='bench-async')
+        brand = Brand.objects.create(brand_name='bench-async')
+        Product.objects.bulk_create([
+            Product(product_name='bench-async-{}'.format(index), category=category, sub_category=sub_category,
+                    brand=brand, price=Decimal('25'), quantity=100)
+            for index in range(count)])
+
+    @staticmethod
+    def run_wsgi(application, path, workers, requests):
+        """a sync worker serves one request at a time, more clients than workers only queue up"""
+        factory = RequestFactory(SERVER_NAME='127.0.0.1')
+
+        def call(_):
+            status = []
+            body = application(factory.get(path).environ, lambda code, headers: status.append(code))
+            b''.join(body)
+            connections.close_all()
+            if not status[0].startswith('200'):
+                raise CommandError('{} answered {}'.format(path, status[0]))
+
+        with ThreadPoolExecutor(max_workers=workers) as pool:
+            started = time.perf_counter()
+            list(pool.map(call, range(requests)))
+            return requests / (time.perf_counter() - started)
+
+    @staticmethod
+    async def run_asgi(application, path, clients, requests):
+        """every client keeps one request in flight on a single event loop"""
+        remaining = iter(range(requests))
+
+        async def call():
+            scope = {'type': 'http', 'asgi': {'version': '3.0'}, 'http_version': '1.1', 'method': 'GET',
+                     'scheme': 'http', 'path': path, 'raw_path': path.encode(), 'query_string': b'',
+                     'headers': [(b'host', b'127.0.0.1')], 'server': ('127.0.0.1', 80), 'client': ('127.0.0.1', 0)}
+            messages = iter([{'type': 'http.request', 'body': b'', 'more_body': False}])
+
+            async def receive():
+                return next(messages, {'type': 'http.disconnect'})
+
+            async def send(message):
+                if message['type'] == 'http.response.start' and message['status'] != 200:
+                    raise CommandError('{} answered {}'.format(path, message['status']))
+
+            await application(scope, receive, send)
+
+        async def client():
+            for _ in remaining:
+                await call()
+
+        started = time.perf_counter()
+        await asyncio.gather(*[client() for _ in range(clients)])
+        return requests / (time.perf_counter() - started)
@@ -0,0 +1,20 @@
+from django.core.management.base import BaseCommand
+
+from MrMilk.images import refresh_variants
+from MrMilk.models import Product, Category
+
+
+class Command(BaseCommand):
+    help = 'Build the resized image variants of every product and category, existing variants are kept'
+
+    def handle(self, *args, **options):
+        for model in (Category, Product):
+            built = missing = 0
+            for instance in model.objects.exclude(image='').exclude(image__isnull=True).iterator():
+                try:
+                    refresh_variants(instance)
+                    built += 1
+                except FileNotFoundError:
+                    missing += 1
+            self.stdout.write('{}: {} images, {} files missing'.format(
+                model._meta.verbose_name_plural, built, missing))
@@ -0,0 +1,47 @@
+import json
+
+from django.core.management.base import BaseCommand, CommandError
+from django.core.serializers.json import DjangoJSONEncoder
+
+from MrMilk.delivery import delivery_manifest, manifest_date, manifest_statuses
+
+
+class Command(BaseCommand):
+    help = 'Print the pick list of every delivery area and the truck load for a delivery date'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--date', help='delivery date as YYYY-MM-DD, defaults to tomorrow')
+        parser.add_argument('--status', help='comma separated order statuses, defaults to PL,SH')
+        parser.add_argument('--area', help='only this pincode or locality')
+        parser.add_argument('--no-stops', action='store_true', help='only the loads, not the orders of each area')
+        parser.add_argument('--json', action='store_true', help='the manifest as JSON, like the API returns it')
+
+    def handle(self, *args, **options):
+        try:
+            delivery_date = manifest_date(options['date'])
+            statuses = manifest_statuses(options['status'])
+        except ValueError as error:
+            raise CommandError(error)
+        manifest = delivery_manifest(delivery_date, statuses, options['area'], stops=not options['no_stops'])
+        if options['json']:
+            self.stdout.write(json.dumps(manifest, cls=DjangoJSONEncoder, indent=2))
+            return
+
+        self.stdout.write(self.style.SUCCESS('{} orders to deliver on {} in {} areas'.format(
+            manifest['orders'], delivery_date, len(manifest['areas']))))
+        for area in manifest['areas']:
+            self.stdout.write('')
+            self.stdout.write(self.style.MIGRATE_HEADING('{}: {} orders, {} cash on delivery, {}'.format(
+                area['area'] or 'no area', area['orders'], area['cod_orders'], area['total'])))
+            for load in area['load']:
+                self.stdout.write('  {:>5} x {}'.format(load['quantity'], load['product_name']))
+            for stop in area.get('stops', ()):
+                self.stdout.write('  #{} {} {}, {}{}'.format(
+                    stop['order_id'], stop['customer_name'], stop['customer_phone'], stop['order_address'],
+                    ', cash {}'.format(stop['total']) if stop['cod'] == '1' else ''))
+                for line in stop['lines']:
+                    self.stdout.write('      {:>3} x {}'.format(line['quantity'], line['product_name']))
+        self.stdout.write('')
+        self.stdout.write(self.style.MIGRATE_HEADING('truck load'))
+        for load in manifest['load']:
+            self.stdout.write('  {:>5} x {}'.format(load['quantity'], load['product_name']))
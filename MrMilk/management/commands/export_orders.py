@@ -0,0 +1,30 @@
+import sys
+
+from django.core.management.base import BaseCommand, CommandError
+
+from MrMilk.exports import export_orders, export_range, EXPORT_FORMATS
+
+
+class Command(BaseCommand):
+    help = 'Write the order lines of a date range as NDJSON or CSV, streamed with flat memory'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--start', help='first order date as YYYY-MM-DD, --days days up to --end by default')
+        parser.add_argument('--end', help='last order date as YYYY-MM-DD, defaults to today')
+        parser.add_argument('--days', type=int, default=30, help='days up to --end when --start is left out')
+        parser.add_argument('--format', choices=list(EXPORT_FORMATS), default='ndjson')
+        parser.add_argument('--output', help='file to write, standard output by default')
+        parser.add_argument('--chunk-size', type=int, default=2000, help='rows fetched from the database at a time')
+
+    def handle(self, *args, **options):
+        try:
+            start, end = export_range(options['start'], options['end'], options['days'])
+        except ValueError as error:
+            raise CommandError('start and end have to be YYYY-MM-DD dates: {}'.format(error))
+        output = open(options['output'], 'w', newline='', encoding='utf-8') if options['output'] else sys.stdout
+        try:
+            for text in export_orders(start, end, options['format'], options['chunk_size']):
+                output.write(text)
+        finally:
+            if options['output']:
+                output.close()
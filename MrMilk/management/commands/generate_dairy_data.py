@@ -0,0 +1,131 @@
+import binascii
+import datetime
+import os
+import random
+import time
+from decimal import Decimal
+
+from django.contrib.auth.hashers import make_password
+from django.core.management.base import BaseCommand
+from django.db import transaction
+from django.db.models import Max
+from django.utils import timezone
+from rest_framework.authtoken.models import Token
+
+from MrMilk.cache import bump_catalog_version
+from MrMilk.exports import export_range, day_bounds
+from MrMilk.models import Profile, Category, SubCategory, Brand, Product, Order, OrderDetail, Subscription, \
+    delivery_area
+from MrMilk.sales import backfill_daily_sales
+
+BRANDS = ('Amul', 'Mother Dairy', 'Nestle', 'Britannia', 'Govardhan', 'Nandini', 'Aavin', 'Heritage', 'Milky Mist',
+          'Gowardhan', 'Parag', 'Verka')
+CATEGORIES = ('Milk', 'Curd', 'Paneer', 'Butter', 'Cheese', 'Ghee', 'Lassi', 'Buttermilk', 'Ice Cream', 'Cream')
+SUB_CATEGORIES = ('Toned', 'Full Cream', 'Double Toned', 'Skimmed', 'Organic', 'Flavoured', 'Probiotic', 'A2')
+WORDS = ('Fresh', 'Gold', 'Taaza', 'Slim', 'Pro', 'Classic', 'Kesar', 'Mango', 'Masti', 'Malai', 'Lite', 'Premium')
+SIZES = ('200ml', '500ml', '1L', '200g', '400g', '1kg')
+LOCALITIES = (('Koramangala', '560034'), ('Indiranagar', '560038'), ('Jayanagar', '560041'),
+              ('Whitefield', '560066'), ('HSR Layout', '560102'), ('Malleswaram', '560003'))
+PASSWORD = 'dairy-password'
+
+
+class Command(BaseCommand):
+    help = ('Fill the database with a synthetic dairy shop: profiles, catalog, order history with its daily sales '
+            'rollup and subscriptions')
+
+    def add_arguments(self, parser):
+        parser.add_argument('--profiles', type=int, default=1000)
+        parser.add_argument('--products', type=int, default=500)
+        parser.add_argument('--orders', type=int, default=10000)
+        parser.add_argument('--subscriptions', type=int, default=2000)
+        parser.add_argument('--days', type=int, default=90, help='the order history spreads over this many days')
+        parser.add_argument('--phone-start', type=int, default=7000000000,
+                            help='phone number of the first generated profile, profiles get consecutive numbers')
+        parser.add_argument('--seed', type=int, default=1)
+        parser.add_argument('--batch-size', type=int, default=5000)
+
+    def handle(self, *args, **options):
+        self.random = random.Random(options['seed'])
+        self.batch_size = options['batch_size']
+        started = time.perf_counter()
+        with transaction.atomic():
+            customers = self.make_profiles(options['profiles'], options['phone_start'])
+            products = self.make_catalog(options['products'])
+            self.make_orders(options['orders'], options['days'], customers, products)
+            # bulk inserts send no signals, the daily sales rollup of the history is rebuilt from its lines
+            backfill_daily_sales(*day_bounds(*export_range(days=options['days'] + 1)))
+            self.make_subscriptions(options['subscriptions'], customers, products)
+            transaction.on_commit(bump_catalog_version)
+        self.stdout.write(self.style.SUCCESS(
+            '{profiles} profiles, {products} products, {orders} orders, {subscriptions} subscriptions'.format(**options)
+            + ' in {:.1f}s, every profile logs in with "{}", the first one is staff'.format(
+                time.perf_counter() - started, PASSWORD)))
+
+    def make_profiles(self, count, phone_start):
+        # hashing is what makes profiles expensive, all of them share one hash of the same password
+        password = make_password(PASSWORD)
+        profiles = []
+        for index in range(count):
+            locality, pincode = self.random.choice(LOCALITIES)
+            profiles.append(Profile(phone=str(phone_start + index), name='Customer {}'.format(index),
+                                    email='customer{}@example.com'.format(index), password=password,
+                                    address='{} {} Main, {}, Bengaluru {}'.format(
+                                        self.random.randint(1, 999), self.random.randint(1, 20), locality, pincode),
+                                    is_staff=index == 0))
+        Profile.objects.bulk_create(profiles, batch_size=self.batch_size)
+        customers = list(Profile.objects.filter(phone__in=[profile.phone for profile in profiles])
+                         .order_by('phone').values_list('pk', 'address'))
+        Token.objects.bulk_create([Token(key=binascii.hexlify(os.urandom(20)).decode(), user_id=profile_id)
+                                   for profile_id, _ in customers], batch_size=self.batch_size, ignore_conflicts=True)
+        return customers
+
+    def make_catalog(self, count):
+        categories = [Category.objects.get_or_create(category_name=name)[0] for name in CATEGORIES]
+        sub_categories = [SubCategory.objects.get_or_create(sub_category_name=name)[0] for name in SUB_CATEGORIES]
+        brands = [Brand.objects.get_or_create(brand_name=name)[0] for name in BRANDS]
+        products = []
+        for _ in range(count):
+            brand, category = self.random.choice(brands), self.random.choice(categories)
+            products.append(Product(product_name='{} {} {} {}'.format(brand.brand_name, self.random.choice(WORDS),
+                                                                      category.category_name,
+                                                                      self.random.choice(SIZES))[:50],
+                                    brand=brand, category=category, sub_category=self.random.choice(sub_categories),
+                                    price=Decimal(self.random.randint(1500, 60000)) / 100,
+                                    quantity=self.random.randint(100, 10000)))
+        first = (Product.objects.aggregate(last=Max('pk'))['last'] or 0) + 1
+        Product.objects.bulk_create(products, batch_size=self.batch_size)
+        return list(Product.objects.filter(pk__gte=first).values_list('pk', 'price'))
+
+    def make_orders(self, count, days, customers, products):
+        # explicit primary keys, SQLite does not hand back the ids of a bulk insert
+        next_order_id = (Order.objects.aggregate(last=Max('pk'))['last'] or 0) + 1
+        now = timezone.now()
+        for batch_start in range(0, count, self.batch_size):
+            orders, lines = [], []
+            for order_id in range(next_order_id + batch_start, next_order_id + min(batch_start + self.batch_size, count)):
+                cart = self.random.sample(products, min(len(products), self.random.randint(1, 5)))
+                quantities = [self.random.randint(1, 3) for _ in cart]
+                order_date = now - datetime.timedelta(days=self.random.uniform(0, days))
+                total = sum((price * quantity for (_, price), quantity in zip(cart, quantities)), Decimal(0))
+                customer_id, address = self.random.choice(customers)
+                orders.append(Order(order_id=order_id, customer_id_id=customer_id, order_address=address,
+                                    delivery_area=delivery_area(address),
+                                    order_status=self.random.choice(('PL', 'SH', 'DL', 'DL', 'DL')),
+                                    order_date=order_date,
+                                    delivery_date=order_date.date() + datetime.timedelta(1),
+                                    total=total.quantize(Decimal('0.01'))))
+                lines.extend(OrderDetail(order_id=order_id, product_id=product_id, quantity=quantity)
+                             for (product_id, _), quantity in zip(cart, quantities))
+            Order.objects.bulk_create(orders)
+            OrderDetail.objects.bulk_create(lines, batch_size=self.batch_size)
+
+    def make_subscriptions(self, count, customers, products):
+        next_id = (Subscription.objects.aggregate(last=Max('pk'))['last'] or 0) + 1
+        today = timezone.localdate()
+        Subscription.objects.bulk_create([
+            Subscription(id=next_id + index, subscriber_id=self.random.choice(customers)[0],
+                         product_id=self.random.choice(products)[0],
+                         start_date=today - datetime.timedelta(days=self.random.randint(0, 30)),
+                         no_of_days_left=self.random.randint(1, 30),
+                         delivery_days=self.random.choice((0b1111111, 0b0111110, 0b1010101, 0b0101010)))
+            for index in range(count)], batch_size=self.batch_size)
@@ -0,0 +1,206 @@
+import csv
+import hashlib
+import json
+import os
+import time
+from decimal import Decimal, InvalidOperation
+from itertools import islice
+
+from PIL import Image
+from django.core.files import File
+from django.core.files.storage import default_storage
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connection, transaction
+from django.db.models import Max
+
+from MrMilk.cache import bump_catalog_version
+from MrMilk.images import refresh_variants
+from MrMilk.models import Brand, Category, SubCategory, Product
+from MrMilk.sqlite.retry import retry_on_lock
+
+FIELDS = ('product_name', 'brand', 'category', 'sub_category', 'price', 'quantity')
+COLUMNS = ('product_name', 'brand_id', 'category_id', 'sub_category_id', 'price', 'quantity')
+UPDATE_PRODUCT = 'UPDATE "{}" SET {} WHERE "id" = %s'.format(
+    Product._meta.db_table, ', '.join('"{}" = %s'.format(column) for column in COLUMNS))
+
+
+class RowError(ValueError):
+    pass
+
+
+def read_csv(path):
+    with open(path, newline='', encoding='utf-8') as source:
+        yield from csv.DictReader(source)
+
+
+def read_ndjson(path):
+    with open(path, encoding='utf-8') as source:
+        for line in source:
+            if line.strip():
+                yield json.loads(line)
+
+
+def file_hash(path):
+    digest = hashlib.sha1()
+    with open(path, 'rb') as image:
+        for chunk in iter(lambda: image.read(64 * 1024), b''):
+            digest.update(chunk)
+    return digest.hexdigest()
+
+
+def parse_row(row):
+    """(id or None, field values, image file name or '') of a catalog row, RowError when it is not usable"""
+    missing = [field for field in FIELDS if not str(row.get(field) or '').strip()]
+    if missing:
+        raise RowError('missing {}'.format(', '.join(missing)))
+    values = {field: str(row[field]).strip() for field in ('product_name', 'brand', 'category', 'sub_category')}
+    too_long = [field for field, value in values.items() if len(value) > 50]
+    if too_long:
+        raise RowError('longer than 50 characters: {}'.format(', '.join(too_long)))
+    try:
+        values['price'] = Decimal(str(row['price']).strip())
+        values['quantity'] = int(str(row['quantity']).strip())
+        product_id = int(row['id']) if str(row.get('id') or '').strip() else None
+    except (InvalidOperation, ValueError):
+        raise RowError('price, quantity or id is not a number')
+    if values['price'] < 0 or values['quantity'] < 0:
+        raise RowError('negative price or quantity')
+    return product_id, values, str(row.get('image') or '').strip()
+
+
+class Command(BaseCommand):
+    help = 'Stream a CSV or NDJSON catalog file into the products, creating or updating them in chunks'
+
+    def add_arguments(self, parser):
+        parser.add_argument('path', help='CSV with a header row or one JSON object per line, columns: '
+                                         'id (optional), {}, image (optional)'.format(', '.join(FIELDS)))
+        parser.add_argument('--format', choices=('csv', 'ndjson'), help='guessed from the file extension')
+        parser.add_argument('--chunk-size', type=int, default=2000, help='rows per transaction')
+        parser.add_argument('--images', help='directory the image column refers to')
+
+    def handle(self, *args, **options):
+        file_format = options['format'] or ('ndjson' if options['path'].endswith(('.ndjson', '.jsonl')) else 'csv')
+        rows = read_ndjson(options['path']) if file_format == 'ndjson' else read_csv(options['path'])
+        if options['images'] and not os.path.isdir(options['images']):
+            raise CommandError('{} is not a directory'.format(options['images']))
+        self.images = options['images']
+        # brand, category and sub category rows are keyed by their names, the lookup is just the set of names
+        self.known = {Brand: set(Brand.objects.values_list('pk', flat=True)),
+                      Category: set(Category.objects.values_list('pk', flat=True)),
+                      SubCategory: set(SubCategory.objects.values_list('pk', flat=True))}
+        totals = {'rows': 0, 'created': 0, 'updated': 0, 'unchanged': 0, 'skipped': 0, 'images': 0}
+        started = time.perf_counter()
+        line = 1
+        try:
+            while True:
+                chunk = list(islice(rows, options['chunk_size']))
+                if not chunk:
+                    break
+                products, images = self.parse_chunk(chunk, line, totals)
+                line += len(chunk)
+                created, updated, unchanged, image_ids = self.write_chunk(products, images)
+                totals['created'] += created
+                totals['updated'] += updated
+                totals['unchanged'] += unchanged
+                totals['images'] += self.attach_images(image_ids)
+        finally:
+            # bulk writes send no post_save, the cached catalog responses have to go in one go
+            if totals['created'] or totals['updated'] or totals['images']:
+                bump_catalog_version()
+        seconds = time.perf_counter() - started
+        self.stdout.write(self.style.SUCCESS(
+            '{rows} rows: {created} created, {updated} updated, {unchanged} unchanged, {skipped} skipped, '
+            '{images} images'.format(**totals)
+            + ' in {:.2f}s, {:.0f} rows/s'.format(seconds, totals['rows'] / seconds if seconds else 0)))
+
+    def parse_chunk(self, chunk, first_line, totals):
+        """{key: (id, values)} of the valid rows, the last row wins for a product listed twice"""
+        products, images = {}, {}
+        for line, row in enumerate(chunk, start=first_line):
+            totals['rows'] += 1
+            try:
+                product_id, values, image = parse_row(row)
+            except RowError as error:
+                totals['skipped'] += 1
+                self.stderr.write('row {}: {}'.format(line, error))
+                continue
+            if image and self.images:
+                image = os.path.join(self.images, os.path.basename(image))
+                if not os.path.isfile(image):
+                    self.stderr.write('row {}: no image {}, imported without it'.format(line, image))
+                    image = ''
+            key = product_id if product_id is not None else (values['product_name'], values['brand'])
+            products[key] = (product_id, values)
+            if image and self.images:
+                images[key] = image
+        return products, images
+
+    @retry_on_lock
+    def write_chunk(self, products, images):
+        """create and update the products of one chunk, returns (created, updated, unchanged, [(id, image path)])"""
+        with transaction.atomic():
+            created_names = {
+                Brand: self.create_missing(Brand, {values['brand'] for _, values in products.values()}),
+                Category: self.create_missing(Category, {values['category'] for _, values in products.values()}),
+                SubCategory: self.create_missing(SubCategory,
+                                                 {values['sub_category'] for _, values in products.values()}),
+            }
+
+            existing = {}
+            columns = ('pk', 'image_hash') + COLUMNS
+            ids = [product_id for product_id, _ in products.values() if product_id is not None]
+            for row in Product.objects.filter(pk__in=ids).values_list(*columns):
+                existing[row[0]] = row
+            names = {values['product_name'] for product_id, values in products.values() if product_id is None}
+            for row in Product.objects.filter(product_name__in=names).order_by('-pk').values_list(*columns):
+                existing[(row[2], row[3])] = row
+
+            # explicit ids for new rows, SQLite does not hand back the ids of a bulk insert and the images
+            # are attached by id; the write lock of this transaction keeps anyone else from taking them
+            next_id = (Product.objects.aggregate(last=Max('pk'))['last'] or 0) + 1
+            to_create, to_update, image_ids = [], [], []
+            for key, (product_id, values) in products.items():
+                row = tuple(values[field] for field in FIELDS)
+                pk, image_hash, *current = existing.get(key, (None, ''))
+                if pk is None:
+                    pk = product_id if product_id is not None else next_id
+                    next_id = max(next_id, pk) + 1
+                    to_create.append(Product(pk=pk, **dict(zip(COLUMNS, row))))
+                elif tuple(current) != row:
+                    # unchanged rows are not written at all, so they do not fire the search index triggers
+                    to_update.append(row + (pk,))
+                if key in images and file_hash(images[key]) != image_hash:
+                    image_ids.append((pk, images[key]))
+            Product.objects.bulk_create(to_create)
+            if to_update:
+                with connection.cursor() as cursor:
+                    # one prepared statement for the whole chunk, bulk_update builds a CASE per field and row
+                    cursor.executemany(UPDATE_PRODUCT, to_update)
+        # only known once committed, a retried chunk has to create them again
+        for model, names in created_names.items():
+            self.known[model] |= names
+        return len(to_create), len(to_update), len(products) - len(to_create) - len(to_update), image_ids
+
+    def create_missing(self, model, names):
+        missing = names - self.known[model]
+        if missing:
+            model.objects.bulk_create([model(pk=name) for name in missing], ignore_conflicts=True)
+        return missing
+
+    def attach_images(self, image_ids):
+        """copy the images into media storage once their products are committed and build the variants"""
+        attached = 0
+        for product_id, path in image_ids:
+            try:
+                with Image.open(path) as image:
+                    image.verify()
+            except (OSError, SyntaxError):
+                self.stderr.write('product {}: {} is not an image, not attached'.format(product_id, path))
+                continue
+            with open(path, 'rb') as image:
+                name = default_storage.save(
+                    Product._meta.get_field('image').generate_filename(None, os.path.basename(path)), File(image))
+            Product.objects.filter(pk=product_id).update(image=name)
+            refresh_variants(Product.objects.get(pk=product_id))
+            attached += 1
+        return attached
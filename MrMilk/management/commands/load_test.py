@@ -0,0 +1,249 @@
+import json
+import math
+import random
+import re
+import threading
+import time
+import urllib.error
+import urllib.request
+from collections import Counter
+from concurrent.futures import ThreadPoolExecutor
+from urllib.parse import quote
+
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connections
+from django.test import Client
+from django.utils import timezone
+from rest_framework.authtoken.models import Token
+
+from MrMilk.management.commands.generate_dairy_data import PASSWORD, WORDS
+from MrMilk.models import Brand, Category, Order, Product
+
+PREFIX = '/mr_milk/'
+
+
+# every route of MrMilk/urls.py, each builds (method, path, body, token) for one request
+ENDPOINTS = {
+    'login': lambda data, rnd: ('POST', 'login/', {'phone': rnd.choice(data.phones), 'password': PASSWORD}, None),
+    'create_account': lambda data, rnd: ('POST', 'create/', data.new_profile(rnd), None),
+    'products': lambda data, rnd: ('GET', 'products/', None, None),
+    'product_detail': lambda data, rnd: ('GET', 'products/{}/'.format(rnd.choice(data.products)), None, None),
+    'product_category': lambda data, rnd: (
+        'GET', 'products/list/{}/'.format(quote(rnd.choice(data.categories))), None, None),
+    'product_search': lambda data, rnd: ('GET', 'products/search/?q={}'.format(rnd.choice(WORDS)), None, None),
+    'product_filter': lambda data, rnd: (
+        'GET', 'products/filter/?brand={}'.format(quote(rnd.choice(data.brands))), None, None),
+    'categories': lambda data, rnd: ('GET', 'categories/', None, None),
+    'brands': lambda data, rnd: ('GET', 'brands/', None, None),
+    'brand_detail': lambda data, rnd: ('GET', 'brands/{}/'.format(quote(rnd.choice(data.brands))), None, None),
+    'brand_snapshot': lambda data, rnd: ('GET', 'brands/snapshot/', None, None),
+    'users': lambda data, rnd: ('GET', 'users/', None, data.customer_token(rnd)),
+    'user_detail': lambda data, rnd: ('GET', 'users/{}/'.format(rnd.choice(data.customers)), None, None),
+    'customer_orders': lambda data, rnd: ('GET', 'order/{}/'.format(rnd.choice(data.customers)), None, None),
+    'order_history': lambda data, rnd: data.own_history(rnd),
+    'order_placement': lambda data, rnd: ('POST', 'order-detail/', data.new_order(rnd), data.staff_token),
+    'order_detail': lambda data, rnd: (
+        'GET', 'order-detail/{}/'.format(rnd.choice(data.orders)), None, data.staff_token),
+    'catalog_cache': lambda data, rnd: ('GET', 'catalog-cache/', None, data.staff_token),
+    'throttle_stats': lambda data, rnd: ('GET', 'throttle-stats/', None, data.staff_token),
+    'delivery_manifest': lambda data, rnd: ('GET', 'orders/manifest/?stops=0', None, data.staff_token),
+    'sales_analytics': lambda data, rnd: (
+        'GET', 'analytics/sales/?group={}'.format(rnd.choice(('day', 'product', 'brand', 'category'))), None,
+        data.staff_token),
+    'async_products': lambda data, rnd: ('GET', 'async/products/', None, None),
+    'async_categories': lambda data, rnd: ('GET', 'async/categories/', None, None),
+    'async_brands': lambda data, rnd: ('GET', 'async/brands/', None, None),
+}
+# the order list serializes every order in the database at once and the export streams the order lines of
+# the last 30 days, ask for them with --endpoints
+HEAVY_ENDPOINTS = {
+    'order_list': lambda data, rnd: ('GET', 'order/', None, None),
+    'order_export': lambda data, rnd: ('GET', 'orders/export/?type=csv', None, data.staff_token),
+}
+
+
+class Dataset:
+    """ids and tokens picked from the generated data (see generate_dairy_data) that the requests refer to"""
+
+    def __init__(self, customers, phone_start):
+        tokens = list(Token.objects.filter(user__phone__gte=str(phone_start), user__is_active=True)
+                      .order_by('user__phone').values_list('user_id', 'user__phone', 'key', 'user__is_staff')
+                      [:customers])
+        if not tokens:
+            raise CommandError('no generated profiles from phone {}, run generate_dairy_data first'.format(phone_start))
+        staff_tokens = [key for _, _, key, is_staff in tokens if is_staff]
+        if not staff_tokens:
+            raise CommandError('none of the generated profiles is staff')
+        self.staff_token = staff_tokens[0]
+        self.tokens = [(user_id, key) for user_id, _, key, is_staff in tokens if not is_staff]
+        self.customers = [user_id for user_id, _ in self.tokens]
+        self.phones = [phone for _, phone, _, is_staff in tokens if not is_staff]
+        self.products = list(Product.objects.filter(quantity__gte=100).values_list('pk', flat=True)[:1000])
+        # the category route only takes names made of word characters and dashes
+        self.categories = [name for name in Category.objects.values_list('pk', flat=True)
+                           if re.fullmatch(r'[\w-]+', name)]
+        self.brands = list(Brand.objects.values_list('pk', flat=True))
+        self.orders = list(Order.objects.order_by('-pk').values_list('pk', flat=True)[:1000])
+        if not (self.customers and self.products and self.orders):
+            raise CommandError('the database needs customers, products and orders, run generate_dairy_data first')
+        self.signups = iter(range(1, 10 ** 9))
+        self.signup_prefix = int(time.time()) % 10 ** 5
+        self.lock = threading.Lock()
+
+    def customer_token(self, rnd):
+        return rnd.choice(self.tokens)[1]
+
+    def own_history(self, rnd):
+        customer, token = rnd.choice(self.tokens)
+        return 'GET', 'order/{}/history/'.format(customer), None, token
+
+    def new_profile(self, rnd):
+        with self.lock:
+            number = next(self.signups)
+        return {'phone': '5{:05d}{:04d}'.format(self.signup_prefix, number % 10 ** 4), 'name': 'load test',
+                'password': PASSWORD, 'email': 'load{}@example.com'.format(number), 'address': 'load test'}
+
+    def new_order(self, rnd):
+        lines = rnd.sample(self.products, min(len(self.products), rnd.randint(1, 3)))
+        return {'order': {'customer_id': rnd.choice(self.customers), 'order_address': 'load test', 'total': '100.00'},
+                'order_detail': [{'product': product, 'quantity': 1} for product in lines]}
+
+
+class InProcessTransport:
+    """requests go through the Django handler in this process, no sockets or server involved"""
+    name = 'in-process'
+
+    def __init__(self):
+        self.local = threading.local()
+        self.addresses = iter(range(1, 10 ** 9))
+        self.lock = threading.Lock()
+
+    def request(self, method, path, body, token):
+        client = getattr(self.local, 'client', None)
+        if client is None:
+            client = self.local.client = Client(SERVER_NAME='127.0.0.1')
+        with self.lock:
+            address = next(self.addresses)
+        # every request comes from its own address, like many customers would, so the per IP
+        # throttles do not turn the login and sign up runs into a measurement of 429s
+        extra = {'REMOTE_ADDR': '10.{}.{}.{}'.format(address >> 16 & 255, address >> 8 & 255, address & 255)}
+        if token:
+            extra['HTTP_AUTHORIZATION'] = 'Token {}'.format(token)
+        if body is None:
+            response = client.generic(method, PREFIX + path, **extra)
+        else:
+            response = client.generic(method, PREFIX + path, json.dumps(body), 'application/json', **extra)
+        if response.streaming:
+            for _ in response.streaming_content:
+                pass
+        return response.status_code
+
+    def close(self):
+        connections.close_all()
+
+
+class HttpTransport:
+    """requests go over HTTP to a running server, --base-url is where MrMilk is served"""
+    name = 'http'
+
+    def __init__(self, base_url):
+        self.base_url = base_url.rstrip('/') + PREFIX
+
+    def request(self, method, path, body, token):
+        headers = {'Accept': 'application/json'}
+        data = None
+        if body is not None:
+            data = json.dumps(body).encode()
+            headers['Content-Type'] = 'application/json'
+        if token:
+            headers['Authorization'] = 'Token {}'.format(token)
+        request = urllib.request.Request(self.base_url + path, data=data, headers=headers, method=method)
+        try:
+            with urllib.request.urlopen(request, timeout=30) as response:
+                response.read()
+                return response.status
+        except urllib.error.HTTPError as error:
+            return error.code
+
+    def close(self):
+        pass
+
+
+def percentile(latencies, p):
+    """nearest rank percentile of a sorted list"""
+    return latencies[max(0, math.ceil(p / 100 * len(latencies)) - 1)]
+
+
+class Command(BaseCommand):
+    help = 'Load test every MrMilk route against generated data, report p50/p95/p99 and throughput per endpoint'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--base-url', help='load a running server, e.g. http://127.0.0.1:8000, '
+                                               'the requests run in this process without it')
+        parser.add_argument('--endpoints', help='comma separated endpoints, all but {} by default, one of {}'.format(
+            ', '.join(HEAVY_ENDPOINTS), ', '.join(list(ENDPOINTS) + list(HEAVY_ENDPOINTS))))
+        parser.add_argument('--requests', type=int, default=200, help='measured requests per endpoint')
+        parser.add_argument('--warmup', type=int, default=10, help='requests per endpoint before measuring')
+        parser.add_argument('--concurrency', type=int, default=8)
+        parser.add_argument('--customers', type=int, default=200, help='generated profiles the requests act as')
+        parser.add_argument('--phone-start', type=int, default=7000000000,
+                            help='phone number of the first generated profile, as given to generate_dairy_data')
+        parser.add_argument('--seed', type=int, default=1)
+        parser.add_argument('--output', default='load_test_results.json', help='where the JSON results are written')
+
+    def handle(self, *args, **options):
+        endpoints = dict(ENDPOINTS, **HEAVY_ENDPOINTS)
+        names = options['endpoints'].split(',') if options['endpoints'] else list(ENDPOINTS)
+        unknown = [name for name in names if name not in endpoints]
+        if unknown:
+            raise CommandError('unknown endpoints {}'.format(', '.join(unknown)))
+        data = Dataset(options['customers'], options['phone_start'])
+        transport = HttpTransport(options['base_url']) if options['base_url'] else InProcessTransport()
+        results = {'started': timezone.now().isoformat(), 'transport': transport.name,
+                   'concurrency': options['concurrency'], 'requests': options['requests'], 'endpoints': {}}
+        self.stdout.write('{:<17} {:>9} {:>8} {:>8} {:>8} {:>7}  {}'.format(
+            'endpoint', 'req/s', 'p50 ms', 'p95 ms', 'p99 ms', 'errors', 'statuses'))
+        for name in names:
+            build = endpoints[name]
+            rnd = random.Random('{}-{}'.format(options['seed'], name))
+            requests = [build(data, rnd) for _ in range(options['warmup'] + options['requests'])]
+            self.run(transport, requests[:options['warmup']], options['concurrency'])
+            result = self.run(transport, requests[options['warmup']:], options['concurrency'])
+            results['endpoints'][name] = result
+            self.stdout.write('{:<17} {:>9.1f} {:>8.1f} {:>8.1f} {:>8.1f} {:>7}  {}'.format(
+                name, result['throughput'], result['p50_ms'], result['p95_ms'], result['p99_ms'], result['errors'],
+                ' '.join('{}x{}'.format(code, count) for code, count in sorted(result['statuses'].items()))))
+        with open(options['output'], 'w') as output:
+            json.dump(results, output, indent=2)
+        self.stdout.write(self.style.SUCCESS('results written to {}'.format(options['output'])))
+
+    @staticmethod
+    def run(transport, requests, concurrency):
+        def call(request):
+            started = time.perf_counter()
+            try:
+                status = transport.request(*request)
+            except Exception:
+                status = 'failed'
+            return time.perf_counter() - started, status
+
+        def worker(chunk):
+            try:
+                return [call(request) for request in chunk]
+            finally:
+                transport.close()
+
+        if not requests:
+            return None
+        chunks = [requests[index::concurrency] for index in range(concurrency)]
+        with ThreadPoolExecutor(max_workers=concurrency) as pool:
+            started = time.perf_counter()
+            timings = [timing for chunk in pool.map(worker, chunks) for timing in chunk]
+            elapsed = time.perf_counter() - started
+        latencies = sorted(latency * 1000 for latency, _ in timings)
+        statuses = Counter(str(status) for _, status in timings)
+        return {'throughput': len(timings) / elapsed, 'mean_ms': sum(latencies) / len(latencies),
+                'p50_ms': percentile(latencies, 50), 'p95_ms': percentile(latencies, 95),
+                'p99_ms': percentile(latencies, 99), 'max_ms': latencies[-1],
+                'errors': sum(count for status, count in statuses.items() if not status.isdigit() or status >= '500'),
+                'statuses': dict(statuses)}
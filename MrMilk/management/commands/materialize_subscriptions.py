@@ -0,0 +1,34 @@
+import datetime
+import time
+
+from django.core.management.base import BaseCommand, CommandError
+from django.utils import timezone
+
+from MrMilk.subscriptions import materialize_subscriptions
+
+
+class Command(BaseCommand):
+    help = 'Create the orders for every subscription that delivers on the given date, safe to run again'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--date', help='delivery date as YYYY-MM-DD, defaults to tomorrow')
+        parser.add_argument('--chunk-size', type=int, default=500, help='subscribers per transaction')
+
+    def handle(self, *args, **options):
+        if options['date']:
+            try:
+                delivery_date = datetime.date.fromisoformat(options['date'])
+            except ValueError:
+                raise CommandError('date has to be YYYY-MM-DD')
+        else:
+            delivery_date = timezone.localdate() + datetime.timedelta(1)
+
+        started = time.perf_counter()
+        orders, subscriptions, out_of_stock = materialize_subscriptions(delivery_date,
+                                                                        chunk_size=options['chunk_size'])
+        self.stdout.write(self.style.SUCCESS('{} orders for {} subscriptions on {} in {:.2f}s'.format(
+            orders, subscriptions, delivery_date, time.perf_counter() - started)))
+        if out_of_stock:
+            self.stdout.write(self.style.WARNING(
+                '{} subscriptions left due, their products are out of stock, run again once they are restocked'
+                .format(out_of_stock)))
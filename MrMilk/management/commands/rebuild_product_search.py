@@ -0,0 +1,21 @@
+import time
+
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connection, transaction
+
+from MrMilk.search import rebuild_search_index
+
+
+class Command(BaseCommand):
+    help = 'Rebuild the full-text product search table and its sync triggers from the product table'
+
+    def handle(self, *args, **options):
+        if connection.vendor != 'sqlite':
+            raise CommandError('product search needs SQLite FTS5')
+        started = time.perf_counter()
+        with transaction.atomic(), connection.cursor() as cursor:
+            rebuild_search_index(cursor)
+            cursor.execute('SELECT count(*) FROM "MrMilk_product_search"')
+            indexed = cursor.fetchone()[0]
+        self.stdout.write(self.style.SUCCESS('{} products indexed in {:.2f}s'.format(
+            indexed, time.perf_counter() - started)))
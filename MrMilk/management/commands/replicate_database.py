@@ -0,0 +1,27 @@
+import time
+
+from django.conf import settings
+from django.core.management.base import BaseCommand, CommandError
+
+from MrMilk.replication import Replicator
+from MrMilk.routers import REPLICA_DB_ALIAS
+
+
+class Command(BaseCommand):
+    help = 'Copy the primary SQLite database over the read replica, once or every --interval seconds'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--interval', type=float, default=getattr(settings, 'REPLICA_SYNC_INTERVAL', 5),
+                            help='seconds between copies')
+        parser.add_argument('--once', action='store_true', help='copy once and stop')
+
+    def handle(self, *args, **options):
+        if REPLICA_DB_ALIAS not in settings.DATABASES:
+            raise CommandError('no {} database in settings.DATABASES'.format(REPLICA_DB_ALIAS))
+        replicator = Replicator()
+        while True:
+            seconds = replicator.sync()
+            self.stdout.write('replica in step in {:.3f}s'.format(seconds))
+            if options['once']:
+                return
+            time.sleep(options['interval'])
@@ -0,0 +1,101 @@
+import random
+import threading
+import time
+from decimal import Decimal
+
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connections, OperationalError
+
+from MrMilk.inventory import OutOfStock
+from MrMilk.models import Profile, Category, SubCategory, Brand, Product, Order, OrderDetail
+from MrMilk.serializers import OrderPlacementSerializer
+
+
+class Command(BaseCommand):
+    help = 'Place orders for one hot product from many threads and check that stock is never oversold'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--threads', type=int, default=8)
+        parser.add_argument('--orders', type=int, default=100, help='orders attempted per thread')
+        parser.add_argument('--stock', type=int, default=500, help='starting quantity of the hot product')
+        parser.add_argument('--quantity', type=int, default=1, help='units of the hot product per order')
+
+    def handle(self, *args, **options):
+        customer, hot, other = self.make_fixtures(options['stock'])
+        counts = {'placed': 0, 'out_of_stock': 0, 'locked': 0}
+        errors = []
+        counts_lock = threading.Lock()
+        payload = {
+            'order': {'customer_id': customer.pk, 'order_address': 'stress address', 'total': '50.00'},
+            'order_detail': [{'product': hot.pk, 'quantity': options['quantity']},
+                             {'product': other.pk, 'quantity': 1}],
+        }
+
+        def place_orders():
+            try:
+                for _ in range(options['orders']):
+                    serializer = OrderPlacementSerializer(data=payload)
+                    serializer.is_valid(raise_exception=True)
+                    try:
+                        serializer.save()
+                        outcome = 'placed'
+                    except OutOfStock:
+                        outcome = 'out_of_stock'
+                    except OperationalError:
+                        outcome = 'locked'
+                    with counts_lock:
+                        counts[outcome] += 1
+            except Exception as error:
+                # a thread that dies must fail the run, not leave it looking like nothing was oversold
+                with counts_lock:
+                    errors.append(error)
+            finally:
+                connections.close_all()
+
+        threads = [threading.Thread(target=place_orders) for _ in range(options['threads'])]
+        started = time.perf_counter()
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        elapsed = time.perf_counter() - started
+
+        try:
+            hot.refresh_from_db()
+            sold = OrderDetail.objects.filter(product=hot).count() * options['quantity']
+            attempts = options['threads'] * options['orders']
+            self.stdout.write('{placed} placed, {out_of_stock} out of stock, {locked} database locked'.format(**counts))
+            self.stdout.write('{} attempts in {:.2f}s, {:.1f} orders/s'.format(attempts, elapsed, attempts / elapsed))
+            self.stdout.write('stock {} -> {}, {} units on orders'.format(options['stock'], hot.quantity, sold))
+            if errors:
+                raise CommandError('{} of {} threads failed, the first with {!r}'.format(
+                    len(errors), options['threads'], errors[0]))
+            if not counts['placed']:
+                raise CommandError('no order was placed, nothing was tested')
+            if hot.quantity < 0 or sold != options['stock'] - hot.quantity or \
+                    sold != counts['placed'] * options['quantity']:
+                raise CommandError('stock and orders do not add up, product was oversold')
+            self.stdout.write(self.style.SUCCESS('no oversell'))
+        finally:
+            Order.objects.filter(customer_id=customer).delete()
+            Category.objects.filter(pk='stress-category').delete()
+            SubCategory.objects.filter(pk='stress-sub-category').delete()
+            Brand.objects.filter(pk='stress-brand').delete()
+            customer.delete()
+
+    @staticmethod
+    def make_fixtures(stock):
+        # a phone number of nobody else, the fixtures are deleted again when the run ends
+        phone = '9{:09d}'.format(random.randrange(10 ** 9))
+        while Profile.objects.filter(phone=phone).exists():
+            phone = '9{:09d}'.format(random.randrange(10 ** 9))
+        customer = Profile.objects.create_user(phone=phone, name='stress', email='stress@example.com',
+                                               password='stress-password', address='stress address')
+        category = Category.objects.create(category_name='stress-category')
+        sub_category = SubCategory.objects.create(sub_category_name='stress-sub-category')
+        brand = Brand.objects.create(brand_name='stress-brand')
+        hot = Product.objects.create(product_name='stress-milk', category=category, sub_category=sub_category,
+                                     brand=brand, price=Decimal('25'), quantity=stock)
+        other = Product.objects.create(product_name='stress-curd', category=category, sub_category=sub_category,
+                                       brand=brand, price=Decimal('25'), quantity=1000000)
+        return customer, hot, other
@@ -0,0 +1,126 @@
+"""
+Serves MEDIA_ROOT in production.
+With MEDIA_SENDFILE set the worker only checks the file and hands delivery to the front proxy through
+X-Accel-Redirect (nginx) or X-Sendfile (apache, lighttpd), otherwise the file is returned as a FileResponse
+that gunicorn sends with sendfile(). Range requests, If-Modified-Since and cache headers are handled here,
+content-hashed image variants are cached by clients for a year.
+"""
+
+import mimetypes
+import os
+import re
+import stat
+from urllib.parse import quote
+
+from django.conf import settings
+from django.core.exceptions import SuspiciousFileOperation
+from django.http import FileResponse, Http404, HttpResponse, HttpResponseNotModified
+from django.utils._os import safe_join
+from django.utils.http import http_date
+from django.views.decorators.http import require_safe
+from django.views.static import was_modified_since
+
+RANGE_RE = re.compile(r'^bytes=(\d*)-(\d*)$')
+IMMUTABLE_PREFIXES = ('variants/',)
+IMMUTABLE_MAX_AGE = 365 * 24 * 60 * 60
+
+
+class FileRange:
+    """file-like view of length bytes from start, keeps fileno() so the range can still go out through sendfile()"""
+
+    def __init__(self, file, start, length):
+        file.seek(start)
+        self.file = file
+        self.remaining = length
+
+    def read(self, size=-1):
+        if self.remaining <= 0:
+            return b''
+        size = self.remaining if size is None or size < 0 else min(size, self.remaining)
+        data = self.file.read(size)
+        self.remaining -= len(data)
+        return data
+
+    def fileno(self):
+        return self.file.fileno()
+
+    def close(self):
+        self.file.close()
+
+
+def parse_range(header, size):
+    """(start, end) of a single byte range, None to send the whole file, ValueError when it can not be satisfied"""
+    match = RANGE_RE.match(header or '')
+    if match is None:
+        return None
+    first, last = match.groups()
+    if not first and not last:
+        return None
+    if not first:
+        # suffix range, the last N bytes
+        start, end = max(size - int(last), 0), size - 1
+    else:
+        start, end = int(first), min(int(last), size - 1) if last else size - 1
+    if start >= size or start > end:
+        raise ValueError('range not satisfiable')
+    return start, end
+
+
+def cache_control(path):
+    if path.startswith(IMMUTABLE_PREFIXES):
+        return 'public, max-age={}, immutable'.format(IMMUTABLE_MAX_AGE)
+    return 'public, max-age={}'.format(getattr(settings, 'MEDIA_CACHE_MAX_AGE', 24 * 60 * 60))
+
+
+@require_safe
+def serve_media(request, path):
+    try:
+        full_path = safe_join(settings.MEDIA_ROOT, path)
+        stat_result = os.stat(full_path)
+    except (SuspiciousFileOperation, FileNotFoundError, NotADirectoryError):
+        raise Http404('"{}" does not exist'.format(path))
+    if not stat.S_ISREG(stat_result.st_mode):
+        raise Http404('"{}" does not exist'.format(path))
+
+    last_modified = http_date(stat_result.st_mtime)
+    if not was_modified_since(request.META.get('HTTP_IF_MODIFIED_SINCE'), stat_result.st_mtime, stat_result.st_size):
+        response = HttpResponseNotModified()
+        response['Last-Modified'] = last_modified
+        response['Cache-Control'] = cache_control(path)
+        return response
+
+    content_type = mimetypes.guess_type(full_path)[0] or 'application/octet-stream'
+    backend = getattr(settings, 'MEDIA_SENDFILE', None)
+    if backend == 'x-accel-redirect':
+        response = HttpResponse(content_type=content_type)
+        response['X-Accel-Redirect'] = quote(settings.MEDIA_ACCEL_REDIRECT_PREFIX + path)
+    elif backend == 'x-sendfile':
+        response = HttpResponse(content_type=content_type)
+        response['X-Sendfile'] = full_path
+    else:
+        response = file_response(request, full_path, stat_result.st_size, content_type, last_modified)
+    response['Last-Modified'] = last_modified
+    response['Cache-Control'] = cache_control(path)
+    return response
+
+
+def file_response(request, full_path, size, content_type, last_modified):
+    if_range = request.META.get('HTTP_IF_RANGE')
+    try:
+        byte_range = parse_range(request.META.get('HTTP_RANGE'), size) \
+            if if_range is None or if_range == last_modified else None
+    except ValueError:
+        response = HttpResponse(status=416)
+        response['Content-Range'] = 'bytes */{}'.format(size)
+        return response
+
+    file = open(full_path, 'rb')
+    if byte_range is None:
+        response = FileResponse(file, content_type=content_type)
+    else:
+        start, end = byte_range
+        response = FileResponse(FileRange(file, start, end - start + 1), status=206, content_type=content_type)
+        response['Content-Length'] = end - start + 1
+        response['Content-Range'] = 'bytes {}-{}/{}'.format(start, end, size)
+    response['Accept-Ranges'] = 'bytes'
+    return response
@@ -0,0 +1,278 @@
+"""
+Prometheus metrics of the HTTP routes, aggregated over every worker process without an outside service.
+Each process keeps its numbers in memory and writes them at most every METRICS_FLUSH_INTERVAL seconds to
+its own file in METRICS_DIR, replaced atomically. /metrics sums the files of all processes, counters and
+histograms of finished processes included so they never go backwards, in-flight gauges of live ones only.
+The files of finished processes are added to a single totals file and removed, so METRICS_DIR keeps one file
+per live worker however often workers are restarted.
+/metrics only answers the addresses in METRICS_ALLOWED_IPS, the route and error numbers are not public.
+Routes are labelled with their URL name, the database numbers come from SQLInstrumentationMiddleware.
+"""
+
+import asyncio
+import atexit
+import fcntl
+import glob
+import json
+import os
+import threading
+import time
+
+from django.conf import settings
+from django.http import HttpResponse, HttpResponseForbidden
+
+TOTALS_FILE = 'totals.json'
+# the method label comes from the client, anything else would add a series per made up method
+HTTP_METHODS = {'GET', 'HEAD', 'POST', 'PUT', 'PATCH', 'DELETE', 'OPTIONS', 'TRACE', 'CONNECT'}
+BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, float('inf'))
+
+METRICS = {
+    'mrmilk_http_requests_total': ('counter', 'Requests served by URL name, method and status'),
+    'mrmilk_http_request_duration_seconds': ('histogram', 'Time spent serving a request by URL name'),
+    'mrmilk_http_requests_in_flight': ('gauge', 'Requests being served right now'),
+    'mrmilk_http_errors_total': ('counter', 'Responses with a 5xx status by URL name and status'),
+    'mrmilk_http_db_seconds_total': ('counter', 'Time spent in SQL by URL name'),
+    'mrmilk_http_db_queries_total': ('counter', 'SQL queries run by URL name'),
+}
+
+
+def format_le(bound):
+    return '+Inf' if bound == float('inf') else repr(bound)
+
+
+class Registry:
+    """the numbers of this process, keyed by (sample name, sorted label pairs)"""
+
+    def __init__(self, interval):
+        self.interval = interval
+        self.pid = None
+        self.name = None
+        self.samples = {}
+        self.in_flight = 0
+        self.flushed_in_flight = 0
+        self.last_flush = 0.0
+        self.lock = threading.Lock()
+
+    @property
+    def directory(self):
+        # read at every write, tests point it at a directory of their own with override_settings
+        return getattr(settings, 'METRICS_DIR', os.path.join(settings.BASE_DIR, 'metrics'))
+
+    def claim(self):
+        # gunicorn --preload imports this module before forking the workers, each of them needs its own file
+        # and must not report numbers the parent had before the fork
+        if self.pid != os.getpid():
+            self.pid = os.getpid()
+            self.name = '{}-{}.json'.format(self.pid, int(time.time() * 1000))
+            self.samples = {}
+            self.in_flight = 0
+            self.flushed_in_flight = 0
+            self.last_flush = 0.0
+
+    def inc(self, name, labels, amount=1):
+        key = (name, tuple(sorted(labels.items())))
+        self.samples[key] = self.samples.get(key, 0) + amount
+
+    def started(self):
+        with self.lock:
+            self.claim()
+            self.in_flight += 1
+
+    def finished(self, view, method, status, seconds, queries=None, sql_seconds=None):
+        with self.lock:
+            self.in_flight -= 1
+            self.inc('mrmilk_http_requests_total', {'view': view, 'method': method, 'status': str(status)})
+            if status >= 500:
+                self.inc('mrmilk_http_errors_total', {'view': view, 'status': str(status)})
+            for bound in BUCKETS:
+                if seconds <= bound:
+                    self.inc('mrmilk_http_request_duration_seconds_bucket', {'view': view, 'le': format_le(bound)})
+            self.inc('mrmilk_http_request_duration_seconds_sum', {'view': view}, seconds)
+            self.inc('mrmilk_http_request_duration_seconds_count', {'view': view})
+            if queries is not None:
+                self.inc('mrmilk_http_db_queries_total', {'view': view}, queries)
+                self.inc('mrmilk_http_db_seconds_total', {'view': view}, sql_seconds)
+            # an idle worker must not keep reporting the requests it had in flight at its last write
+            due = time.monotonic() - self.last_flush >= self.interval
+            if due or (self.in_flight == 0 and self.flushed_in_flight):
+                self.flush_locked()
+
+    def flush(self):
+        with self.lock:
+            self.flush_locked()
+
+    def flush_locked(self):
+        self.claim()
+        if not (self.samples or self.in_flight or self.flushed_in_flight):
+            # nothing to report, e.g. a management command that served no request
+            return
+        state = {'pid': os.getpid(), 'in_flight': self.in_flight,
+                 'samples': [[name, labels, value] for (name, labels), value in self.samples.items()]}
+        os.makedirs(self.directory, exist_ok=True)
+        write_state(os.path.join(self.directory, self.name), state)
+        self.flushed_in_flight = self.in_flight
+        self.last_flush = time.monotonic()
+
+
+registry = Registry(getattr(settings, 'METRICS_FLUSH_INTERVAL', 1.0))
+atexit.register(registry.flush)
+
+
+def process_alive(pid):
+    try:
+        os.kill(pid, 0)
+    except ProcessLookupError:
+        return False
+    except PermissionError:
+        pass
+    return True
+
+
+def read_state(path):
+    try:
+        with open(path) as source:
+            return json.load(source)
+    except (OSError, ValueError):
+        # a file is only ever replaced whole, this one went away between glob and open
+        return None
+
+
+def write_state(path, state):
+    temporary = '{}.tmp'.format(path)
+    with open(temporary, 'w') as output:
+        json.dump(state, output)
+    os.replace(temporary, path)
+
+
+def add_samples(samples, state):
+    for name, labels, value in state['samples']:
+        key = (name, tuple(tuple(pair) for pair in labels))
+        samples[key] = samples.get(key, 0) + value
+
+
+def remove_files(directory, names):
+    for name in names:
+        try:
+            os.remove(os.path.join(directory, name))
+        except FileNotFoundError:
+            pass
+
+
+def collect(directory):
+    """
+    samples of every process file in directory summed up, {(name, labels): value}.
+    The files of dead processes are moved into the totals file on the way.
+    """
+    # one collect at a time, two of them merging the same file would count it twice or lose it
+    with open(os.path.join(directory, '.lock'), 'w') as lock:
+        fcntl.flock(lock, fcntl.LOCK_EX)
+        totals_path = os.path.join(directory, TOTALS_FILE)
+        totals = read_state(totals_path) or {'samples': [], 'merged': []}
+        # the totals hold these already, a collect stopped between writing the totals and removing them
+        remove_files(directory, totals['merged'])
+        samples = {}
+        add_samples(samples, totals)
+        live = {}
+        in_flight = 0
+        dead = []
+        for path in glob.glob(os.path.join(directory, '*.json')):
+            if os.path.basename(path) == TOTALS_FILE:
+                continue
+            state = read_state(path)
+            if state is None:
+                continue
+            if process_alive(state['pid']):
+                add_samples(live, state)
+                in_flight += state['in_flight']
+            else:
+                add_samples(samples, state)
+                dead.append(os.path.basename(path))
+        if dead:
+            write_state(totals_path, {'samples': [[name, labels, value] for (name, labels), value in samples.items()],
+                                      'merged': dead})
+            remove_files(directory, dead)
+    for key, value in live.items():
+        samples[key] = samples.get(key, 0) + value
+    samples[('mrmilk_http_requests_in_flight', ())] = in_flight
+    return samples
+
+
+def escape(value):
+    return value.replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n')
+
+
+def sample_order(item):
+    # buckets of a histogram go up by their bound, not in the string order of it
+    (name, labels), _ = item
+    return name, [(key, float(label)) if key == 'le' else (key, label) for key, label in labels]
+
+
+def exposition(samples):
+    """samples in the Prometheus text format"""
+    lines = []
+    for metric, (kind, help_text) in METRICS.items():
+        lines.append('# HELP {} {}'.format(metric, help_text))
+        lines.append('# TYPE {} {}'.format(metric, kind))
+        names = [metric + suffix for suffix in ('_bucket', '_sum', '_count')] if kind == 'histogram' else [metric]
+        for name in names:
+            for (sample, labels), value in sorted(samples.items(), key=sample_order):
+                if sample != name:
+                    continue
+                if labels:
+                    label_text = '{' + ','.join('{}="{}"'.format(key, escape(label)) for key, label in labels) + '}'
+                else:
+                    label_text = ''
+                lines.append('{}{} {}'.format(name, label_text, repr(float(value))))
+    return '\n'.join(lines) + '\n'
+
+
+class MetricsMiddleware:
+    """times every request, goes before SQLInstrumentationMiddleware to pick up the SQL numbers it leaves"""
+    sync_capable = True
+    async_capable = True
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+        self.is_async = asyncio.iscoroutinefunction(get_response)
+        if self.is_async:
+            # how Django's MiddlewareMixin tells the handler to await this middleware
+            self._is_coroutine = asyncio.coroutines._is_coroutine
+
+    def __call__(self, request):
+        if self.is_async:
+            return self.__acall__(request)
+        registry.started()
+        started = time.perf_counter()
+        status = 500
+        try:
+            response = self.get_response(request)
+            status = response.status_code
+            return response
+        finally:
+            self.finished(request, status, started)
+
+    async def __acall__(self, request):
+        registry.started()
+        started = time.perf_counter()
+        status = 500
+        try:
+            response = await self.get_response(request)
+            status = response.status_code
+            return response
+        finally:
+            self.finished(request, status, started)
+
+    def finished(self, request, status, started):
+        match = getattr(request, 'resolver_match', None)
+        recorder = getattr(request, 'sql_recorder', None)
+        method = request.method if request.method in HTTP_METHODS else 'other'
+        registry.finished(match.url_name or match.view_name if match else 'unmatched', method,
+                          status, time.perf_counter() - started,
+                          recorder.count if recorder else None, recorder.seconds if recorder else None)
+
+
+def metrics_view(request):
+    if request.META.get('REMOTE_ADDR') not in getattr(settings, 'METRICS_ALLOWED_IPS', ('127.0.0.1', '::1')):
+        return HttpResponseForbidden()
+    registry.flush()
+    return HttpResponse(exposition(collect(registry.directory)), content_type='text/plain; version=0.0.4')
@@ -0,0 +1,25 @@
+# Generated by Django 3.1.12 on 2026-10-18 11:56
+
+import MrMilk.models
+from django.db import migrations, models
+import django.utils.timezone
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('MrMilk', '0011_auto_20200927_1735'),
+    ]
+
+    operations = [
+        migrations.AlterField(
+            model_name='order',
+            name='delivery_date',
+            field=models.DateField(default=MrMilk.models.default_delivery_date),
+        ),
+        migrations.AlterField(
+            model_name='order',
+            name='order_date',
+            field=models.DateTimeField(default=django.utils.timezone.now),
+        ),
+    ]
@@ -0,0 +1,18 @@
+# Generated by Django 3.1.12 on 2026-10-18 12:02
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('MrMilk', '0013_order_last_modified'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='subscription',
+            name='last_delivered_on',
+            field=models.DateField(blank=True, null=True),
+        ),
+    ]
@@ -0,0 +1,107 @@
+from django.db import migrations, models
+import django.utils.timezone
+from django.db.models import Case, Value, When
+
+WEEKDAYS = ('monday', 'tuesday', 'wednesday', 'thursday', 'friday', 'saturday', 'sunday')
+
+
+def flags_to_bitmask(apps, schema_editor):
+    Subscription = apps.get_model('MrMilk', 'Subscription')
+    delivery_days = Value(0)
+    for bit, weekday in enumerate(WEEKDAYS):
+        delivery_days = delivery_days + Case(When(**{weekday: '1'}, then=Value(1 << bit)), default=Value(0))
+    Subscription.objects.update(delivery_days=delivery_days)
+
+
+def bitmask_to_flags(apps, schema_editor):
+    Subscription = apps.get_model('MrMilk', 'Subscription')
+    for bit, weekday in enumerate(WEEKDAYS):
+        schedules = [schedule for schedule in range(1 << len(WEEKDAYS)) if schedule & (1 << bit)]
+        Subscription.objects.update(**{weekday: Case(When(delivery_days__in=schedules, then=Value('1')),
+                                                      default=Value('0'),
+                                                      output_field=models.CharField())})
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('MrMilk', '0014_subscription_last_delivered_on'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='subscription',
+            name='delivery_days',
+            field=models.PositiveSmallIntegerField(db_index=True, default=0),
+        ),
+        # a default on the flags lets the migration be reversed, the columns are added back before they are filled
+        migrations.AlterField(
+            model_name='subscription',
+            name='friday',
+            field=models.CharField(choices=[('1', 'Yes'), ('0', 'No')], default='0', max_length=100),
+        ),
+        migrations.AlterField(
+            model_name='subscription',
+            name='monday',
+            field=models.CharField(choices=[('1', 'Yes'), ('0', 'No')], default='0', max_length=100),
+        ),
+        migrations.AlterField(
+            model_name='subscription',
+            name='saturday',
+            field=models.CharField(choices=[('1', 'Yes'), ('0', 'No')], default='0', max_length=100),
+        ),
+        migrations.AlterField(
+            model_name='subscription',
+            name='sunday',
+            field=models.CharField(choices=[('1', 'Yes'), ('0', 'No')], default='0', max_length=100),
+        ),
+        migrations.AlterField(
+            model_name='subscription',
+            name='thursday',
+            field=models.CharField(choices=[('1', 'Yes'), ('0', 'No')], default='0', max_length=100),
+        ),
+        migrations.AlterField(
+            model_name='subscription',
+            name='tuesday',
+            field=models.CharField(choices=[('1', 'Yes'), ('0', 'No')], default='0', max_length=100),
+        ),
+        migrations.AlterField(
+            model_name='subscription',
+            name='wednesday',
+            field=models.CharField(choices=[('1', 'Yes'), ('0', 'No')], default='0', max_length=100),
+        ),
+        migrations.RunPython(flags_to_bitmask, bitmask_to_flags),
+        migrations.RemoveField(
+            model_name='subscription',
+            name='friday',
+        ),
+        migrations.RemoveField(
+            model_name='subscription',
+            name='monday',
+        ),
+        migrations.RemoveField(
+            model_name='subscription',
+            name='saturday',
+        ),
+        migrations.RemoveField(
+            model_name='subscription',
+            name='sunday',
+        ),
+        migrations.RemoveField(
+            model_name='subscription',
+            name='thursday',
+        ),
+        migrations.RemoveField(
+            model_name='subscription',
+            name='tuesday',
+        ),
+        migrations.RemoveField(
+            model_name='subscription',
+            name='wednesday',
+        ),
+        migrations.AlterField(
+            model_name='subscription',
+            name='start_date',
+            field=models.DateField(default=django.utils.timezone.localdate),
+        ),
+    ]
@@ -0,0 +1,17 @@
+# Generated by Django 3.1.12 on 2026-10-18 12:05
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('MrMilk', '0015_subscription_delivery_days'),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='order',
+            index=models.Index(fields=['customer_id', 'order_date'], name='order_customer_date_idx'),
+        ),
+    ]
@@ -0,0 +1,56 @@
+from django.db import migrations
+
+# a copy of the statements in MrMilk.search as they were when this migration was written, later changes to
+# the search table go in migrations of their own
+CREATE_SEARCH = [
+    """CREATE VIRTUAL TABLE IF NOT EXISTS "MrMilk_product_search" USING fts5(
+        product_name, brand, category, sub_category,
+        tokenize = 'unicode61 remove_diacritics 2', prefix = '2 3')""",
+    """CREATE TRIGGER IF NOT EXISTS "MrMilk_product_search_insert" AFTER INSERT ON "MrMilk_product" BEGIN
+        INSERT INTO "MrMilk_product_search" (rowid, product_name, brand, category, sub_category)
+        VALUES (new.id, new.product_name, new.brand_id, new.category_id, new.sub_category_id);
+    END""",
+    """CREATE TRIGGER IF NOT EXISTS "MrMilk_product_search_delete" AFTER DELETE ON "MrMilk_product" BEGIN
+        DELETE FROM "MrMilk_product_search" WHERE rowid = old.id;
+    END""",
+    """CREATE TRIGGER IF NOT EXISTS "MrMilk_product_search_update"
+        AFTER UPDATE OF product_name, brand_id, category_id, sub_category_id ON "MrMilk_product" BEGIN
+        DELETE FROM "MrMilk_product_search" WHERE rowid = old.id;
+        INSERT INTO "MrMilk_product_search" (rowid, product_name, brand, category, sub_category)
+        VALUES (new.id, new.product_name, new.brand_id, new.category_id, new.sub_category_id);
+    END""",
+]
+
+FILL_SEARCH = """INSERT INTO "MrMilk_product_search" (rowid, product_name, brand, category, sub_category)
+    SELECT id, product_name, brand_id, category_id, sub_category_id FROM "MrMilk_product\""""
+
+DROP_SEARCH = [
+    'DROP TRIGGER IF EXISTS "MrMilk_product_search_insert"',
+    'DROP TRIGGER IF EXISTS "MrMilk_product_search_delete"',
+    'DROP TRIGGER IF EXISTS "MrMilk_product_search_update"',
+    'DROP TABLE IF EXISTS "MrMilk_product_search"',
+]
+
+
+def create_search(apps, schema_editor):
+    # FTS5 is SQLite only, other databases keep working without the search index
+    if schema_editor.connection.vendor == 'sqlite':
+        for statement in CREATE_SEARCH + [FILL_SEARCH]:
+            schema_editor.execute(statement)
+
+
+def drop_search(apps, schema_editor):
+    if schema_editor.connection.vendor == 'sqlite':
+        for statement in DROP_SEARCH:
+            schema_editor.execute(statement)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('MrMilk', '0017_image_hash'),
+    ]
+
+    operations = [
+        migrations.RunPython(create_search, drop_search),
+    ]
@@ -0,0 +1,18 @@
+# Generated by Django 3.1.12 on 2026-10-18 12:20
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('MrMilk', '0018_product_search'),
+    ]
+
+    operations = [
+        migrations.AlterField(
+            model_name='order',
+            name='total',
+            field=models.DecimalField(decimal_places=2, max_digits=8),
+        ),
+    ]
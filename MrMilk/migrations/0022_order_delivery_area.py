@@ -0,0 +1,59 @@
+# Generated by Django 3.1.12 on 2026-10-18 12:33
+
+import re
+from collections import defaultdict
+
+from django.db import migrations, models
+
+PINCODE = re.compile(r'(?<!\d)([1-9]\d{2})\s?(\d{3})(?!\d)')
+
+
+def delivery_area(address):
+    # a copy of MrMilk.models.delivery_area as it was when this migration was written
+    pincodes = PINCODE.findall(address or '')
+    if pincodes:
+        return ''.join(pincodes[-1])
+    parts = [part for part in (re.sub(r'[^\w\s]', ' ', part).strip() for part in (address or '').split(',')) if part]
+    if not parts:
+        return ''
+    locality = parts[-2] if len(parts) > 2 else parts[-1]
+    return ' '.join(locality.lower().split())[:60]
+
+
+def fill_delivery_area(apps, schema_editor):
+    Order = apps.get_model('MrMilk', 'Order')
+    orders = Order.objects.using(schema_editor.connection.alias)
+    last = 0
+    while True:
+        chunk = list(orders.filter(pk__gt=last).order_by('pk').values_list('pk', 'order_address')[:2000])
+        if not chunk:
+            return
+        # one UPDATE per area of the chunk, a chunk of orders comes from far fewer areas
+        areas = defaultdict(list)
+        for pk, address in chunk:
+            areas[delivery_area(address)].append(pk)
+        for area, pks in areas.items():
+            if area:
+                orders.filter(pk__in=pks).update(delivery_area=area)
+        last = chunk[-1][0]
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('MrMilk', '0021_dailysales'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='order',
+            name='delivery_area',
+            field=models.CharField(blank=True, editable=False, max_length=60),
+        ),
+        # filled before the index is built, so the index is written once
+        migrations.RunPython(fill_delivery_area, migrations.RunPython.noop),
+        migrations.AddIndex(
+            model_name='order',
+            index=models.Index(fields=['delivery_date', 'order_status', 'delivery_area'], name='order_delivery_idx'),
+        ),
+    ]
@@ -10,9 +10,33 @@ from django.contrib.auth.base_user import AbstractBaseUser, BaseUserManager
 from django.core.validators import MinValueValidator, RegexValidator
 from django.db import models
 import datetime
+import re
 from django.utils import timezone
 
 
+def default_delivery_date():
+    return timezone.localdate() + datetime.timedelta(1)
+
+
+PINCODE = re.compile(r'(?<!\d)([1-9]\d{2})\s?(\d{3})(?!\d)')
+
+
+def delivery_area(address):
+    """
+    the area an address is delivered in: its 6 digit pincode, or without one the locality, the part before
+    the city ("12 3rd Main, Koramangala, Bengaluru" is "koramangala"), lower case with single spaces
+    """
+    pincodes = PINCODE.findall(address or '')
+    if pincodes:
+        # the pincode closes an address, a house number that looks like one comes earlier
+        return ''.join(pincodes[-1])
+    parts = [part for part in (re.sub(r'[^\w\s]', ' ', part).strip() for part in (address or '').split(',')) if part]
+    if not parts:
+        return ''
+    locality = parts[-2] if len(parts) > 2 else parts[-1]
+    return ' '.join(locality.lower().split())[:60]
+
+
 # Create your models here.
 class Order(models.Model):
     cod_choices = [('0', 'NO'), ('1', 'YES')]
@@ -20,12 +44,32 @@ class Order(models.Model):
     order_id = models.AutoField(primary_key=True, editable=False)
     customer_id = models.ForeignKey('Profile', on_delete=models.DO_NOTHING)
     order_status = models.CharField(max_length=2, choices=order_status_choices, default='PL')
-    order_date = models.DateTimeField(default=timezone.now())
-    delivery_date = models.DateField(default=timezone.now() + datetime.timedelta(1))
+    order_date = models.DateTimeField(default=timezone.now)
+    delivery_date = models.DateField(default=default_delivery_date)
     order_address = models.CharField(max_length=500, blank=True)
-    total = models.DecimalField(max_digits=5, decimal_places=2)
+    # pincode or locality parsed from order_address, see delivery_area()
+    delivery_area = models.CharField(max_length=60, blank=True, editable=False)
+    total = models.DecimalField(max_digits=8, decimal_places=2)
     transaction_id = models.CharField(max_length=50, null=True)
     cod = models.CharField(max_length=2, choices=cod_choices, default='0')
+    last_modified = models.DateTimeField(auto_now=True)
+
+    class Meta:
+        indexes = [
+            # order history of a customer, newest first
+            models.Index(fields=['customer_id', 'order_date'], name='order_customer_date_idx'),
+            # order exports of a date range, read in date order without sorting them first
+            models.Index(fields=['order_date'], name='order_date_idx'),
+            # delivery manifests, the open orders of a delivery date per area
+            models.Index(fields=['delivery_date', 'order_status', 'delivery_area'], name='order_delivery_idx'),
+        ]
+
+    def save(self, *args, **kwargs):
+        self.delivery_area = delivery_area(self.order_address)
+        update_fields = kwargs.get('update_fields')
+        if update_fields is not None and 'order_address' in update_fields:
+            kwargs['update_fields'] = set(update_fields) | {'delivery_area'}
+        super().save(*args, **kwargs)
 
     def __str__(self):
         return str(self.order_id)
@@ -93,6 +137,8 @@ class Profile(AbstractBaseUser, PermissionsMixin):
 class Category(models.Model):
     category_name = models.CharField(max_length=50, primary_key=True, unique=True)
     image = models.ImageField(upload_to='category/', blank=True, null=True)
+    # sha1 of the image content, names the resized variants (see MrMilk.images)
+    image_hash = models.CharField(max_length=40, blank=True, editable=False)
 
     class Meta:
         verbose_name = 'Category'
@@ -128,11 +174,41 @@ class Product(models.Model):
     price = models.DecimalField(max_digits=10, decimal_places=5)
     quantity = models.IntegerField(validators=[MinValueValidator(0)])
     image = models.ImageField(upload_to='main_products/', blank=True, null=True)
+    # sha1 of the image content, names the resized variants (see MrMilk.images)
+    image_hash = models.CharField(max_length=40, blank=True, editable=False)
 
     def __str__(self):
         return self.product_name
 
 
+WEEKDAYS = ('monday', 'tuesday', 'wednesday', 'thursday', 'friday', 'saturday', 'sunday')
+
+
+def weekday_flag(bit):
+    """exposes one bit of Subscription.delivery_days as the old "1"/"0" weekday field"""
+
+    def get_flag(subscription):
+        return '1' if subscription.delivery_days & bit else '0'
+
+    def set_flag(subscription, value):
+        if str(value) == '1':
+            subscription.delivery_days |= bit
+        else:
+            subscription.delivery_days &= ~bit
+
+    return property(get_flag, set_flag)
+
+
+class SubscriptionQuerySet(models.QuerySet):
+
+    def due_on(self, date):
+        """subscriptions that deliver on the weekday of date, have started and still have days left"""
+        bit = 1 << date.weekday()
+        # an IN list of every schedule containing the weekday can use the delivery_days index, a bitwise test can not
+        schedules = [schedule for schedule in range(1 << len(WEEKDAYS)) if schedule & bit]
+        return self.filter(delivery_days__in=schedules, start_date__lte=date, no_of_days_left__gt=0)
+
+
 class Subscription(models.Model):
     OPTION_TYPE = (
         ("1", "Yes"),
@@ -141,15 +217,40 @@ class Subscription(models.Model):
     id = models.IntegerField(primary_key=True, auto_created=True)
     subscriber = models.ForeignKey('Profile', on_delete=models.CASCADE)
     product = models.ForeignKey('Product', on_delete=models.CASCADE)
-    start_date = models.DateField(default=timezone.now)
+    start_date = models.DateField(default=timezone.localdate)
     no_of_days_left = models.IntegerField(validators=[MinValueValidator(1)], default=0)
-    sunday = models.CharField(max_length=100, choices=OPTION_TYPE)
-    monday = models.CharField(max_length=100, choices=OPTION_TYPE)
-    tuesday = models.CharField(max_length=100, choices=OPTION_TYPE)
-    wednesday = models.CharField(max_length=100, choices=OPTION_TYPE)
-    thursday = models.CharField(max_length=100, choices=OPTION_TYPE)
-    friday = models.CharField(max_length=100, choices=OPTION_TYPE)
-    saturday = models.CharField(max_length=100, choices=OPTION_TYPE)
+    # one bit per weekday, monday is bit 0 like date.weekday()
+    delivery_days = models.PositiveSmallIntegerField(default=0, db_index=True)
+    # delivery date of the last order created for this subscription, keeps the nightly run idempotent
+    last_delivered_on = models.DateField(null=True, blank=True)
+
+    monday = weekday_flag(1 << 0)
+    tuesday = weekday_flag(1 << 1)
+    wednesday = weekday_flag(1 << 2)
+    thursday = weekday_flag(1 << 3)
+    friday = weekday_flag(1 << 4)
+    saturday = weekday_flag(1 << 5)
+    sunday = weekday_flag(1 << 6)
+
+    objects = SubscriptionQuerySet.as_manager()
 
     def __str__(self):
         return self.subscription_id
+
+
+class DailySales(models.Model):
+    """orders of a product placed on a day, kept up to date by MrMilk.sales"""
+    day = models.DateField()
+    product = models.ForeignKey('Product', related_name='daily_sales', on_delete=models.CASCADE)
+    quantity = models.IntegerField(default=0)
+    revenue = models.DecimalField(max_digits=14, decimal_places=2, default=0)
+    orders = models.IntegerField(default=0)
+    delivered_quantity = models.IntegerField(default=0)
+
+    class Meta:
+        unique_together = ['day', 'product']
+        verbose_name = 'Daily Sales'
+        verbose_name_plural = 'Daily Sales'
+
+    def __str__(self):
+        return '{} {}'.format(self.day, self.product_id)
@@ -0,0 +1,21 @@
+"""Keyset pagination for the list endpoints, every page is a range scan on an indexed column
+so page N costs the same as page 1"""
+
+from django.conf import settings
+from rest_framework.pagination import CursorPagination
+
+
+class CatalogCursorPagination(CursorPagination):
+    """cursor pagination on the primary key, clients follow the next/previous links as the user scrolls"""
+    ordering = 'pk'
+    page_size = getattr(settings, 'CATALOG_PAGE_SIZE', 20)
+    page_size_query_param = 'page_size'
+    max_page_size = getattr(settings, 'CATALOG_MAX_PAGE_SIZE', 100)
+
+
+class OrderHistoryCursorPagination(CursorPagination):
+    """newest orders first, served from the (customer_id, order_date) index"""
+    ordering = '-order_date'
+    page_size = getattr(settings, 'ORDER_HISTORY_PAGE_SIZE', 10)
+    page_size_query_param = 'page_size'
+    max_page_size = getattr(settings, 'CATALOG_MAX_PAGE_SIZE', 100)
@@ -15,3 +15,12 @@ class UpdateOwnProfile(permissions.BasePermission):
             return True
 
         return obj.id == request.user.id
+
+
+class OwnOrdersOrStaff(permissions.BasePermission):
+    """allow the customer of the url's pk and staff to see a customer's orders"""
+    message = 'you can only see your own orders'
+
+    # checked in APIView.initial(), before the view and its ETag, so a 304 never answers another user
+    def has_permission(self, request, view):
+        return request.user.is_staff or str(request.user.pk) == str(view.kwargs.get('pk'))
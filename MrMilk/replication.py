@@ -0,0 +1,56 @@
+"""
+Keeps the replica SQLite file in step with the primary through the online backup API.
+The backup reads a consistent snapshot of the primary while it keeps taking writes and copies it in a single
+step, replica readers wait for the copy to finish instead of seeing half of it.
+Catalog responses cached from the replica between a write and the next copy would outlive the copy, so the
+catalog version is bumped again after every copy that follows a catalog change.
+Every copy records the time it was taken, the router stops reading a replica that has not been copied for
+REPLICA_MAX_LAG seconds.
+"""
+
+import sqlite3
+import time
+from contextlib import closing
+
+from django.conf import settings
+from django.db import DEFAULT_DB_ALIAS
+
+from .cache import bump_catalog_version, catalog_version
+from .routers import REPLICA_DB_ALIAS, replica_synced
+
+
+def backup_file(source_name, target_name, timeout=5):
+    """copy the committed contents of the SQLite file source_name over target_name"""
+    with closing(sqlite3.connect(source_name)) as primary, \
+            closing(sqlite3.connect(target_name, timeout=timeout)) as replica:
+        primary.backup(replica)
+
+
+def replicate(source=DEFAULT_DB_ALIAS, target=REPLICA_DB_ALIAS):
+    """copy the source database file over the target one, returns the seconds it took"""
+    started = time.perf_counter()
+    backup_file(settings.DATABASES[source]['NAME'], settings.DATABASES[target]['NAME'],
+                settings.DATABASES[target].get('OPTIONS', {}).get('timeout', 5))
+    return time.perf_counter() - started
+
+
+class Replicator:
+    """replicate() plus the catalog cache invalidation, one instance per replicating process"""
+
+    def __init__(self, source=DEFAULT_DB_ALIAS, target=REPLICA_DB_ALIAS):
+        self.source = source
+        self.target = target
+        self.synced_version = None
+
+    def sync(self):
+        # the version is read before copying: every catalog change that bumped it is in the copy
+        version = catalog_version()
+        # the copy holds every write committed before it started
+        started = time.time()
+        seconds = replicate(self.source, self.target)
+        replica_synced(started)
+        # on the first copy the replica may be older than what the cache was filled from
+        if version != self.synced_version:
+            version = bump_catalog_version()
+        self.synced_version = version
+        return seconds
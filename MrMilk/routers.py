@@ -0,0 +1,151 @@
+"""
+Primary / replica routing.
+Catalog and order history reads of GET and HEAD requests go to the 'replica' database, a copy of the primary
+SQLite file kept in step by the replicate_database command (see MrMilk.replication). Everything else goes
+to 'default': every write, every read inside a transaction, the reads of other requests and every read
+outside a request, so management commands and their threads always see what they just wrote.
+A request sticks to the primary once it wrote something. Its client, told apart by its Authorization header,
+session cookie or address, stays on the primary after that until the replica holds a copy taken after the
+write, so a client always reads its own writes.
+The replica is only read while its last copy is at most REPLICA_MAX_LAG seconds old: when replicate_database
+stops, reads fall back to the primary instead of going stale.
+"""
+
+import asyncio
+import contextvars
+import hashlib
+import os
+import time
+
+from django.conf import settings
+from django.core.cache import cache
+from django.db import DEFAULT_DB_ALIAS, connections
+
+from .cache import state_cache
+
+REPLICA_DB_ALIAS = 'replica'
+REPLICATED_MODELS = {'product', 'category', 'subcategory', 'brand', 'order', 'orderdetail', 'dailysales'}
+REPLICA_SYNCED_KEY = 'mr_milk:replica:synced_at'
+REPLICA_PIN_KEY = 'mr_milk:replica:pin:{}'
+REPLICA_MAX_LAG = getattr(settings, 'REPLICA_MAX_LAG', 2 * getattr(settings, 'REPLICA_SYNC_INTERVAL', 5))
+SAFE_METHODS = ('GET', 'HEAD', 'OPTIONS')
+
+
+class Routing:
+    """where the reads of one request go, shared with the threads sync_to_async runs its view in"""
+
+    def __init__(self, primary):
+        self.primary = primary
+        self.wrote = False
+
+
+# no routing outside a request: everything goes to the primary
+routing = contextvars.ContextVar('mr_milk_routing', default=None)
+
+
+class ReplicaClock:
+    """when the replica copy was taken, read from the state cache at most once a second per process"""
+
+    def __init__(self):
+        self.synced_at = None
+        self.checked_at = None
+
+    def get(self):
+        now = time.monotonic()
+        if self.checked_at is None or now - self.checked_at > 1:
+            # a missing replica file would be created empty on connect, it does not count as a copy
+            exists = REPLICA_DB_ALIAS in settings.DATABASES and \
+                os.path.exists(settings.DATABASES[REPLICA_DB_ALIAS]['NAME'])
+            self.synced_at = state_cache.get(REPLICA_SYNCED_KEY) if exists else None
+            self.checked_at = now
+        return self.synced_at
+
+
+replica_clock = ReplicaClock()
+
+
+def replica_synced(at):
+    """remember that the replica holds a copy of the primary as it was at the time.time() at"""
+    state_cache.set(REPLICA_SYNCED_KEY, at, timeout=None)
+
+
+def replica_fresh():
+    synced_at = replica_clock.get()
+    return synced_at is not None and time.time() - synced_at <= REPLICA_MAX_LAG
+
+
+class PrimaryReplicaRouter:
+
+    def db_for_read(self, model, **hints):
+        if model._meta.app_label != 'MrMilk' or model._meta.model_name not in REPLICATED_MODELS:
+            return DEFAULT_DB_ALIAS
+        state = routing.get()
+        if state is None or state.primary or connections[DEFAULT_DB_ALIAS].in_atomic_block or not replica_fresh():
+            return DEFAULT_DB_ALIAS
+        return REPLICA_DB_ALIAS
+
+    def db_for_write(self, model, **hints):
+        state = routing.get()
+        if state is not None:
+            state.primary = True
+            state.wrote = True
+        return DEFAULT_DB_ALIAS
+
+    def allow_relation(self, obj1, obj2, **hints):
+        # both databases hold the same rows
+        return True
+
+    def allow_migrate(self, db, app_label, model_name=None, **hints):
+        # the replica gets its tables with the copy of the primary
+        return db == DEFAULT_DB_ALIAS
+
+
+def pin_key(request):
+    client = request.META.get('HTTP_AUTHORIZATION') or \
+        request.COOKIES.get(settings.SESSION_COOKIE_NAME) or request.META.get('REMOTE_ADDR', '')
+    return REPLICA_PIN_KEY.format(hashlib.md5(client.encode()).hexdigest())
+
+
+class ReplicaStickinessMiddleware:
+    sync_capable = True
+    async_capable = True
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+        self.is_async = asyncio.iscoroutinefunction(get_response)
+        if self.is_async:
+            # how Django's MiddlewareMixin tells the handler to await this middleware
+            self._is_coroutine = asyncio.coroutines._is_coroutine
+
+    def __call__(self, request):
+        if self.is_async:
+            return self.__acall__(request)
+        state = self.routing(request)
+        token = routing.set(state)
+        try:
+            return self.get_response(request)
+        finally:
+            routing.reset(token)
+            self.pin(request, state)
+
+    async def __acall__(self, request):
+        # sync_to_async copies the context into the thread running the view, the state reaches its queries
+        state = self.routing(request)
+        token = routing.set(state)
+        try:
+            return await self.get_response(request)
+        finally:
+            routing.reset(token)
+            self.pin(request, state)
+
+    def routing(self, request):
+        if request.method not in SAFE_METHODS:
+            return Routing(primary=True)
+        wrote_at = cache.get(pin_key(request))
+        # the client wrote something the replica may not have yet
+        return Routing(primary=wrote_at is not None and (replica_clock.get() or 0) < wrote_at)
+
+    def pin(self, request, state):
+        if state.wrote:
+            # a copy taken REPLICA_MAX_LAG after the write has it, an older one is not read anyway
+            cache.set(pin_key(request), time.time(), timeout=REPLICA_MAX_LAG)
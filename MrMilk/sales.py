@@ -0,0 +1,134 @@
+"""
+Daily sales rollup: one DailySales row per product and day an order was placed on, with the quantity,
+revenue and number of orders, and the quantity of those orders that was delivered.
+Rows are kept up to date as orders come in: order placement and the subscription engine add their lines
+in the transaction that writes them, signals (see MrMilk.signals) follow lines added, changed or deleted one by one
+and orders moving in or out of DELIVERED. Queryset updates of orders and lines are not followed, the
+backfill_daily_sales command rebuilds a date range from the order lines.
+Revenue is the quantity times the product price when the line is recorded, order lines keep no price of
+their own so a backfill prices them at today's prices.
+"""
+
+from collections import defaultdict
+from decimal import Decimal
+from itertools import islice
+
+from django.db import DEFAULT_DB_ALIAS, connections
+from django.db.models import Sum, Count, F, Case, When, IntegerField, DecimalField
+from django.db.models.functions import TruncDate
+from django.utils import timezone
+
+from .models import DailySales, OrderDetail
+
+CENT = Decimal('0.01')
+SALES_GROUPS = {
+    'day': ('day',),
+    'product': ('product_id', 'product__product_name'),
+    'brand': ('product__brand_id',),
+    'category': ('product__category_id',),
+}
+SALES_FILTERS = {'product': 'product_id', 'brand': 'product__brand_id', 'category': 'product__category_id'}
+
+UPSERT_SALES = """INSERT INTO "{table}" ("day", "product_id", "quantity", "revenue", "orders", "delivered_quantity")
+    VALUES (%s, %s, %s, %s, %s, %s)
+    ON CONFLICT ("day", "product_id") DO UPDATE SET
+        "quantity" = "quantity" + excluded."quantity",
+        "revenue" = "revenue" + excluded."revenue",
+        "orders" = "orders" + excluded."orders",
+        "delivered_quantity" = "delivered_quantity" + excluded."delivered_quantity"
+""".format(table=DailySales._meta.db_table)
+
+
+def record_sales(changes, using=DEFAULT_DB_ALIAS):
+    """add (day, product_id, quantity, revenue, orders, delivered_quantity) changes to the rollup"""
+    totals = defaultdict(lambda: [0, Decimal(0), 0, 0])
+    for day, product_id, quantity, revenue, orders, delivered in changes:
+        total = totals[(day, product_id)]
+        total[0] += quantity
+        total[1] += revenue
+        total[2] += orders
+        total[3] += delivered
+    if not totals:
+        return
+    with connections[using].cursor() as cursor:
+        # one statement for every product and day, rows that do not exist yet are created by it
+        cursor.executemany(UPSERT_SALES, [
+            (day.isoformat(), product_id, quantity, str(revenue.quantize(CENT)), orders, delivered)
+            for (day, product_id), (quantity, revenue, orders, delivered) in totals.items()])
+
+
+def order_sales(order, lines, sign=1):
+    """rollup changes of the lines [(product_id, quantity, price)] of order, sign -1 takes them back out"""
+    day = timezone.localdate(order.order_date)
+    delivered = order.order_status == 'DL'
+    return [(day, product_id, sign * quantity, sign * quantity * price, sign, sign * quantity if delivered else 0)
+            for product_id, quantity, price in lines]
+
+
+def delivery_sales(order, sign, using=DEFAULT_DB_ALIAS):
+    """rollup changes of order moving into (sign 1) or out of (sign -1) DELIVERED"""
+    day = timezone.localdate(order.order_date)
+    lines = OrderDetail.objects.using(using).filter(order_id=order.pk).values_list('product_id', 'quantity')
+    return [(day, product_id, 0, Decimal(0), 0, sign * quantity) for product_id, quantity in lines]
+
+
+def backfill_daily_sales(since, until, using=DEFAULT_DB_ALIAS):
+    """
+    rebuild the rollup of the days of orders placed from since to until (aware datetimes on local day
+    boundaries) from the order lines, returns the number of rows written. Run it in a transaction.
+    """
+    start, end = timezone.localdate(since), timezone.localdate(until)
+    DailySales.objects.using(using).filter(day__gte=start, day__lt=end).delete()
+    rows = OrderDetail.objects.using(using) \
+        .filter(order__order_date__gte=since, order__order_date__lt=until) \
+        .annotate(day=TruncDate('order__order_date')) \
+        .values('day', 'product_id') \
+        .annotate(total_quantity=Sum('quantity'),
+                  total_revenue=Sum(F('quantity') * F('product__price'),
+                                    output_field=DecimalField(max_digits=14, decimal_places=2)),
+                  total_orders=Count('order_id'),
+                  total_delivered=Sum(Case(When(order__order_status='DL', then='quantity'), default=0,
+                                           output_field=IntegerField()))) \
+        .order_by()
+    rows = rows.iterator(chunk_size=2000)
+    written = 0
+    while True:
+        sales = [DailySales(day=row['day'], product_id=row['product_id'], quantity=row['total_quantity'],
+                            revenue=row['total_revenue'].quantize(CENT), orders=row['total_orders'],
+                            delivered_quantity=row['total_delivered'])
+                 for row in islice(rows, 2000)]
+        if not sales:
+            return written
+        DailySales.objects.using(using).bulk_create(sales)
+        written += len(sales)
+
+
+def sales_report(start, end, group='day', filters=None, limit=50):
+    """
+    totals and rows of the rollup for the days start to end (dates) grouped by SALES_GROUPS[group],
+    filters maps SALES_FILTERS names to values. Days come in date order, anything else by revenue, top limit.
+    """
+    sales = DailySales.objects.filter(day__gte=start, day__lte=end)
+    for name, value in (filters or {}).items():
+        sales = sales.filter(**{SALES_FILTERS[name]: value})
+    totals = dict(quantity=Sum('quantity'), revenue=Sum('revenue'), orders=Sum('orders'),
+                  delivered_quantity=Sum('delivered_quantity'))
+    columns = SALES_GROUPS[group]
+    rows = sales.values(*columns).annotate(**totals)
+    rows = rows.order_by('day') if group == 'day' else rows.order_by('-revenue', *columns)[:limit]
+    names = {'product_id': 'product', 'product__product_name': 'product_name',
+             'product__brand_id': 'brand', 'product__category_id': 'category'}
+    rows = [{names.get(key, key): value for key, value in row.items()} for row in rows]
+    if group == 'day':
+        # every day is in the rows, adding them up saves a second pass over the range
+        summed = {key: sum((row[key] for row in rows), Decimal(0) if key == 'revenue' else 0) for key in totals}
+    else:
+        summed = sales.aggregate(**totals)
+    return {'totals': sales_row(summed), 'rows': [sales_row(row) for row in rows]}
+
+
+def sales_row(row):
+    row['revenue'] = str((row['revenue'] or Decimal(0)).quantize(CENT))
+    for key in ('quantity', 'orders', 'delivered_quantity'):
+        row[key] = row[key] or 0
+    return row
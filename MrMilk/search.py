@@ -0,0 +1,81 @@
+"""
+Full-text product search on an SQLite FTS5 table.
+MrMilk_product_search holds product name, brand, category and sub category with the product id as rowid,
+triggers on MrMilk_product keep it in sync with every insert, update and delete.
+SQLite drops the triggers when a migration rebuilds MrMilk_product, run rebuild_product_search afterwards.
+"""
+
+import re
+
+from django.db import connections, router
+
+from .models import Product
+
+SEARCH_TABLE = 'MrMilk_product_search'
+
+CREATE_SEARCH = [
+    """CREATE VIRTUAL TABLE IF NOT EXISTS "MrMilk_product_search" USING fts5(
+        product_name, brand, category, sub_category,
+        tokenize = 'unicode61 remove_diacritics 2', prefix = '2 3')""",
+    """CREATE TRIGGER IF NOT EXISTS "MrMilk_product_search_insert" AFTER INSERT ON "MrMilk_product" BEGIN
+        INSERT INTO "MrMilk_product_search" (rowid, product_name, brand, category, sub_category)
+        VALUES (new.id, new.product_name, new.brand_id, new.category_id, new.sub_category_id);
+    END""",
+    """CREATE TRIGGER IF NOT EXISTS "MrMilk_product_search_delete" AFTER DELETE ON "MrMilk_product" BEGIN
+        DELETE FROM "MrMilk_product_search" WHERE rowid = old.id;
+    END""",
+    """CREATE TRIGGER IF NOT EXISTS "MrMilk_product_search_update"
+        AFTER UPDATE OF product_name, brand_id, category_id, sub_category_id ON "MrMilk_product" BEGIN
+        DELETE FROM "MrMilk_product_search" WHERE rowid = old.id;
+        INSERT INTO "MrMilk_product_search" (rowid, product_name, brand, category, sub_category)
+        VALUES (new.id, new.product_name, new.brand_id, new.category_id, new.sub_category_id);
+    END""",
+]
+
+FILL_SEARCH = """INSERT INTO "MrMilk_product_search" (rowid, product_name, brand, category, sub_category)
+    SELECT id, product_name, brand_id, category_id, sub_category_id FROM "MrMilk_product\""""
+
+DROP_SEARCH = [
+    'DROP TRIGGER IF EXISTS "MrMilk_product_search_insert"',
+    'DROP TRIGGER IF EXISTS "MrMilk_product_search_delete"',
+    'DROP TRIGGER IF EXISTS "MrMilk_product_search_update"',
+    'DROP TABLE IF EXISTS "MrMilk_product_search"',
+]
+
+# product name matches count the most, bm25 takes one weight per column
+RANKED_SEARCH = """SELECT rowid FROM "MrMilk_product_search" WHERE "MrMilk_product_search" MATCH %s
+    ORDER BY bm25("MrMilk_product_search", 10.0, 3.0, 2.0, 2.0) LIMIT %s OFFSET %s"""
+
+TERM_RE = re.compile(r'\w+')
+
+
+def rebuild_search_index(cursor):
+    """drop and rebuild the search table and its triggers from MrMilk_product"""
+    for statement in DROP_SEARCH + CREATE_SEARCH:
+        cursor.execute(statement)
+    cursor.execute(FILL_SEARCH)
+    cursor.execute('INSERT INTO "MrMilk_product_search" ("MrMilk_product_search") VALUES (\'optimize\')')
+
+
+def match_expression(query):
+    """every word of the query has to match, the last one as a prefix so results follow the user while typing"""
+    terms = TERM_RE.findall(query.lower())
+    if not terms:
+        return None
+    quoted = ['"{}"'.format(term) for term in terms]
+    quoted[-1] += '*'
+    return ' '.join(quoted)
+
+
+def search_products(query, limit=20, offset=0):
+    """products matching query, best match first"""
+    expression = match_expression(query)
+    if expression is None:
+        return []
+    # the search table is read from the same database as the products, the replica when there is one
+    using = router.db_for_read(Product)
+    with connections[using].cursor() as cursor:
+        cursor.execute(RANKED_SEARCH, [expression, limit, offset])
+        product_ids = [row[0] for row in cursor.fetchall()]
+    products = Product.objects.using(using).in_bulk(product_ids)
+    return [products[product_id] for product_id in product_ids if product_id in products]
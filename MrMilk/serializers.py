@@ -1,8 +1,13 @@
+from django.db import transaction
 from rest_framework import serializers, fields
 from rest_framework.authtoken.models import Token
 
 from MrMilk import models
-from MrMilk.models import Order, OrderDetail
+from MrMilk.images import variant_urls
+from MrMilk.inventory import reserve_stock
+from MrMilk.models import Order, OrderDetail, Product
+from MrMilk.sales import record_sales, order_sales
+from MrMilk.sqlite.retry import retry_on_lock
 
 
 class ProfileSerializer(serializers.ModelSerializer):
@@ -38,13 +43,34 @@ class LoginSerializer(serializers.ModelSerializer):
         fields = ('phone', 'password',)
 
 
+class ImageVariantsField(serializers.Field):
+    """urls of the resized webp/jpeg variants of the image, clients pick the size they need"""
+
+    def __init__(self, **kwargs):
+        kwargs['source'] = 'image_hash'
+        kwargs['read_only'] = True
+        super().__init__(**kwargs)
+
+    def to_representation(self, image_hash):
+        urls = variant_urls(image_hash)
+        request = self.context.get('request')
+        if request is not None:
+            urls = {variant: {extension: request.build_absolute_uri(url) for extension, url in formats.items()}
+                    for variant, formats in urls.items()}
+        return urls
+
+
 class ProductSerializer(serializers.ModelSerializer):
+    image_variants = ImageVariantsField()
+
     class Meta:
         model = models.Product
         fields = '__all__'
 
 
 class CategorySerializer(serializers.ModelSerializer):
+    image_variants = ImageVariantsField()
+
     class Meta:
         model = models.Category
         fields = '__all__'
@@ -68,7 +94,6 @@ class OrderSerializer(serializers.ModelSerializer):
 
     def create(self, validated_data):
         # correct the glitch for inserting same product differently for same order_id
-        print("in the serializer creation class of orders")
         return Order.objects.create(**validated_data)
 
 
@@ -78,6 +103,77 @@ class OrderDetailSerializer(serializers.ModelSerializer):
         fields = ('order', 'quantity', 'product')
 
     def create(self, validated_data):
-        print("in the serializer creation class of ordersDetail")
         result = OrderDetail.objects.create(**validated_data)
         return result
+
+
+class OrderLineSerializer(serializers.Serializer):
+    """one cart line of an order that is being placed, the order itself is assigned on save"""
+    product = serializers.IntegerField()
+    quantity = serializers.IntegerField(min_value=1)
+
+
+class OrderPlacementSerializer(serializers.Serializer):
+    """
+    Places an order together with all of its lines.
+    Every line is validated in one go and the lines are written with a single bulk insert
+    inside the same transaction as the order, so a bad line never leaves a half-written order.
+    Stock is reserved in that transaction too, save() raises OutOfStock and keeps nothing when a product runs short.
+    The daily sales rollup takes the lines in the same transaction.
+    """
+    order = OrderSerializer()
+    order_detail = OrderLineSerializer(many=True, allow_empty=False)
+
+    def validate_order_detail(self, lines):
+        product_ids = [line['product'] for line in lines]
+        if len(set(product_ids)) != len(product_ids):
+            raise serializers.ValidationError('order already contains this product cannot change the it')
+        # one query for the whole cart instead of one lookup per line
+        products = Product.objects.in_bulk(product_ids)
+        missing = [product_id for product_id in product_ids if product_id not in products]
+        if missing:
+            raise serializers.ValidationError('invalid product ids {}'.format(missing))
+        for line in lines:
+            line['product'] = products[line['product']]
+        return lines
+
+    @retry_on_lock
+    def create(self, validated_data):
+        with transaction.atomic():
+            reserve_stock((line['product'].pk, line['quantity']) for line in validated_data['order_detail'])
+            order = Order.objects.create(**validated_data['order'])
+            order_detail = OrderDetail.objects.bulk_create(
+                [OrderDetail(order=order, **line) for line in validated_data['order_detail']])
+            record_sales(order_sales(order, [(line['product'].pk, line['quantity'], line['product'].price)
+                                             for line in validated_data['order_detail']]))
+        return {'order': order, 'order_detail': order_detail}
+
+
+class OrderHistoryDetailSerializer(serializers.ModelSerializer):
+    product_name = serializers.CharField(source='product.product_name', read_only=True)
+
+    class Meta:
+        model = models.OrderDetail
+        fields = ('product', 'product_name', 'quantity')
+
+
+class OrderHistorySerializer(OrderSerializer):
+    """an order with its lines, the lines have to be prefetched together with their products"""
+    order_detail = OrderHistoryDetailSerializer(source='orders', many=True, read_only=True)
+
+
+class SubscriptionSerializer(serializers.ModelSerializer):
+    """the schedule is stored in the delivery_days bitmask, the "1"/"0" weekday fields are kept for existing clients"""
+    monday = serializers.ChoiceField(choices=models.Subscription.OPTION_TYPE, required=False)
+    tuesday = serializers.ChoiceField(choices=models.Subscription.OPTION_TYPE, required=False)
+    wednesday = serializers.ChoiceField(choices=models.Subscription.OPTION_TYPE, required=False)
+    thursday = serializers.ChoiceField(choices=models.Subscription.OPTION_TYPE, required=False)
+    friday = serializers.ChoiceField(choices=models.Subscription.OPTION_TYPE, required=False)
+    saturday = serializers.ChoiceField(choices=models.Subscription.OPTION_TYPE, required=False)
+    sunday = serializers.ChoiceField(choices=models.Subscription.OPTION_TYPE, required=False)
+
+    class Meta:
+        model = models.Subscription
+        fields = ('id', 'subscriber', 'product', 'start_date', 'no_of_days_left', 'delivery_days',
+                  'sunday', 'monday', 'tuesday', 'wednesday', 'thursday', 'friday', 'saturday')
+        extra_kwargs = {'delivery_days': {'required': False}}
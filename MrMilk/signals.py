@@ -0,0 +1,105 @@
+from django.db import transaction
+from django.db.models.signals import pre_save, post_save, post_delete
+from django.dispatch import receiver
+from django.utils import timezone
+
+from rest_framework.authtoken.models import Token
+
+from .authentication import token_cache, revoke_cached_tokens
+from .cache import bump_catalog_version
+from .images import refresh_variants
+from .models import Product, Category, SubCategory, Brand, Profile, Order, OrderDetail
+from .sales import record_sales, order_sales, delivery_sales
+
+
+@receiver(post_save, sender=Product)
+@receiver(post_save, sender=Category)
+@receiver(post_save, sender=SubCategory)
+@receiver(post_save, sender=Brand)
+@receiver(post_delete, sender=Product)
+@receiver(post_delete, sender=Category)
+@receiver(post_delete, sender=SubCategory)
+@receiver(post_delete, sender=Brand)
+def invalidate_catalog(sender, **kwargs):
+    """any change to the catalog moves it to a new version, cached responses of the old one are never read again"""
+    # bumped after commit, otherwise a concurrent read could cache the old rows under the new version
+    transaction.on_commit(bump_catalog_version)
+
+
+@receiver(post_save, sender=Product)
+@receiver(post_save, sender=Category)
+def build_image_variants(sender, instance, raw=False, **kwargs):
+    """resized variants are built when the image is uploaded, an unchanged image only costs a hash"""
+    if raw:
+        return
+    try:
+        refresh_variants(instance)
+    except FileNotFoundError:
+        # the row points at a file that is gone, it is served without variants until the image is uploaded again
+        pass
+
+
+@receiver(post_delete, sender=Token)
+def evict_token(sender, instance, **kwargs):
+    token_cache.evict(instance.key)
+    # the other workers once the token is gone for good
+    transaction.on_commit(revoke_cached_tokens)
+
+
+@receiver(post_save, sender=Profile)
+@receiver(post_delete, sender=Profile)
+def evict_profile_tokens(sender, instance, created=False, **kwargs):
+    """a cached user could still be active or staff after the profile changed"""
+    if created:
+        # no token of a new profile is cached anywhere
+        return
+    token_cache.evict_user(instance.pk)
+    transaction.on_commit(revoke_cached_tokens)
+
+
+@receiver(pre_save, sender=Order)
+@receiver(pre_save, sender=OrderDetail)
+def remember_sales_state(sender, instance, raw=False, using=None, **kwargs):
+    """the stored status of an order or product and quantity of a line, to tell what the save changes"""
+    if raw or instance.pk is None:
+        return
+    fields = ('order_status',) if sender is Order else ('product_id', 'quantity')
+    instance._sales_state = sender._base_manager.using(using).filter(pk=instance.pk).values_list(*fields).first()
+
+
+@receiver(post_save, sender=Order)
+def follow_delivery(sender, instance, created, raw=False, using=None, **kwargs):
+    previous = getattr(instance, '_sales_state', None)
+    if raw or created or previous is None:
+        return
+    was_delivered, delivered = previous[0] == 'DL', instance.order_status == 'DL'
+    if was_delivered != delivered:
+        record_sales(delivery_sales(instance, 1 if delivered else -1, using), using)
+
+
+@receiver(post_save, sender=OrderDetail)
+def follow_order_line(sender, instance, created, raw=False, using=None, **kwargs):
+    previous = getattr(instance, '_sales_state', None)
+    if raw or (not created and (previous is None or previous == (instance.product_id, instance.quantity))):
+        return
+    changes = []
+    if previous is not None:
+        product_id, quantity = previous
+        price = Product._base_manager.using(using).values_list('price', flat=True).get(pk=product_id)
+        changes += order_sales(instance.order, [(product_id, quantity, price)], sign=-1)
+    changes += order_sales(instance.order, [(instance.product_id, instance.quantity, instance.product.price)])
+    record_sales(changes, using)
+
+
+@receiver(post_delete, sender=OrderDetail)
+def forget_order_line(sender, instance, using=None, **kwargs):
+    record_sales(order_sales(instance.order, [(instance.product_id, instance.quantity, instance.product.price)],
+                             sign=-1), using)
+
+
+@receiver(post_save, sender=OrderDetail)
+@receiver(post_delete, sender=OrderDetail)
+def touch_order(sender, instance, raw=False, using=None, **kwargs):
+    """a changed line changes its order, and the ETag of its customer's order history"""
+    if not raw:
+        Order._base_manager.using(using).filter(pk=instance.order_id).update(last_modified=timezone.now())
@@ -0,0 +1,8 @@
+"""
+SQLite backend for production, use 'ENGINE': 'MrMilk.sqlite' in DATABASES.
+Every connection gets the PRAGMAs of OPTIONS['pragmas'] (WAL journaling, synchronous, cache and mmap sizes)
+and transactions start with BEGIN IMMEDIATE. A deferred BEGIN takes the write lock only at the first write,
+and a reader that wants to become a writer after another one committed fails at once with "database is
+locked" whatever the busy timeout. BEGIN IMMEDIATE waits for the write lock up front, up to OPTIONS['timeout'].
+retry_on_lock retries a whole transaction when the lock stays taken longer than that.
+"""
@@ -0,0 +1,23 @@
+from django.db.backends.sqlite3 import base
+
+
+class DatabaseWrapper(base.DatabaseWrapper):
+
+    def get_connection_params(self):
+        params = super().get_connection_params()
+        # not arguments of sqlite3.connect()
+        params.pop('pragmas', None)
+        params.pop('transaction_mode', None)
+        return params
+
+    def get_new_connection(self, conn_params):
+        conn = super().get_new_connection(conn_params)
+        for pragma, value in self.settings_dict['OPTIONS'].get('pragmas', {}).items():
+            conn.execute('PRAGMA {} = {}'.format(pragma, value))
+        return conn
+
+    def _start_transaction_under_autocommit(self):
+        # IMMEDIATE takes the write lock up front so a transaction never fails half way on a lock upgrade,
+        # a query_only database refuses it and has to use DEFERRED
+        mode = self.settings_dict['OPTIONS'].get('transaction_mode', 'IMMEDIATE')
+        self.cursor().execute('BEGIN {}'.format(mode))
@@ -0,0 +1,35 @@
+import functools
+import random
+import time
+
+from django.conf import settings
+from django.db import DEFAULT_DB_ALIAS, OperationalError, connections
+
+
+def is_lock_error(error):
+    return 'database is locked' in str(error)
+
+
+def retry_on_lock(func=None, using=DEFAULT_DB_ALIAS):
+    """
+    run func again when it fails with "database is locked", at most SQLITE_LOCK_RETRIES times,
+    backing off exponentially from SQLITE_LOCK_BACKOFF seconds with jitter.
+    func has to be a whole transaction: nothing is retried inside an atomic block opened by a caller,
+    the error goes up to whoever owns that transaction.
+    """
+    if func is None:
+        return functools.partial(retry_on_lock, using=using)
+
+    @functools.wraps(func)
+    def wrapper(*args, **kwargs):
+        retries = getattr(settings, 'SQLITE_LOCK_RETRIES', 5)
+        backoff = getattr(settings, 'SQLITE_LOCK_BACKOFF', 0.05)
+        for attempt in range(retries + 1):
+            try:
+                return func(*args, **kwargs)
+            except OperationalError as error:
+                if not is_lock_error(error) or attempt == retries or connections[using].in_atomic_block:
+                    raise
+            time.sleep(backoff * 2 ** attempt * random.uniform(0.5, 1.5))
+
+    return wrapper
@@ -0,0 +1,100 @@
+"""
+Turns subscriptions into orders for a delivery date.
+
+Subscribers are processed in chunks, each chunk in its own transaction. The same UPDATE that counts down
+no_of_days_left also stamps last_delivered_on, so running the engine again for the same date, or after
+it was interrupted half way, only picks up the subscriptions that are still missing.
+Deliveries take their products out of stock like any other order. When the stock of a product can not
+cover all of its subscriptions, it goes to them in subscriber and subscription order, the same order
+whatever the chunk size. The rest stay due and are picked up by a run for the same date once the product
+is restocked.
+"""
+
+from collections import defaultdict
+from decimal import Decimal
+
+from django.db import transaction
+from django.db.models import F, Q
+from django.utils import timezone
+
+from .inventory import reserve_available_stock
+from .models import Order, OrderDetail, Subscription, delivery_area
+from .sales import record_sales
+from .sqlite.retry import retry_on_lock
+
+
+def due_subscriptions(delivery_date):
+    """subscriptions that deliver on this weekday, have days left and were not materialized for this date yet"""
+    return Subscription.objects.due_on(delivery_date) \
+        .filter(Q(last_delivered_on__isnull=True) | Q(last_delivered_on__lt=delivery_date))
+
+
+def materialize_subscriptions(delivery_date, chunk_size=500):
+    """
+    create the orders for every subscription due on delivery_date,
+    returns (orders, subscriptions delivered, subscriptions left due because their product is out of stock)
+    """
+    orders_created = subscriptions_created = out_of_stock = 0
+    last_subscriber = 0
+    while True:
+        subscriber_ids = list(due_subscriptions(delivery_date)
+                              .filter(subscriber_id__gt=last_subscriber)
+                              .order_by('subscriber_id')
+                              .values_list('subscriber_id', flat=True)
+                              .distinct()[:chunk_size])
+        if not subscriber_ids:
+            return orders_created, subscriptions_created, out_of_stock
+        orders, subscriptions, short = _materialize_chunk(delivery_date, subscriber_ids)
+        orders_created += orders
+        subscriptions_created += subscriptions
+        out_of_stock += short
+        last_subscriber = subscriber_ids[-1]
+
+
+@retry_on_lock
+def _materialize_chunk(delivery_date, subscriber_ids):
+    with transaction.atomic():
+        rows = list(due_subscriptions(delivery_date).filter(subscriber_id__in=subscriber_ids)
+                    .order_by('subscriber_id', 'pk')
+                    .values_list('pk', 'subscriber_id', 'subscriber__address', 'product_id', 'product__price'))
+        # one unit per subscription, the first subscriptions of a short product get what there is
+        left = reserve_available_stock((product_id, 1) for _, _, _, product_id, _ in rows)
+        carts = defaultdict(lambda: defaultdict(int))
+        addresses = {}
+        delivered = []
+        for pk, subscriber_id, address, product_id, price in rows:
+            if not left[product_id]:
+                continue
+            left[product_id] -= 1
+            carts[subscriber_id][(product_id, price)] += 1
+            addresses[subscriber_id] = address
+            delivered.append(pk)
+        skipped = len(rows) - len(delivered)
+        if not carts:
+            return 0, 0, skipped
+
+        # one shared timestamp for the chunk, the new order ids are read back by it since SQLite
+        # does not return primary keys from a bulk insert
+        placed_at = timezone.now()
+        Order.objects.bulk_create([
+            Order(customer_id_id=subscriber_id, order_date=placed_at, delivery_date=delivery_date,
+                  order_address=addresses[subscriber_id], delivery_area=delivery_area(addresses[subscriber_id]),
+                  total=sum((price * quantity for (_, price), quantity in cart.items()), Decimal(0))
+                  .quantize(Decimal('0.01')))
+            for subscriber_id, cart in carts.items()
+        ])
+        order_ids = dict(Order.objects.filter(customer_id__in=list(carts), order_date=placed_at)
+                         .values_list('customer_id', 'pk'))
+
+        OrderDetail.objects.bulk_create([
+            OrderDetail(order_id=order_ids[subscriber_id], product_id=product_id, quantity=quantity)
+            for subscriber_id, cart in carts.items()
+            for (product_id, _), quantity in cart.items()
+        ])
+        day = timezone.localdate(placed_at)
+        record_sales((day, product_id, quantity, price * quantity, 1, 0)
+                     for cart in carts.values()
+                     for (product_id, price), quantity in cart.items())
+        Subscription.objects.filter(pk__in=delivered).update(no_of_days_left=F('no_of_days_left') - 1,
+                                                             last_delivered_on=delivery_date)
+    return len(carts), len(delivered), skipped
@@ -1,3 +1,866 @@
-from django.test import TestCase
+import csv
+import datetime
+import json
+import os
+import sqlite3
+import tempfile
+import threading
+import time
+from contextlib import closing
+from decimal import Decimal
 
-# Create your tests here.
+from asgiref.sync import sync_to_async
+from django.core.cache import cache
+from django.core.management import call_command
+from django.db import connection, connections, transaction
+from django.db.migrations.executor import MigrationExecutor
+from django.http import HttpResponse
+from django.test import AsyncClient, RequestFactory, SimpleTestCase, TestCase, TransactionTestCase, override_settings
+from django.utils import timezone
+from rest_framework.authtoken.models import Token
+from rest_framework.test import APIClient
+
+from MrMilk.authentication import token_cache, token_generation, revoke_cached_tokens
+from MrMilk.cache import catalog_cache_stats, state_cache
+from MrMilk.exports import EXPORT_COLUMNS, day_bounds
+from MrMilk.instrumentation import query_budget
+from MrMilk.media import parse_range
+from MrMilk.metrics import collect, registry, TOTALS_FILE
+from MrMilk.inventory import OutOfStock
+from MrMilk.replication import backup_file
+from MrMilk.sales import backfill_daily_sales
+from MrMilk.routers import PrimaryReplicaRouter, ReplicaStickinessMiddleware, Routing, routing, replica_clock, \
+    replica_synced, REPLICA_MAX_LAG
+from MrMilk.models import delivery_area, WEEKDAYS, Profile, Category, SubCategory, Brand, Product, Order, OrderDetail, \
+    Subscription, DailySales
+from MrMilk.serializers import OrderPlacementSerializer
+from MrMilk.subscriptions import materialize_subscriptions
+
+
+def make_customer(phone='9000000001', **extra):
+    return Profile.objects.create_user(phone=phone, name='customer {}'.format(phone),
+                                       email='{}@example.com'.format(phone), password='dairy-password',
+                                       address='12 3rd Main, Koramangala, Bengaluru 560034', **extra)
+
+
+def make_brands(count, products=3):
+    for brand in range(count):
+        for product in range(products):
+            make_product('product {} {}'.format(brand, product), brand='brand {}'.format(brand))
+
+
+def make_product(name='milk', brand='brand', stock=100, price='25'):
+    category, _ = Category.objects.get_or_create(category_name='Milk')
+    sub_category, _ = SubCategory.objects.get_or_create(sub_category_name='Toned')
+    brand, _ = Brand.objects.get_or_create(brand_name=brand)
+    return Product.objects.create(product_name=name, category=category, sub_category=sub_category, brand=brand,
+                                  price=Decimal(price), quantity=stock)
+
+
+def api_client(user):
+    client = APIClient()
+    client.credentials(HTTP_AUTHORIZATION='Token ' + Token.objects.get_or_create(user=user)[0].key)
+    return client
+
+
+def order_payload(customer, *lines):
+    return {
+        'order': {'customer_id': customer.pk, 'order_address': customer.address, 'total': '50.00'},
+        'order_detail': [{'product': product.pk, 'quantity': quantity} for product, quantity in lines],
+    }
+
+
+class StockReservationTests(TransactionTestCase):
+    """orders placed from several threads at once, on their own connections and transactions"""
+
+    def test_concurrent_orders_never_oversell(self):
+        customer = make_customer()
+        hot, other = make_product('hot milk', stock=20), make_product('curd', stock=1000)
+        payload = order_payload(customer, (hot, 1), (other, 1))
+        outcomes, errors, lock = [], [], threading.Lock()
+
+        def place_orders():
+            try:
+                for _ in range(10):
+                    serializer = OrderPlacementSerializer(data=payload)
+                    serializer.is_valid(raise_exception=True)
+                    try:
+                        serializer.save()
+                        outcome = 'placed'
+                    except OutOfStock:
+                        outcome = 'out_of_stock'
+                    with lock:
+                        outcomes.append(outcome)
+            except Exception as error:
+                with lock:
+                    errors.append(error)
+            finally:
+                connections.close_all()
+
+        threads = [threading.Thread(target=place_orders) for _ in range(4)]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+
+        self.assertEqual(errors, [])
+        hot.refresh_from_db()
+        other.refresh_from_db()
+        self.assertEqual(outcomes.count('placed'), 20)
+        self.assertEqual(outcomes.count('out_of_stock'), 20)
+        self.assertEqual(hot.quantity, 0)
+        self.assertEqual(OrderDetail.objects.filter(product=hot).count(), 20)
+        # an order rejected for the hot product gives the other product back
+        self.assertEqual(other.quantity, 1000 - 20)
+        self.assertEqual(Order.objects.count(), 20)
+
+    def test_placed_order_moves_the_cached_catalog(self):
+        cache.clear()
+        state_cache.clear()
+        milk = make_product('milk', stock=10)
+        response = self.client.get('/mr_milk/products/')
+        self.assertEqual(response.data['results'][0]['quantity'], 10)
+
+        serializer = OrderPlacementSerializer(data=order_payload(make_customer(), (milk, 3)))
+        serializer.is_valid(raise_exception=True)
+        serializer.save()
+        response = self.client.get('/mr_milk/products/', HTTP_IF_NONE_MATCH=response['ETag'])
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.data['results'][0]['quantity'], 7)
+
+    def test_subscriptions_take_stock_and_wait_for_restock(self):
+        delivery_date = timezone.localdate() + datetime.timedelta(1)
+        every_day = (1 << 7) - 1
+        milk, curd = make_product('milk', stock=2), make_product('curd', stock=1)
+        customers = [make_customer('90000000{:02d}'.format(index)) for index in range(3)]
+        for index, customer in enumerate(customers):
+            Subscription.objects.create(id=index + 1, subscriber=customer, product=milk, no_of_days_left=5,
+                                        delivery_days=every_day)
+        Subscription.objects.create(id=10, subscriber=customers[0], product=curd, no_of_days_left=5,
+                                    delivery_days=every_day)
+
+        # three milk subscriptions for a stock of two: the first two get milk, the third waits
+        self.assertEqual(materialize_subscriptions(delivery_date), (2, 3, 1))
+        milk.refresh_from_db()
+        curd.refresh_from_db()
+        self.assertEqual((milk.quantity, curd.quantity), (0, 0))
+        self.assertEqual(list(Subscription.objects.order_by('pk').values_list('no_of_days_left', flat=True)),
+                         [4, 4, 5, 4])
+
+        Product.objects.filter(pk=milk.pk).update(quantity=10)
+        self.assertEqual(materialize_subscriptions(delivery_date), (1, 1, 0))
+        milk.refresh_from_db()
+        self.assertEqual(milk.quantity, 9)
+        self.assertEqual(OrderDetail.objects.filter(product=milk).count(), 3)
+        self.assertEqual(materialize_subscriptions(delivery_date), (0, 0, 0))
+
+    def test_short_stock_goes_to_the_same_subscribers_whatever_the_chunk_size(self):
+        delivery_date = timezone.localdate() + datetime.timedelta(1)
+        milk = make_product('milk', stock=3)
+        customers = [make_customer('90000000{:02d}'.format(index)) for index in range(5)]
+        for index, customer in enumerate(customers):
+            Subscription.objects.create(id=index + 1, subscriber=customer, product=milk, no_of_days_left=5,
+                                        delivery_days=(1 << 7) - 1)
+        for chunk_size in (1, 2, 500):
+            with self.subTest(chunk_size=chunk_size):
+                Product.objects.filter(pk=milk.pk).update(quantity=3)
+                Subscription.objects.update(last_delivered_on=None)
+                self.assertEqual(materialize_subscriptions(delivery_date, chunk_size=chunk_size), (3, 3, 2))
+                self.assertEqual(set(Subscription.objects.filter(last_delivered_on=delivery_date)
+                                     .values_list('subscriber_id', flat=True)),
+                                 {customer.pk for customer in customers[:3]})
+
+
+class SubscriptionScheduleTests(TestCase):
+
+    def test_due_on_every_weekday(self):
+        monday = datetime.date(2026, 10, 19)
+        customer, milk = make_customer(), make_product()
+        for bit in range(7):
+            Subscription.objects.create(id=bit + 1, subscriber=customer, product=milk, no_of_days_left=5,
+                                        start_date=monday, delivery_days=1 << bit)
+        # tuesday, saturday and sunday
+        Subscription.objects.create(id=10, subscriber=customer, product=milk, no_of_days_left=5,
+                                    start_date=monday, delivery_days=98)
+        # not started, no days left
+        Subscription.objects.create(id=20, subscriber=customer, product=milk, no_of_days_left=5,
+                                    start_date=monday + datetime.timedelta(7), delivery_days=127)
+        Subscription.objects.create(id=21, subscriber=customer, product=milk, no_of_days_left=0,
+                                    start_date=monday, delivery_days=127)
+        for offset in range(7):
+            date = monday + datetime.timedelta(offset)
+            with self.subTest(date.strftime('%A')):
+                self.assertEqual(date.weekday(), offset)
+                due = set(Subscription.objects.due_on(date).values_list('pk', flat=True))
+                self.assertEqual(due, {offset + 1, 10} if offset in (1, 5, 6) else {offset + 1})
+
+
+class WeekdayBitmaskMigrationTests(TransactionTestCase):
+    before = [('MrMilk', '0014_subscription_last_delivered_on')]
+    after = [('MrMilk', '0015_subscription_delivery_days')]
+
+    def migrate(self, targets):
+        executor = MigrationExecutor(connection)
+        executor.loader.build_graph()
+        executor.migrate(targets)
+        return executor.loader.project_state(targets).apps
+
+    def tearDown(self):
+        self.migrate(MigrationExecutor(connection).loader.graph.leaf_nodes('MrMilk'))
+
+    def test_flags_become_a_bitmask_and_back(self):
+        apps = self.migrate(self.before)
+        Profile = apps.get_model('MrMilk', 'Profile')
+        Product = apps.get_model('MrMilk', 'Product')
+        Subscription = apps.get_model('MrMilk', 'Subscription')
+        customer = Profile.objects.create(phone='9000000001', name='customer', email='customer@example.com',
+                                          address='Koramangala, Bengaluru')
+        milk = Product.objects.create(product_name='milk', price=Decimal('25'), quantity=10,
+                                      category=apps.get_model('MrMilk', 'Category').objects.create(
+                                          category_name='Milk'),
+                                      sub_category=apps.get_model('MrMilk', 'SubCategory').objects.create(
+                                          sub_category_name='Toned'),
+                                      brand=apps.get_model('MrMilk', 'Brand').objects.create(brand_name='brand'))
+        flags = {weekday: '0' for weekday in WEEKDAYS}
+        Subscription.objects.create(id=1, subscriber=customer, product=milk, no_of_days_left=5,
+                                    **dict(flags, tuesday='1', saturday='1', sunday='1'))
+        Subscription.objects.create(id=2, subscriber=customer, product=milk, no_of_days_left=5, **flags)
+        Subscription.objects.create(id=3, subscriber=customer, product=milk, no_of_days_left=5,
+                                    **{weekday: '1' for weekday in WEEKDAYS})
+
+        Subscription = self.migrate(self.after).get_model('MrMilk', 'Subscription')
+        self.assertEqual(list(Subscription.objects.order_by('pk').values_list('delivery_days', flat=True)),
+                         [2 + 32 + 64, 0, 127])
+
+        Subscription = self.migrate(self.before).get_model('MrMilk', 'Subscription')
+        subscription = Subscription.objects.get(pk=1)
+        self.assertEqual([weekday for weekday in WEEKDAYS if getattr(subscription, weekday) == '1'],
+                         ['tuesday', 'saturday', 'sunday'])
+
+
+class DailySalesTests(TestCase):
+
+    def rollup(self):
+        return sorted(DailySales.objects.values_list('day', 'product_id', 'quantity', 'revenue', 'orders',
+                                                     'delivered_quantity'))
+
+    def assertRollupIsBackfilled(self):
+        incremental = self.rollup()
+        backfill_daily_sales(*day_bounds(timezone.localdate(), timezone.localdate()))
+        self.assertEqual(incremental, self.rollup())
+
+    def test_incremental_rollup_matches_a_backfill(self):
+        milk, curd = make_product('milk', price='25'), make_product('curd', price='40.50')
+        customer = make_customer()
+        orders = []
+        for lines in (((milk, 3), (curd, 1)), ((milk, 2),), ((curd, 4),)):
+            serializer = OrderPlacementSerializer(data=order_payload(customer, *lines))
+            serializer.is_valid(raise_exception=True)
+            orders.append(serializer.save()['order'])
+        self.assertEqual(self.rollup(), [(timezone.localdate(), milk.pk, 5, Decimal('125.00'), 2, 0),
+                                         (timezone.localdate(), curd.pk, 5, Decimal('202.50'), 2, 0)])
+        self.assertRollupIsBackfilled()
+
+        def deliver():
+            orders[0].order_status = 'DL'
+            orders[0].save()
+
+        def edit_line():
+            line = OrderDetail.objects.get(order=orders[0], product=milk)
+            line.quantity = 7
+            line.save()
+
+        def move_line():
+            line = OrderDetail.objects.get(order=orders[1])
+            line.product = curd
+            line.save()
+
+        def delete_line():
+            OrderDetail.objects.get(order=orders[0], product=curd).delete()
+
+        def delete_order():
+            orders[2].delete()
+
+        for change in (deliver, edit_line, move_line, delete_line, delete_order):
+            with self.subTest(change.__name__):
+                change()
+                self.assertRollupIsBackfilled()
+        self.assertEqual(self.rollup(), [(timezone.localdate(), milk.pk, 7, Decimal('175.00'), 1, 7),
+                                         (timezone.localdate(), curd.pk, 2, Decimal('81.00'), 1, 0)])
+
+
+class LoginThrottleTests(TestCase):
+
+    def setUp(self):
+        cache.clear()
+        state_cache.clear()
+
+    def test_forwarded_for_does_not_reset_the_ip_limit(self):
+        statuses = [self.client.post('/mr_milk/login/', {'phone': '9{:09d}'.format(attempt), 'password': 'wrong'},
+                                     REMOTE_ADDR='10.0.0.7', HTTP_X_FORWARDED_FOR='203.0.113.{}'.format(attempt))
+                    .status_code for attempt in range(31)]
+        self.assertNotIn(429, statuses[:30])
+        self.assertEqual(statuses[30], 429)
+        # another client still gets in
+        self.assertEqual(self.client.post('/mr_milk/login/', {'phone': '9111111111', 'password': 'wrong'},
+                                          REMOTE_ADDR='10.0.0.8').status_code, 400)
+
+    def test_token_login_is_throttled_per_phone(self):
+        statuses = [self.client.post('/auth/', {'username': '9000000001', 'password': 'wrong'}).status_code
+                    for _ in range(6)]
+        self.assertEqual(statuses, [400] * 5 + [429])
+
+    def test_profile_creation_is_throttled(self):
+        payload = {'phone': '9000000001', 'name': 'customer', 'email': 'customer@example.com',
+                   'password': 'dairy-password'}
+        statuses = [self.client.post('/mr_milk/users/', payload).status_code for _ in range(4)]
+        self.assertEqual(statuses[3], 429)
+        self.assertNotIn(429, statuses[:3])
+        # only creating a profile is throttled
+        self.assertNotEqual(self.client.get('/mr_milk/users/').status_code, 429)
+
+
+class OrderHistoryTests(TransactionTestCase):
+    """a TransactionTestCase, the catalog version moves on commit"""
+
+    def setUp(self):
+        cache.clear()
+        state_cache.clear()
+        self.customer = make_customer()
+        self.milk = make_product('milk')
+        self.order = Order.objects.create(customer_id=self.customer, order_address=self.customer.address,
+                                          total=Decimal('25'))
+        self.line = OrderDetail.objects.create(order=self.order, product=self.milk, quantity=1)
+        self.url = '/mr_milk/order/{}/history/'.format(self.customer.pk)
+
+    def test_history_is_tagged_and_revalidated(self):
+        client = api_client(self.customer)
+        response = client.get(self.url)
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(client.get(self.url, HTTP_IF_NONE_MATCH=response['ETag']).status_code, 304)
+
+    def test_another_user_with_the_etag_is_forbidden(self):
+        etag = api_client(self.customer).get(self.url)['ETag']
+        other = api_client(make_customer('9000000002'))
+        self.assertEqual(other.get(self.url, HTTP_IF_NONE_MATCH=etag).status_code, 403)
+        self.assertEqual(other.get(self.url).status_code, 403)
+
+    def test_etag_changes_with_the_lines(self):
+        client = api_client(self.customer)
+        etag = client.get(self.url)['ETag']
+        self.line.quantity = 3
+        self.line.save()
+        response = client.get(self.url, HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.data['results'][0]['order_detail'][0]['quantity'], 3)
+
+        # lines written without signals
+        etag = response['ETag']
+        OrderDetail.objects.filter(pk=self.line.pk).update(quantity=4)
+        self.assertEqual(client.get(self.url, HTTP_IF_NONE_MATCH=etag).status_code, 200)
+
+    def test_etag_changes_with_product_names(self):
+        client = api_client(self.customer)
+        etag = client.get(self.url)['ETag']
+        self.milk.product_name = 'toned milk'
+        self.milk.save()
+        self.assertEqual(client.get(self.url, HTTP_IF_NONE_MATCH=etag).status_code, 200)
+
+
+class BrandQueryCountTests(TestCase):
+    """brands are listed with their products in a fixed number of queries, however many brands there are"""
+
+    def setUp(self):
+        cache.clear()
+        state_cache.clear()
+
+    def assert_queries(self, url, count):
+        for brands in (1, 10):
+            Brand.objects.all().delete()
+            Product.objects.all().delete()
+            make_brands(brands)
+            # a new catalog version and no cached response
+            cache.clear()
+            state_cache.clear()
+            with self.assertNumQueries(count):
+                response = self.client.get(url)
+            self.assertEqual(response.status_code, 200)
+
+    def test_brand_list(self):
+        # the page of brands and the products of all of them
+        self.assert_queries('/mr_milk/brands/', 2)
+
+    def test_brand_snapshot(self):
+        # every brand and every product
+        self.assert_queries('/mr_milk/brands/snapshot/', 2)
+
+
+class QueryBudgetTests(TestCase):
+    """query budgets of the hot endpoints, each checked at two sizes so a query per row goes over"""
+
+    def setUp(self):
+        cache.clear()
+        state_cache.clear()
+        self.customer = make_customer()
+
+    def test_catalog(self):
+        for products in (1, 10):
+            make_brands(products, products=1)
+            cache.clear()
+            state_cache.clear()
+            # the page of products, the catalog version is in the state cache
+            with query_budget(1):
+                self.assertEqual(self.client.get('/mr_milk/products/').status_code, 200)
+
+    def test_order_history(self):
+        client = api_client(self.customer)
+        products = [make_product('milk'), make_product('curd')]
+        url = '/mr_milk/order/{}/history/'.format(self.customer.pk)
+        for orders in (1, 10):
+            for _ in range(orders):
+                order = Order.objects.create(customer_id=self.customer, total=Decimal('50'))
+                OrderDetail.objects.bulk_create([OrderDetail(order=order, product=product, quantity=1)
+                                                 for product in products])
+            # the token when it is not cached yet, the ETag, the page of orders and their lines with products
+            with query_budget(4):
+                self.assertEqual(client.get(url).status_code, 200)
+
+    def test_order_placement(self):
+        client = api_client(make_customer('9000000099', is_staff=True))
+        for lines in (1, 5):
+            products = [make_product('product {} {}'.format(lines, line)) for line in range(lines)]
+            # one conditional UPDATE per line reserves its stock, the rest does not grow with the lines
+            with query_budget(8 + lines):
+                response = client.post('/mr_milk/order-detail/', order_payload(
+                    self.customer, *[(product, 1) for product in products]), format='json')
+            self.assertEqual(response.status_code, 201)
+
+    def test_exceeded_budget_fails_with_the_repeated_queries(self):
+        make_brands(3, products=1)
+        with self.assertRaises(AssertionError) as raised:
+            with query_budget(2):
+                for product in Product.objects.all():
+                    str(product.brand)
+        message = str(raised.exception)
+        self.assertTrue(message.startswith('4 queries, the budget is 2'), message)
+        self.assertIn('3 x SELECT', message)
+
+    def test_budget_within_limit(self):
+        make_brands(3, products=1)
+        with query_budget(1) as recorder:
+            list(Product.objects.select_related('brand'))
+        self.assertEqual(recorder.count, 1)
+
+
+class TokenRevocationTests(TransactionTestCase):
+    """a token cached by one worker is refused once another worker revokes it"""
+
+    def setUp(self):
+        cache.clear()
+        state_cache.clear()
+        token_cache.clear()
+        self.customer = make_customer()
+        self.client = api_client(self.customer)
+        self.url = '/mr_milk/order/{}/history/'.format(self.customer.pk)
+        self.assertEqual(self.client.get(self.url).status_code, 200)
+
+    def test_revoked_generation_authenticates_again(self):
+        # another worker deactivated the user, only the shared generation tells this one
+        Profile.objects.filter(pk=self.customer.pk).update(is_active=False)
+        self.assertEqual(self.client.get(self.url).status_code, 200)
+        revoke_cached_tokens()
+        self.assertEqual(self.client.get(self.url).status_code, 401)
+
+    def test_deleting_a_token_and_saving_a_profile_revoke(self):
+        generation = token_generation()
+        Token.objects.filter(user=self.customer).delete()
+        self.assertEqual(token_generation(), generation + 1)
+        self.assertEqual(self.client.get(self.url).status_code, 401)
+
+        self.customer.name = 'renamed'
+        self.customer.save()
+        self.assertEqual(token_generation(), generation + 2)
+        # a new profile revokes nothing
+        make_customer('9000000002')
+        self.assertEqual(token_generation(), generation + 2)
+
+
+class MetricsTests(SimpleTestCase):
+
+    def setUp(self):
+        directory = tempfile.TemporaryDirectory()
+        self.addCleanup(directory.cleanup)
+        metrics_dir = override_settings(METRICS_DIR=directory.name)
+        metrics_dir.enable()
+        self.addCleanup(metrics_dir.disable)
+        # the numbers of these requests go with the directory, not into the next flush to the real one
+        self.addCleanup(setattr, registry, 'pid', None)
+
+    def write_process(self, directory, pid, requests, in_flight=0):
+        with open(os.path.join(directory, '{}-1.json'.format(pid)), 'w') as output:
+            json.dump({'pid': pid, 'in_flight': in_flight,
+                       'samples': [['mrmilk_http_requests_total', [['view', 'brand-list']], requests]]}, output)
+        return '{}-1.json'.format(pid)
+
+    def test_dead_processes_are_merged_into_the_totals(self):
+        key = ('mrmilk_http_requests_total', (('view', 'brand-list'),))
+        dead_pid = 999999999
+        with tempfile.TemporaryDirectory() as directory:
+            self.write_process(directory, os.getpid(), 5, in_flight=1)
+            self.write_process(directory, dead_pid, 7)
+            samples = collect(directory)
+            self.assertEqual(samples[key], 12)
+            self.assertEqual(samples[('mrmilk_http_requests_in_flight', ())], 1)
+            self.assertEqual(sorted(os.listdir(directory)), sorted(['.lock', '{}-1.json'.format(os.getpid()),
+                                                                    TOTALS_FILE]))
+            self.assertEqual(collect(directory)[key], 12)
+
+            # a collect that stopped after writing the totals left the merged file behind
+            with open(os.path.join(directory, TOTALS_FILE)) as source:
+                totals = json.load(source)
+            self.assertEqual(totals['merged'], ['{}-1.json'.format(dead_pid)])
+            self.write_process(directory, dead_pid, 7)
+            self.assertEqual(collect(directory)[key], 12)
+            self.assertFalse(os.path.exists(os.path.join(directory, '{}-1.json'.format(dead_pid))))
+
+    def test_metrics_only_answer_allowed_addresses(self):
+        self.assertEqual(self.client.get('/metrics', REMOTE_ADDR='203.0.113.9').status_code, 403)
+        response = self.client.get('/metrics', REMOTE_ADDR='127.0.0.1')
+        self.assertEqual(response.status_code, 200)
+        self.assertIn(b'mrmilk_http_requests_total', response.content)
+
+    def test_unknown_methods_share_one_label(self):
+        for method in ('FOO', 'BAR', 'GET'):
+            self.client.generic(method, '/metrics')
+        content = self.client.get('/metrics').content.decode()
+        self.assertIn('method="other"', content)
+        self.assertNotIn('method="FOO"', content)
+        self.assertIn('method="GET"', content)
+
+
+class ProductSearchTests(TestCase):
+
+    def setUp(self):
+        cache.clear()
+        state_cache.clear()
+        for index in range(105):
+            make_product('toned milk {}'.format(index))
+        self.url = '/mr_milk/products/search/'
+
+    def test_following_next_visits_every_match_once(self):
+        url, names = '{}?q=milk&page_size=40'.format(self.url), []
+        while url:
+            response = self.client.get(url)
+            self.assertEqual(response.status_code, 200)
+            names += [product['product_name'] for product in response.data['results']]
+            url = response.data['next']
+        self.assertEqual(len(names), 105)
+        self.assertEqual(len(set(names)), 105)
+
+    def test_page_size_is_capped(self):
+        response = self.client.get(self.url, {'q': 'milk', 'page_size': 1000})
+        self.assertEqual(len(response.data['results']), 100)
+        self.assertIsNotNone(response.data['next'])
+
+    def test_bad_page_size_and_offset(self):
+        for params in ({'page_size': -1}, {'page_size': 0}, {'page_size': 'ten'}, {'offset': -1},
+                       {'offset': 'x'}):
+            with self.subTest(params):
+                self.assertEqual(self.client.get(self.url, dict(q='milk', **params)).status_code, 400)
+
+
+class OrderExportTests(TestCase):
+
+    def setUp(self):
+        customer = make_customer()
+        self.milk, self.curd = make_product('milk, toned', price='25.50'), make_product('curd "fresh"')
+        self.today = Order.objects.create(customer_id=customer, order_address='12 3rd Main,\nKoramangala',
+                                          total=Decimal('101.00'))
+        OrderDetail.objects.bulk_create([OrderDetail(order=self.today, product=self.milk, quantity=2),
+                                         OrderDetail(order=self.today, product=self.curd, quantity=2)])
+        old = Order.objects.create(customer_id=customer, total=Decimal('25.50'),
+                                   order_date=timezone.now() - datetime.timedelta(5))
+        OrderDetail.objects.create(order=old, product=self.milk, quantity=1)
+
+    def export(self, export_format, **options):
+        with tempfile.TemporaryDirectory() as directory:
+            path = os.path.join(directory, 'orders')
+            call_command('export_orders', format=export_format, output=path, **options)
+            with open(path, newline='', encoding='utf-8') as source:
+                if export_format == 'csv':
+                    return list(csv.DictReader(source))
+                return [json.loads(line) for line in source]
+
+    def test_csv_and_ndjson_round_trip(self):
+        names = [name for name, _ in EXPORT_COLUMNS]
+        for export_format in ('csv', 'ndjson'):
+            with self.subTest(export_format):
+                rows = self.export(export_format, days=1)
+                self.assertEqual([list(row) for row in rows], [names, names])
+                self.assertEqual([(str(row['order_id']), row['product_name'], str(row['quantity']),
+                                   str(row['product_price']), row['order_address']) for row in rows],
+                                 [(str(self.today.pk), product.product_name, '2', '25.50000' if product == self.milk
+                                   else '25.00000', '12 3rd Main,\nKoramangala') for product in (self.milk, self.curd)])
+
+    def test_days_reach_back(self):
+        self.assertEqual(len(self.export('ndjson', days=1)), 2)
+        self.assertEqual(len(self.export('ndjson', days=6)), 3)
+
+
+class AsyncCatalogTests(TransactionTestCase):
+    """the async views run their queries in other threads, the rows have to be committed"""
+
+    def setUp(self):
+        cache.clear()
+        state_cache.clear()
+        make_brands(3, products=2)
+
+    async def test_same_data_as_the_drf_views(self):
+        client = AsyncClient()
+        for name in ('products', 'categories', 'brands'):
+            with self.subTest(name):
+                expected = await sync_to_async(self.client.get)('/mr_milk/{}/'.format(name))
+                response = await client.get('/mr_milk/async/{}/'.format(name))
+                self.assertEqual(response.status_code, 200)
+                data = json.loads(response.content)
+                self.assertEqual(sorted(data), sorted(expected.data))
+                self.assertEqual(data['results'], json.loads(json.dumps(expected.data['results'])))
+
+    async def test_etag_and_cache_are_shared(self):
+        client = AsyncClient()
+        response = await client.get('/mr_milk/async/products/')
+        self.assertEqual((await sync_to_async(catalog_cache_stats)())['misses'], 1)
+        await client.get('/mr_milk/async/products/')
+        self.assertEqual((await sync_to_async(catalog_cache_stats)())['hits'], 1)
+        # Django 3.1's AsyncClient sends its extra arguments as raw header names
+        revalidated = await client.get('/mr_milk/async/products/', **{'If-None-Match': response['ETag']})
+        self.assertEqual(revalidated.status_code, 304)
+
+        await sync_to_async(make_product)('new milk')
+        changed = await client.get('/mr_milk/async/products/', **{'If-None-Match': response['ETag']})
+        self.assertEqual(changed.status_code, 200)
+        self.assertNotEqual(changed['ETag'], response['ETag'])
+
+
+class MediaRangeTests(SimpleTestCase):
+
+    def setUp(self):
+        directory = tempfile.TemporaryDirectory()
+        self.addCleanup(directory.cleanup)
+        media_root = override_settings(MEDIA_ROOT=directory.name, MEDIA_SENDFILE=None)
+        media_root.enable()
+        self.addCleanup(media_root.disable)
+        with open(os.path.join(directory.name, 'milk.txt'), 'wb') as output:
+            output.write(b'0123456789')
+        open(os.path.join(directory.name, 'empty.txt'), 'wb').close()
+
+    def get(self, path='milk.txt', **headers):
+        response = self.client.get('/media/' + path, **headers)
+        body = b''.join(response.streaming_content) if response.streaming else response.content
+        return response, body
+
+    def test_parse_range(self):
+        self.assertEqual(parse_range('bytes=2-4', 10), (2, 4))
+        self.assertEqual(parse_range('bytes=7-', 10), (7, 9))
+        self.assertEqual(parse_range('bytes=5-100', 10), (5, 9))
+        self.assertEqual(parse_range('bytes=-3', 10), (7, 9))
+        self.assertEqual(parse_range('bytes=-30', 10), (0, 9))
+        # several ranges and other units are answered with the whole file
+        self.assertIsNone(parse_range('bytes=0-1,3-4', 10))
+        self.assertIsNone(parse_range('items=0-1', 10))
+        self.assertIsNone(parse_range('bytes=-', 10))
+        for header in ('bytes=-0', 'bytes=10-', 'bytes=4-2'):
+            with self.subTest(header):
+                with self.assertRaises(ValueError):
+                    parse_range(header, 10)
+
+    def test_ranges(self):
+        response, body = self.get(HTTP_RANGE='bytes=2-4')
+        self.assertEqual((response.status_code, body, response['Content-Range'], response['Content-Length']),
+                         (206, b'234', 'bytes 2-4/10', '3'))
+        response, body = self.get(HTTP_RANGE='bytes=-3')
+        self.assertEqual((response.status_code, body, response['Content-Range']), (206, b'789', 'bytes 7-9/10'))
+        response, body = self.get()
+        self.assertEqual((response.status_code, body, response['Accept-Ranges']), (200, b'0123456789', 'bytes'))
+
+    def test_unsatisfiable_ranges(self):
+        for header in ('bytes=-0', 'bytes=10-', 'bytes=20-30'):
+            with self.subTest(header):
+                response, _ = self.get(HTTP_RANGE=header)
+                self.assertEqual((response.status_code, response['Content-Range']), (416, 'bytes */10'))
+
+    def test_if_range(self):
+        last_modified = self.get()[0]['Last-Modified']
+        response, body = self.get(HTTP_RANGE='bytes=2-4', HTTP_IF_RANGE=last_modified)
+        self.assertEqual((response.status_code, body), (206, b'234'))
+        # the file changed since the client got its part, it gets all of it
+        for if_range in ('Thu, 01 Jan 1970 00:00:00 GMT', '"some-etag"'):
+            with self.subTest(if_range):
+                response, body = self.get(HTTP_RANGE='bytes=2-4', HTTP_IF_RANGE=if_range)
+                self.assertEqual((response.status_code, body), (200, b'0123456789'))
+
+    def test_empty_file(self):
+        response, body = self.get('empty.txt')
+        self.assertEqual((response.status_code, body), (200, b''))
+        for header in ('bytes=0-', 'bytes=-5'):
+            with self.subTest(header):
+                response, _ = self.get('empty.txt', HTTP_RANGE=header)
+                self.assertEqual((response.status_code, response['Content-Range']), (416, 'bytes */0'))
+
+
+class DeliveryAreaTests(SimpleTestCase):
+
+    def test_pincode(self):
+        for address, area in (('12 3rd Main, Koramangala, Bengaluru 560034', '560034'),
+                              ('12 3rd Main, Koramangala, Bengaluru - 560 034', '560034'),
+                              # a house number that looks like a pincode comes before the real one
+                              ('400001 Tower B, Powai, Mumbai 400076', '400076'),
+                              ('Flat 5, Andheri, Mumbai 400053, India', '400053')):
+            with self.subTest(address):
+                self.assertEqual(delivery_area(address), area)
+
+    def test_not_a_pincode(self):
+        # 7 digits, a leading zero and phone numbers are no pincodes
+        self.assertEqual(delivery_area('Plot 1234567, Whitefield, Bengaluru'), 'whitefield')
+        self.assertEqual(delivery_area('12 MG Road, Indiranagar, Bengaluru 012345'), 'indiranagar')
+        self.assertEqual(delivery_area('call 9876543210, HSR Layout, Bengaluru'), 'hsr layout')
+
+    def test_locality(self):
+        self.assertEqual(delivery_area('12 3rd Main,  Koramangala 4th  Block , Bengaluru'), 'koramangala 4th block')
+        self.assertEqual(delivery_area('Jayanagar, Bengaluru'), 'bengaluru')
+        self.assertEqual(delivery_area('Jayanagar'), 'jayanagar')
+        # punctuation goes, the words stay
+        self.assertEqual(delivery_area('#42, St. Mark\'s Road., Bengaluru'), 'st mark s road')
+        self.assertEqual(delivery_area('1, ' + 'x' * 100 + ', Bengaluru'), 'x' * 60)
+
+    def test_empty(self):
+        for address in (None, '', ' , ,'):
+            with self.subTest(address):
+                self.assertEqual(delivery_area(address), '')
+
+
+class DeliveryManifestTests(TestCase):
+
+    def setUp(self):
+        self.client = api_client(make_customer('9000000099', is_staff=True))
+        self.products = [make_product('milk'), make_product('curd')]
+        self.tomorrow = timezone.localdate() + datetime.timedelta(1)
+
+    def place(self, orders):
+        for index in range(orders):
+            customer = make_customer('91{:08d}'.format(Order.objects.count()))
+            order = Order.objects.create(customer_id=customer, total=Decimal('50'), delivery_date=self.tomorrow,
+                                         order_address='{} Main, Area {}, Bengaluru'.format(index, index % 3))
+            OrderDetail.objects.bulk_create([OrderDetail(order=order, product=product, quantity=index + 1)
+                                             for product in self.products])
+
+    def test_query_count_does_not_grow_with_orders(self):
+        self.client.get('/mr_milk/orders/manifest/')
+        for orders in (1, 12):
+            self.place(orders)
+            # orders per area, loads per area, the lines of the stops and the stops
+            with self.assertNumQueries(4):
+                response = self.client.get('/mr_milk/orders/manifest/')
+            self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.data['orders'], 13)
+        self.assertEqual([area['area'] for area in response.data['areas']], ['area 0', 'area 1', 'area 2'])
+        self.assertEqual(sum(len(area['stops']) for area in response.data['areas']), 13)
+        self.assertEqual(sum(load['quantity'] for load in response.data['load']), 2 * (1 + sum(range(1, 13))))
+
+
+class ReplicaRoutingTests(SimpleTestCase):
+
+    def setUp(self):
+        cache.clear()
+        state_cache.clear()
+        self.router = PrimaryReplicaRouter()
+        replica_clock.checked_at = None
+        # a fresh sync would send the reads of the tests after this one to the replica
+        self.addCleanup(self.forget_replica)
+
+    def forget_replica(self):
+        state_cache.clear()
+        replica_clock.synced_at = replica_clock.checked_at = None
+
+    def synced(self, at):
+        replica_synced(at)
+        # the clock reads the state cache at most once a second
+        replica_clock.checked_at = None
+
+    def read_in_request(self, model=Product):
+        token = routing.set(Routing(primary=False))
+        try:
+            return self.router.db_for_read(model)
+        finally:
+            routing.reset(token)
+
+    def test_reads_outside_a_request_use_the_primary(self):
+        self.synced(time.time())
+        self.assertEqual(self.router.db_for_read(Product), 'default')
+        self.assertEqual(self.read_in_request(), 'replica')
+        # only the catalog and order tables are read from the replica
+        self.assertEqual(self.read_in_request(Profile), 'default')
+
+    def test_stale_replica_is_not_read(self):
+        self.assertEqual(self.read_in_request(), 'default')
+        self.synced(time.time() - REPLICA_MAX_LAG - 1)
+        self.assertEqual(self.read_in_request(), 'default')
+        self.synced(time.time() - REPLICA_MAX_LAG + 2)
+        self.assertEqual(self.read_in_request(), 'replica')
+
+    def test_writers_read_their_writes(self):
+        reads = []
+
+        def view(request):
+            if request.method == 'POST':
+                self.router.db_for_write(Order)
+            reads.append(self.router.db_for_read(Product))
+            return HttpResponse()
+
+        middleware = ReplicaStickinessMiddleware(view)
+        factory = RequestFactory()
+        writer, other = {'HTTP_AUTHORIZATION': 'Token writer'}, {'HTTP_AUTHORIZATION': 'Token other'}
+        self.synced(time.time() - 1)
+        middleware(factory.get('/', **writer))
+        middleware(factory.post('/', **writer))
+        middleware(factory.get('/', **writer))
+        middleware(factory.get('/', **other))
+        self.assertEqual(reads, ['replica', 'default', 'default', 'replica'])
+        # a copy taken after the write has it
+        self.synced(time.time() + 1)
+        middleware(factory.get('/', **writer))
+        self.assertEqual(reads[-1], 'replica')
+
+
+class ReplicaDatabaseTests(TransactionTestCase):
+    databases = {'default', 'replica'}
+
+    def test_transaction_on_the_replica(self):
+        make_product()
+        with transaction.atomic(using='replica'):
+            self.assertEqual(Product.objects.using('replica').count(), 1)
+
+
+class BackupTests(SimpleTestCase):
+
+    def test_backup_copies_what_is_committed(self):
+        with tempfile.TemporaryDirectory() as directory:
+            source, target = os.path.join(directory, 'primary.sqlite3'), os.path.join(directory, 'replica.sqlite3')
+            primary = sqlite3.connect(source, isolation_level=None)
+            writer = sqlite3.connect(source, isolation_level=None)
+            try:
+                primary.execute('PRAGMA journal_mode = WAL')
+                primary.execute('CREATE TABLE milk (id INTEGER PRIMARY KEY)')
+                primary.execute('INSERT INTO milk VALUES (1), (2)')
+                writer.execute('BEGIN IMMEDIATE')
+                writer.execute('INSERT INTO milk VALUES (3)')
+                backup_file(source, target)
+                with closing(sqlite3.connect(target)) as replica:
+                    self.assertEqual(replica.execute('SELECT count(*) FROM milk').fetchone(), (2,))
+                writer.execute('COMMIT')
+                backup_file(source, target)
+                with closing(sqlite3.connect(target)) as replica:
+                    self.assertEqual(replica.execute('SELECT count(*) FROM milk').fetchone(), (3,))
+            finally:
+                primary.close()
+                writer.close()
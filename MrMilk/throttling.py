@@ -0,0 +1,63 @@
+"""
+Sliding-window throttles for login (login/ and DRF's token login at /auth/) and sign up (create/ and
+POST users/). All of them run a full PBKDF2 hash, the throttles run in APIView.initial() before the view so an over-limit
+request is rejected before any hashing. Attempts are counted per client IP and per phone number in the
+default cache, which is shared by all workers, and every rejection is counted in the state cache for monitoring.
+The client IP is REMOTE_ADDR: X-Forwarded-For is only read with REST_FRAMEWORK['NUM_PROXIES'] set, otherwise
+a client would get a fresh limit with every made up header.
+"""
+
+from rest_framework.throttling import SimpleRateThrottle
+
+from .cache import incr_counter, state_cache
+
+THROTTLE_SCOPES = ('login_ip', 'login_phone', 'signup_ip', 'signup_phone')
+REJECTED_KEY = 'mr_milk:throttle:rejected:{}'
+
+
+def throttle_stats():
+    return {'rejected': {scope: state_cache.get(REJECTED_KEY.format(scope), 0) for scope in THROTTLE_SCOPES}}
+
+
+class CountedRateThrottle(SimpleRateThrottle):
+
+    def allow_request(self, request, view):
+        allowed = super().allow_request(request, view)
+        if not allowed:
+            incr_counter(REJECTED_KEY.format(self.scope))
+        return allowed
+
+
+class IPRateThrottle(CountedRateThrottle):
+
+    def get_cache_key(self, request, view):
+        return self.cache_format % {'scope': self.scope, 'ident': self.get_ident(request)}
+
+
+class PhoneRateThrottle(CountedRateThrottle):
+
+    def get_cache_key(self, request, view):
+        if not hasattr(request.data, 'get'):
+            return None
+        # DRF's token login at /auth/ posts the phone as username
+        phone = request.data.get('phone') or request.data.get('username')
+        if not phone:
+            return None
+        # 09876543210 and 9876543210 are the same account
+        return self.cache_format % {'scope': self.scope, 'ident': str(phone).strip().lstrip('0')}
+
+
+class LoginIPThrottle(IPRateThrottle):
+    scope = 'login_ip'
+
+
+class LoginPhoneThrottle(PhoneRateThrottle):
+    scope = 'login_phone'
+
+
+class SignupIPThrottle(IPRateThrottle):
+    scope = 'signup_ip'
+
+
+class SignupPhoneThrottle(PhoneRateThrottle):
+    scope = 'signup_phone'
@@ -1,7 +1,7 @@
 from django.urls import path
 from django.conf.urls import include
 
-from MrMilk import views
+from MrMilk import views, async_views
 from rest_framework import routers
 
 from MrMilk.views import ProductViewSet, BrandViewSet, OrderViewSet, OrderDetailViewSet, UserProfileViewSet, \
@@ -21,4 +21,12 @@ urlpatterns = [
     path('create/', views.UserProfileCreateView.as_view(), name='create_account'),
     path('login/', LoginAPIView.as_view(), name='login_view'),
     path('categories/', views.CategoryList.as_view(), name='category_list'),
+    path('catalog-cache/', views.CatalogCacheStatsView.as_view(), name='catalog_cache_stats'),
+    path('throttle-stats/', views.ThrottleStatsView.as_view(), name='throttle_stats'),
+    path('orders/export/', views.OrderExportView.as_view(), name='order_export'),
+    path('orders/manifest/', views.DeliveryManifestView.as_view(), name='delivery_manifest'),
+    path('analytics/sales/', views.SalesAnalyticsView.as_view(), name='sales_analytics'),
+    path('async/products/', async_views.product_list, name='async_product_list'),
+    path('async/categories/', async_views.category_list, name='async_category_list'),
+    path('async/brands/', async_views.brand_list, name='async_brand_list'),
 ]
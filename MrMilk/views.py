@@ -1,24 +1,47 @@
 from django.contrib.auth import authenticate
+from django.db.models import Prefetch
+from django.http import StreamingHttpResponse
 from django.shortcuts import get_object_or_404
 from rest_framework import viewsets, status, generics
-from rest_framework.authentication import TokenAuthentication
 from rest_framework.authtoken.models import Token
+from rest_framework.authtoken.views import ObtainAuthToken
 from rest_framework.decorators import action
+from rest_framework.negotiation import BaseContentNegotiation
 from rest_framework.permissions import IsAuthenticated, IsAdminUser, IsAuthenticatedOrReadOnly, AllowAny
 from rest_framework.response import Response
+from rest_framework.utils.urls import replace_query_param
 from rest_framework.views import APIView
 
+from .authentication import CachedTokenAuthentication
+from .cache import cached_catalog_response, catalog_cache_stats
+from .catalog import brand_catalog_snapshot, facet_counts, filter_products, price_buckets, FACETS
+from .conditional import conditional_response, catalog_etag, customer_orders_etag
+from .delivery import delivery_manifest, manifest_date, manifest_statuses
+from .exports import export_orders, export_range, EXPORT_FORMATS
+from .inventory import OutOfStock
 from .models import Product, Category, Brand, Order, Profile, OrderDetail
-from .permissions import UpdateOwnProfile
+from .pagination import CatalogCursorPagination, OrderHistoryCursorPagination
+from .permissions import UpdateOwnProfile, OwnOrdersOrStaff
+from .sales import sales_report, SALES_GROUPS, SALES_FILTERS
+from .search import search_products
 from .serializers import ProductSerializer, CategorySerializer, BrandSerializer, OrderSerializer, \
-    OrderDetailSerializer, ProfileSerializer, LoginSerializer
+    OrderDetailSerializer, ProfileSerializer, LoginSerializer, OrderPlacementSerializer, OrderHistorySerializer
+from .throttling import LoginIPThrottle, LoginPhoneThrottle, SignupIPThrottle, SignupPhoneThrottle, \
+    throttle_stats
 
 
 class UserProfileViewSet(viewsets.ModelViewSet):
     queryset = Profile.objects.all()
     serializer_class = ProfileSerializer
-    authentication_classes = (TokenAuthentication,)
+    authentication_classes = (CachedTokenAuthentication,)
     permission_classes = (UpdateOwnProfile, )
+    pagination_class = CatalogCursorPagination
+
+    def get_throttles(self):
+        # POST creates a profile and hashes its password like the sign up view
+        if self.action == 'create':
+            return [throttle() for throttle in (SignupIPThrottle, SignupPhoneThrottle)]
+        return super().get_throttles()
 
     # PATCH request is directed to this method for User Profile comes with detail=True
     def partial_update(self, request, *args, **kwargs):
@@ -39,6 +62,7 @@ class UserProfileViewSet(viewsets.ModelViewSet):
 # To Login a User with valid credentials and return Token along with successful message
 class LoginAPIView(APIView):
     permission_classes = (UpdateOwnProfile, AllowAny)
+    throttle_classes = (LoginIPThrottle, LoginPhoneThrottle)
 
     def post(self, request):
         serializer = LoginSerializer(data=request.data)
@@ -56,9 +80,15 @@ class LoginAPIView(APIView):
                     status=status.HTTP_400_BAD_REQUEST)
 
 
+# DRF's token login at /auth/, it posts the phone as username
+class ThrottledObtainAuthToken(ObtainAuthToken):
+    throttle_classes = (LoginIPThrottle, LoginPhoneThrottle)
+
+
 # To register a user
 class UserProfileCreateView(generics.CreateAPIView):
     permission_classes = (AllowAny,)
+    throttle_classes = (SignupIPThrottle, SignupPhoneThrottle)
     model = Profile
     serializer_class = ProfileSerializer
 
@@ -69,19 +99,78 @@ class ProductViewSet(viewsets.ModelViewSet):
     """
     queryset = Product.objects.all()
     serializer_class = ProductSerializer
-    authentication_classes = (TokenAuthentication,)
+    authentication_classes = (CachedTokenAuthentication,)
     permission_classes = (IsAuthenticatedOrReadOnly,)
+    pagination_class = CatalogCursorPagination
+
+    @conditional_response(catalog_etag)
+    @cached_catalog_response
+    def list(self, request, *args, **kwargs):
+        return super().list(request, *args, **kwargs)
+
+    @conditional_response(catalog_etag)
+    @cached_catalog_response
+    def retrieve(self, request, *args, **kwargs):
+        return super().retrieve(request, *args, **kwargs)
 
+    @conditional_response(catalog_etag)
+    @cached_catalog_response
     def get(self, request):
-        products = Product.objects.all()
+        products = self.paginate_queryset(Product.objects.all())
         serializer = self.serializer_class(products, many=True)
-        return Response(serializer.data)
+        return self.get_paginated_response(serializer.data)
 
     @action(methods=['get'], detail=False, url_path=r'list/(?P<category>[\w-]+)', url_name='category-list')
+    @conditional_response(catalog_etag)
+    @cached_catalog_response
     def product_category(self, request, category=None):
-        category_product = self.queryset.filter(category=category)
+        category_product = self.paginate_queryset(self.queryset.filter(category=category))
         serializer = self.serializer_class(category_product, many=True)
-        return Response(serializer.data)
+        return self.get_paginated_response(serializer.data)
+
+    @action(methods=['get'], detail=False, url_path='search', url_name='search')
+    @conditional_response(catalog_etag)
+    @cached_catalog_response
+    def search(self, request):
+        """ranked full-text search on product name, brand and categories, the last word matches as a prefix"""
+        query = request.query_params.get('q', '')
+        try:
+            limit = int(request.query_params.get('page_size', self.pagination_class.page_size))
+            offset = int(request.query_params.get('offset', 0))
+        except ValueError:
+            limit = offset = None
+        # LIMIT -1 is the whole table to SQLite, a page of 0 would link to itself as the next page
+        if limit is None or limit < 1 or offset < 0:
+            response = {'message': 'page_size has to be a number from 1 and offset a number from 0'}
+            return Response(response, status=status.HTTP_400_BAD_REQUEST)
+        limit = min(limit, self.pagination_class.max_page_size)
+        products = search_products(query, limit=limit, offset=offset)
+        next_url = None
+        if len(products) == limit:
+            next_url = replace_query_param(request.build_absolute_uri(), 'offset', offset + limit)
+        serializer = self.get_serializer(products, many=True)
+        return Response({'next': next_url, 'results': serializer.data}, status=status.HTTP_200_OK)
+
+    @action(methods=['get'], detail=False, url_path='filter', url_name='filter')
+    @conditional_response(catalog_etag)
+    @cached_catalog_response
+    def filter(self, request):
+        """
+        products filtered by category, sub_category, brand and price bucket together with the facet counts,
+        several values of one facet are separated by commas
+        """
+        filters = {facet: set(request.query_params[facet].split(','))
+                   for facet in FACETS if request.query_params.get(facet)}
+        unknown = filters.get('price', set()) - set(price_buckets())
+        if unknown:
+            response = {'message': 'unknown price buckets {}'.format(sorted(unknown)),
+                        'price_buckets': list(price_buckets())}
+            return Response(response, status=status.HTTP_400_BAD_REQUEST)
+        products = self.paginate_queryset(filter_products(self.get_queryset(), filters))
+        serializer = self.get_serializer(products, many=True)
+        response = self.get_paginated_response(serializer.data)
+        response.data['facets'] = facet_counts(filters)
+        return response
 
 
 class CategoryList(APIView):
@@ -89,18 +178,147 @@ class CategoryList(APIView):
     List all the categories
     """
     permission_classes = (IsAuthenticatedOrReadOnly,)
+    pagination_class = CatalogCursorPagination
 
+    @conditional_response(catalog_etag)
+    @cached_catalog_response
     def get(self, request):
-        categories = Category.objects.all()
+        paginator = self.pagination_class()
+        categories = paginator.paginate_queryset(Category.objects.all(), request, view=self)
         serializer = CategorySerializer(categories, many=True)
-        return Response(serializer.data)
+        return paginator.get_paginated_response(serializer.data)
+
+
+class CatalogCacheStatsView(APIView):
+    """
+    Hit/miss counters of the catalog response cache for monitoring
+    """
+    authentication_classes = (CachedTokenAuthentication,)
+    permission_classes = (IsAuthenticated, IsAdminUser)
+
+    def get(self, request):
+        return Response(catalog_cache_stats(), status=status.HTTP_200_OK)
+
+
+class StreamedContentNegotiation(BaseContentNegotiation):
+    """the view writes the body itself, a client asking for text/csv must not get a 406 from the renderers"""
+
+    def select_parser(self, request, parsers):
+        return parsers[0]
+
+    def select_renderer(self, request, renderers, format_suffix=None):
+        return renderers[0], renderers[0].media_type
+
+
+class OrderExportView(APIView):
+    """
+    Order lines with their order and product for a date range, streamed as NDJSON or CSV
+    ?start=YYYY-MM-DD&end=YYYY-MM-DD&type=ndjson|csv, the last 30 days as NDJSON by default
+    """
+    authentication_classes = (CachedTokenAuthentication,)
+    permission_classes = (IsAuthenticated, IsAdminUser)
+    content_negotiation_class = StreamedContentNegotiation
+
+    def get(self, request):
+        export_format = request.query_params.get('type', 'ndjson')
+        if export_format not in EXPORT_FORMATS:
+            response = {'message': 'type has to be one of {}'.format(', '.join(EXPORT_FORMATS))}
+            return Response(response, status=status.HTTP_400_BAD_REQUEST)
+        try:
+            start, end = export_range(request.query_params.get('start'), request.query_params.get('end'))
+        except ValueError as error:
+            response = {'message': 'start and end have to be YYYY-MM-DD dates', 'error': str(error)}
+            return Response(response, status=status.HTTP_400_BAD_REQUEST)
+        response = StreamingHttpResponse(export_orders(start, end, export_format),
+                                         content_type=EXPORT_FORMATS[export_format])
+        response['Content-Disposition'] = 'attachment; filename="orders-{}-{}.{}"'.format(start, end, export_format)
+        return response
+
+
+class DeliveryManifestView(APIView):
+    """
+    Orders to deliver on a date grouped by area, with the quantity of every product to load per area and in total
+    ?date=YYYY-MM-DD&status=PL,SH&area=560034&stops=0, tomorrow's placed and shipped orders in every area by default,
+    stops=0 leaves out the orders of each area and only gives the loads
+    """
+    authentication_classes = (CachedTokenAuthentication,)
+    permission_classes = (IsAuthenticated, IsAdminUser)
+
+    def get(self, request):
+        try:
+            delivery_date = manifest_date(request.query_params.get('date'))
+            statuses = manifest_statuses(request.query_params.get('status'))
+        except ValueError as error:
+            response = {'message': 'date has to be a YYYY-MM-DD date, status a list of order statuses',
+                        'error': str(error)}
+            return Response(response, status=status.HTTP_400_BAD_REQUEST)
+        manifest = delivery_manifest(delivery_date, statuses, request.query_params.get('area'),
+                                     stops=request.query_params.get('stops') != '0')
+        response = {'message': 'delivery manifest', **manifest}
+        return Response(response, status=status.HTTP_200_OK)
+
+
+class SalesAnalyticsView(APIView):
+    """
+    Quantity, revenue and orders for a date range from the daily sales rollup
+    ?start=YYYY-MM-DD&end=YYYY-MM-DD&group=day|product|brand|category, the last 30 days per day by default,
+    narrowed down with product, brand or category; other groups than day give the top limit (50) by revenue
+    """
+    authentication_classes = (CachedTokenAuthentication,)
+    permission_classes = (IsAuthenticated, IsAdminUser)
+
+    def get(self, request):
+        group = request.query_params.get('group', 'day')
+        if group not in SALES_GROUPS:
+            response = {'message': 'group has to be one of {}'.format(', '.join(SALES_GROUPS))}
+            return Response(response, status=status.HTTP_400_BAD_REQUEST)
+        try:
+            start, end = export_range(request.query_params.get('start'), request.query_params.get('end'))
+            limit = int(request.query_params.get('limit', 50))
+        except ValueError as error:
+            response = {'message': 'start and end have to be YYYY-MM-DD dates, limit a number', 'error': str(error)}
+            return Response(response, status=status.HTTP_400_BAD_REQUEST)
+        filters = {name: request.query_params[name] for name in SALES_FILTERS if name in request.query_params}
+        report = sales_report(start, end, group, filters, max(1, min(limit, 1000)))
+        response = {'message': 'sales', 'start': start, 'end': end, 'group': group, **report}
+        return Response(response, status=status.HTTP_200_OK)
+
+
+class ThrottleStatsView(APIView):
+    """
+    Rejected login and sign up attempts per throttle for monitoring
+    """
+    authentication_classes = (CachedTokenAuthentication,)
+    permission_classes = (IsAuthenticated, IsAdminUser)
+
+    def get(self, request):
+        return Response(throttle_stats(), status=status.HTTP_200_OK)
 
 
 class BrandViewSet(viewsets.ModelViewSet):
-    queryset = Brand.objects.all()
+    # products are fetched for the whole page in one extra query instead of one query per brand
+    queryset = Brand.objects.prefetch_related('products')
     serializer_class = BrandSerializer
-    authentication_classes = (TokenAuthentication,)
+    authentication_classes = (CachedTokenAuthentication,)
     permission_classes = (IsAuthenticatedOrReadOnly,)
+    pagination_class = CatalogCursorPagination
+
+    @conditional_response(catalog_etag)
+    @cached_catalog_response
+    def list(self, request, *args, **kwargs):
+        return super().list(request, *args, **kwargs)
+
+    @conditional_response(catalog_etag)
+    @cached_catalog_response
+    def retrieve(self, request, *args, **kwargs):
+        return super().retrieve(request, *args, **kwargs)
+
+    @action(methods=['get'], detail=False, url_path='snapshot', url_name='snapshot')
+    @conditional_response(catalog_etag)
+    @cached_catalog_response
+    def snapshot(self, request):
+        """the whole brand -> products catalog in a single response"""
+        return Response(brand_catalog_snapshot(), status=status.HTTP_200_OK)
 
     # def get(self):
     #     brand_list = self.get_queryset()
@@ -111,7 +329,7 @@ class BrandViewSet(viewsets.ModelViewSet):
 class OrderViewSet(viewsets.ModelViewSet):
     queryset = Order.objects.all()
     serializer_class = OrderSerializer
-    authentication_classes = (TokenAuthentication,)
+    authentication_classes = (CachedTokenAuthentication,)
     permission_classes = (IsAuthenticatedOrReadOnly,)
 
     def get(self, pk=None):
@@ -120,12 +338,26 @@ class OrderViewSet(viewsets.ModelViewSet):
         response = {'message': 'data is', 'data': serializer.data}
         return Response(response, status=status.HTTP_200_OK)
 
+    @conditional_response(customer_orders_etag)
     def retrieve(self, request, pk=None):
         order = Order.objects.filter(customer_id=pk)
         serializer = self.serializer_class(order, many=True)
         response = {'message': 'order list', 'data': serializer.data}
         return Response(response, status=status.HTTP_200_OK)
 
+    @action(methods=['get'], detail=True, url_path='history', url_name='history',
+            permission_classes=(IsAuthenticated, OwnOrdersOrStaff))
+    @conditional_response(customer_orders_etag)
+    def history(self, request, pk=None):
+        """orders of the customer pk with their lines and product names, newest first"""
+        # one query for the page of orders and one for all of their lines with the products
+        orders = Order.objects.filter(customer_id=pk).prefetch_related(
+            Prefetch('orders', queryset=OrderDetail.objects.select_related('product')))
+        paginator = OrderHistoryCursorPagination()
+        page = paginator.paginate_queryset(orders, request, view=self)
+        serializer = OrderHistorySerializer(page, many=True)
+        return paginator.get_paginated_response(serializer.data)
+
     def create(self, request, *args, **kwargs):
         try:
             # print("in the create of class of orderViewset")
@@ -146,63 +378,7 @@ class OrderViewSet(viewsets.ModelViewSet):
 class OrderDetailViewSet(viewsets.ModelViewSet):
     queryset = OrderDetail.objects.all()
     serializer_class = OrderDetailSerializer
-
-    # def list(self, request, *args, **kwargs):
-    #     response = {'message': 'you can not access full list'}
-    #     return Response(response, status=status.HTTP_400_BAD_REQUEST)
-
-    def retrieve(self, request, pk=None):
-        try:
-            order = Order.objects.get(order_id=pk)
-            order_detail = OrderDetail.objects.filter(order_id=pk)
-            serializer = self.serializer_class(order_detail, many=True)
-            # product_list = Product.objects.filter(serializer.data['product'])
-            response = {'message': 'order_id wise order_detail', 'data': serializer.data}
-            return Response(response, status=status.HTTP_200_OK)
-        except:
-            response = {'message': 'order_id does not exist in order_detail'}
-            return Response(response, status=status.HTTP_400_BAD_REQUEST)
-
-    def create(self, request, *args, **kwargs):
-        # print(request.data, len(request.data), type(request.data))
-        serializer_order = OrderSerializer(data=request.data['order'])
-        if serializer_order.is_valid():
-            serializer_order.save()
-            print(serializer_order.data)
-            order_detail = request.data['order_detail']
-            try:
-                for data_item in order_detail:
-                    d = dict(data_item)
-                    d['order'] = serializer_order.data['order_id']
-                    print(d['order'])
-                    print(d['product'])
-                    print(d['quantity'])
-                    serializer_order_detail = self.get_serializer(data=d)
-                    if serializer_order_detail.is_valid():
-                        serializer_order_detail.save()
-                    else:
-                        print("not a valid serializer for order detail")
-                        response = {'message': 'order already contains this product cannot change the it'}
-                        return Response(response, status=status.HTTP_400_BAD_REQUEST)
-                data = OrderDetail.objects.filter(order_id=serializer_order.data['order_id'])
-                serializer = self.serializer_class(data, many=True)
-                response = {"message": "order detail inserted for", "order_data": serializer.data,
-                            "order": serializer_order.data}
-                return Response(response, status=status.HTTP_201_CREATED)
-            except:
-                response = {'message': 'order already contains this product cannot change the it'}
-                return Response(response, status=status.HTTP_400_BAD_REQUEST)
-
-        else:
-            print("not a valid serializer for order")
-            response = {'message': 'order already contains this product cannot change the it'}
-            return Response(response, status=status.HTTP_400_BAD_REQUEST)
-
-
-class OrderDetailViewSet(viewsets.ModelViewSet):
-    queryset = OrderDetail.objects.all()
-    serializer_class = OrderDetailSerializer
-    authentication_classes = (TokenAuthentication,)
+    authentication_classes = (CachedTokenAuthentication,)
     permission_classes = (IsAuthenticated, IsAdminUser)
 
     def list(self, request, *args, **kwargs):
@@ -222,36 +398,17 @@ class OrderDetailViewSet(viewsets.ModelViewSet):
             return Response(response, status=status.HTTP_400_BAD_REQUEST)
 
     def create(self, request, *args, **kwargs):
-        # print(request.data, len(request.data), type(request.data))
-        serializer_order = OrderSerializer(data=request.data['order'])
-        if serializer_order.is_valid():
-            serializer_order.save()
-            print(serializer_order.data)
-            order_detail = request.data['order_detail']
-            try:
-                for data_item in order_detail:
-                    d = dict(data_item)
-                    d['order'] = serializer_order.data['order_id']
-                    print(d['order'])
-                    print(d['product'])
-                    print(d['quantity'])
-                    serializer_order_detail = self.get_serializer(data=d)
-                    if serializer_order_detail.is_valid():
-                        serializer_order_detail.save()
-                    else:
-                        print("not a valid serializer for order detail")
-                        response = {'message': 'order already contains this product cannot change the it'}
-                        return Response(response, status=status.HTTP_400_BAD_REQUEST)
-                data = OrderDetail.objects.filter(order_id=serializer_order.data['order_id'])
-                serializer = self.serializer_class(data, many=True)
-                response = {"message": "order detail inserted for", "order_data": serializer.data,
-                            "order": serializer_order.data}
-                return Response(response, status=status.HTTP_201_CREATED)
-            except:
-                response = {'message': 'order already contains this product cannot change the it'}
-                return Response(response, status=status.HTTP_400_BAD_REQUEST)
-
-        else:
-            print("not a valid serializer for order")
-            response = {'message': 'order already contains this product cannot change the it'}
+        serializer = OrderPlacementSerializer(data=request.data)
+        if not serializer.is_valid():
+            response = {'message': 'order could not be placed', 'errors': serializer.errors}
+            return Response(response, status=status.HTTP_400_BAD_REQUEST)
+        try:
+            placed = serializer.save()
+        except OutOfStock as error:
+            response = {'message': 'product out of stock', 'product': error.product_id}
             return Response(response, status=status.HTTP_400_BAD_REQUEST)
+        # lines are serialized from the objects that were just inserted, no need to read them back
+        response = {"message": "order detail inserted for",
+                    "order_data": self.serializer_class(placed['order_detail'], many=True).data,
+                    "order": OrderSerializer(placed['order']).data}
+        return Response(response, status=status.HTTP_201_CREATED)